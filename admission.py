@@ -0,0 +1,150 @@
+"""
+Memory-budget admission control for inference work
+
+Each request carries an estimate of its peak memory (see
+BackgroundRemover.estimate_peak_memory). Work is only dispatched while the
+sum of estimates for running jobs stays under a budget, which by default is
+derived from the container's cgroup memory limit.
+"""
+
+import os
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Explicit budget in MB; unset derives it from the cgroup/system memory limit
+MEMORY_BUDGET_MB = os.getenv("MEMORY_BUDGET_MB")
+# Share of (limit - baseline RSS) that inference may use when deriving the budget
+MEMORY_BUDGET_FRACTION = float(os.getenv("MEMORY_BUDGET_FRACTION", "0.8"))
+# Queued requests whose estimated wait exceeds this are rejected with 503
+ADMISSION_MAX_WAIT_SECONDS = float(os.getenv("ADMISSION_MAX_WAIT_SECONDS", "120"))
+
+_CGROUP_LIMIT_FILES = (
+    "/sys/fs/cgroup/memory.max",                      # cgroup v2
+    "/sys/fs/cgroup/memory/memory.limit_in_bytes"     # cgroup v1
+)
+# cgroup v1 reports "unlimited" as a huge page-aligned number
+_UNLIMITED_THRESHOLD = 1 << 60
+
+
+def detect_memory_limit() -> Optional[int]:
+    """Container memory limit in bytes, falling back to total system memory"""
+    for path in _CGROUP_LIMIT_FILES:
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+        if value == "max":
+            break
+        try:
+            limit = int(value)
+        except ValueError:
+            continue
+        if 0 < limit < _UNLIMITED_THRESHOLD:
+            return limit
+        break
+
+    try:
+        import psutil
+        return psutil.virtual_memory().total
+    except Exception:
+        return None
+
+
+def _current_rss() -> int:
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except Exception:
+        return 0
+
+
+def default_budget_bytes() -> Optional[int]:
+    """Budget from MEMORY_BUDGET_MB, or derived from the memory limit"""
+    if MEMORY_BUDGET_MB:
+        budget_mb = float(MEMORY_BUDGET_MB)
+        return int(budget_mb * 1024 * 1024) if budget_mb > 0 else None
+
+    limit = detect_memory_limit()
+    if limit is None:
+        return None
+    # Keep the interpreter, torch and the web server's own footprint out of the budget
+    available = max(limit - _current_rss(), 0)
+    return max(int(available * MEMORY_BUDGET_FRACTION), 256 * 1024 * 1024)
+
+
+class MemoryBudget:
+    """
+    Tracks reserved bytes against a fixed budget. Schedulers reserve before
+    dispatching a job and release when it finishes; listeners are notified on
+    release so blocked schedulers can retry. Memory held for the life of the
+    process (model weights) is taken off the budget once with set_resident.
+    """
+
+    def __init__(self, total_bytes: int):
+        self.limit = total_bytes
+        self.resident = 0
+        self.total = total_bytes
+        self.reserved = 0
+        self.peak_reserved = 0
+        self.admitted = 0
+        self._lock = threading.Lock()
+        self._listeners: List[Callable[[], None]] = []
+
+    def set_resident(self, nbytes: int):
+        """Set the long-lived memory (shared model weights) counted against the budget"""
+        with self._lock:
+            self.resident = nbytes
+            self.total = max(self.limit - nbytes, 0)
+        logger.info(f"Memory admission budget: {self.total / 1024 / 1024:.0f} MB for requests, "
+                    f"{nbytes / 1024 / 1024:.0f} MB resident")
+
+    def fits(self, nbytes: int) -> bool:
+        """Whether a request of this size could ever be admitted"""
+        return nbytes <= self.total
+
+    def try_acquire(self, nbytes: int) -> bool:
+        with self._lock:
+            # An oversized job is allowed to run alone rather than never
+            if self.reserved + nbytes > self.total and self.reserved > 0:
+                return False
+            self.reserved += nbytes
+            self.peak_reserved = max(self.peak_reserved, self.reserved)
+            self.admitted += 1
+            return True
+
+    def release(self, nbytes: int):
+        with self._lock:
+            self.reserved = max(self.reserved - nbytes, 0)
+            listeners = list(self._listeners)
+        for listener in listeners:
+            listener()
+
+    def add_listener(self, listener: Callable[[], None]):
+        with self._lock:
+            self._listeners.append(listener)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "budget_mb": round(self.total / 1024 / 1024, 1),
+                "resident_mb": round(self.resident / 1024 / 1024, 1),
+                "reserved_mb": round(self.reserved / 1024 / 1024, 1),
+                "peak_reserved_mb": round(self.peak_reserved / 1024 / 1024, 1),
+                "admitted": self.admitted
+            }
+
+
+def create_memory_budget() -> Optional[MemoryBudget]:
+    budget = default_budget_bytes()
+    if budget is None:
+        logger.warning("Memory admission control disabled - no memory limit detected or configured")
+        return None
+    logger.info(f"Memory admission budget: {budget / 1024 / 1024:.0f} MB")
+    return MemoryBudget(budget)
+
+
+memory_budget = create_memory_budget()
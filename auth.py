@@ -1,11 +1,106 @@
+import os
+import hmac
+import time
+import threading
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
 from database import get_db, APIKey
-from datetime import datetime
+from usage import usage_recorder
+from typing import NamedTuple, Optional, Tuple, Dict, Any
 
 security = HTTPBearer()
 
+# API key cache configuration
+API_KEY_CACHE_TTL = float(os.getenv("API_KEY_CACHE_TTL", "300"))
+API_KEY_NEGATIVE_CACHE_TTL = float(os.getenv("API_KEY_NEGATIVE_CACHE_TTL", "30"))
+API_KEY_CACHE_MAX_SIZE = int(os.getenv("API_KEY_CACHE_MAX_SIZE", "10000"))
+
+
+class CachedAPIKey(NamedTuple):
+    """Immutable snapshot of a validated API key row"""
+    id: int
+    key: str
+    name: str
+
+
+class APIKeyCache:
+    """
+    Thread-safe TTL cache of API key lookups.
+
+    Stores both positive entries (a CachedAPIKey) and negative entries (None)
+    so that repeated requests with the same key never hit the database until
+    the entry expires or is explicitly invalidated.
+    """
+
+    def __init__(self, ttl: float, negative_ttl: float, max_size: int):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_size = max_size
+        self._entries: Dict[str, Tuple[float, Optional[CachedAPIKey]]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, api_key: str) -> Tuple[bool, Optional[CachedAPIKey]]:
+        """Return (found, record); record is None for cached negative entries"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(api_key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._entries[api_key]
+                self.misses += 1
+                return False, None
+            self.hits += 1
+            return True, entry[1]
+
+    def set(self, api_key: str, record: Optional[CachedAPIKey]):
+        ttl = self.ttl if record is not None else self.negative_ttl
+        if ttl <= 0:
+            return
+        with self._lock:
+            if api_key not in self._entries and len(self._entries) >= self.max_size:
+                self._evict()
+            self._entries[api_key] = (time.monotonic() + ttl, record)
+
+    def invalidate(self, api_key: Optional[str] = None):
+        """Drop a single key, or every entry when no key is given"""
+        with self._lock:
+            if api_key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(api_key, None)
+
+    def _evict(self):
+        # Drop expired entries first, then the oldest insertion if still full
+        now = time.monotonic()
+        for key in [k for k, (expires, _) in self._entries.items() if expires <= now]:
+            del self._entries[key]
+        if len(self._entries) >= self.max_size:
+            del self._entries[next(iter(self._entries))]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "ttl_seconds": self.ttl,
+                "negative_ttl_seconds": self.negative_ttl
+            }
+
+
+api_key_cache = APIKeyCache(API_KEY_CACHE_TTL, API_KEY_NEGATIVE_CACHE_TTL, API_KEY_CACHE_MAX_SIZE)
+
+
+def is_active(value) -> bool:
+    """Interpret the string-typed is_active column ("true"/"false", or legacy 1/0)"""
+    if isinstance(value, str):
+        return value.strip().lower() not in ("false", "0", "")
+    return bool(value)
+
+
 def validate_api_key(
     credentials: HTTPAuthorizationCredentials = Depends(security),
     db: Session = Depends(get_db)
@@ -30,29 +125,66 @@ def validate_api_key(
             detail="API key is inactive"
         )
     
-    # Update last used timestamp and usage count
-    db_api_key.last_used = datetime.utcnow()
-    db_api_key.usage_count += 1
-    db.commit()
+    # Usage is accumulated in memory and flushed in batches
+    usage_recorder.record(db_api_key.id)
     
     return db_api_key
 
+def resolve_api_key(api_key: str, db: Session) -> Optional[CachedAPIKey]:
+    """
+    Look up an API key, serving from the in-memory cache when possible.
+    Returns None for unknown or inactive keys.
+    """
+    found, record = api_key_cache.get(api_key)
+    if found:
+        return record
+
+    db_api_key = db.query(APIKey).filter(APIKey.key == api_key).first()
+
+    record = None
+    if db_api_key and is_active(db_api_key.is_active):
+        record = CachedAPIKey(id=db_api_key.id, key=db_api_key.key, name=db_api_key.name)
+
+    api_key_cache.set(api_key, record)
+    return record
+
 def validate_api_key_string(api_key: str, db: Session) -> bool:
     """
     Validate API key from string (for form data)
     """
-    # Query the database for the API key
-    db_api_key = db.query(APIKey).filter(APIKey.key == api_key).first()
-    
+    record = resolve_api_key(api_key, db)
+    if record is None:
+        return False
+
+    # Usage is accumulated in memory and flushed in batches
+    usage_recorder.record(record.id)
+
+    return True
+
+def invalidate_api_key_cache(api_key: Optional[str] = None):
+    """Drop cached validation results for a key (or all keys)"""
+    api_key_cache.invalidate(api_key)
+
+def owns_api_key(api_key_id: int, api_key: str, db: Session) -> bool:
+    """
+    True when api_key is the secret of the key with id api_key_id
+    """
+    db_api_key = db.query(APIKey).filter(APIKey.id == api_key_id).first()
     if not db_api_key:
         return False
-    
-    if not db_api_key.is_active:
+
+    return hmac.compare_digest(db_api_key.key.encode(), api_key.encode())
+
+def deactivate_api_key(api_key_id: int, db: Session) -> bool:
+    """
+    Deactivate an API key and evict it from the validation cache
+    """
+    db_api_key = db.query(APIKey).filter(APIKey.id == api_key_id).first()
+    if not db_api_key:
         return False
-    
-    # Update last used timestamp and usage count
-    db_api_key.last_used = datetime.utcnow()
-    db_api_key.usage_count += 1
+
+    db_api_key.is_active = "false"
     db.commit()
-    
+    invalidate_api_key_cache(db_api_key.key)
+
     return True
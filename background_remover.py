@@ -10,30 +10,73 @@ import time
 import gc
 from typing import Optional, Dict, Any, Tuple, Union, List
 from pathlib import Path
-import requests
 import hashlib
 
 import numpy as np
 from PIL import Image
 import torch
-import torchvision.transforms as transforms
 
 # Import BackgroundRemover-main components
 import sys
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'backgroundremover-main'))
 
-from backgroundremover.bg import remove, get_model
+from backgroundremover.bg import alpha_matting_cutout, naive_cutout
+from backgroundremover.timing import stage
+from backgroundremover.github import MODEL_PARTS, download_files_from_github
+
+from engines import BG_REMOVER_ENGINE, InferenceEngine, create_engine
 
 logger = logging.getLogger(__name__)
 
+# Relative cost of one forward pass per model (u2netp at 320x320 = 1.0)
+MODEL_COST = {
+    "u2netp": 1.0,
+    "u2net": 3.5,
+    "u2net_human_seg": 3.5
+}
+# Cost per megapixel of decode, mask resize, compositing and PNG encode
+PIXEL_COST_PER_MP = 0.15
+# Cost per megapixel of closed-form alpha matting (after thumbnailing to base size)
+MATTING_COST_PER_MP = 30.0
+
+# Peak memory model (bytes), used for admission control. Weights are loaded
+# once and shared by every request, so they are charged to the budget once
+# (see resident_memory); requests are charged for the activations of one
+# 320x320 forward pass plus per-pixel figures covering the decoded RGB
+# copies, float preprocessing buffers, full-size mask and RGBA composite the
+# pipeline holds at once.
+MODEL_WEIGHTS_MEMORY = {
+    "u2netp": 5 * 1024 * 1024,
+    "u2net": 170 * 1024 * 1024,
+    "u2net_human_seg": 170 * 1024 * 1024
+}
+INFERENCE_MEMORY = {
+    "u2netp": 220 * 1024 * 1024,
+    "u2net": 280 * 1024 * 1024,
+    "u2net_human_seg": 280 * 1024 * 1024
+}
+PIPELINE_BYTES_PER_PIXEL = 60
+# Closed-form matting builds a sparse matting Laplacian (~81 entries/pixel)
+MATTING_BYTES_PER_PIXEL = 1600
+OUTPUT_BYTES_PER_PIXEL = {"PNG": 4, "WEBP": 4, "JPEG": 3}
+
+
+def sniff_image_size(data: bytes) -> Optional[Tuple[int, int]]:
+    """Read (width, height) from the image header without decoding pixel data"""
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            return img.size
+    except Exception:
+        return None
+
+
 class BackgroundRemover:
     """
     Optimized Background Remover with single model approach and runtime model download
     """
     
-    def __init__(self):
+    def __init__(self, engine: Optional[InferenceEngine] = None):
         self.device = self._get_device()
-        self.model_cache = {}
         # Use local models directory for development, Docker path for production
         if os.path.exists("/app/models"):
             self.model_dir = Path("/app/models")
@@ -44,7 +87,11 @@ class BackgroundRemover:
         # Default to most efficient model
         self.default_model = "u2netp"
         
-        logger.info(f"BackgroundRemover initialized with device: {self.device}")
+        # Mask prediction backend (BG_REMOVER_ENGINE); loaded models are cached on it
+        self.engine = engine or create_engine(BG_REMOVER_ENGINE, self._download_model_if_needed)
+        self.model_cache = self.engine.models
+        
+        logger.info(f"BackgroundRemover initialized with device: {self.device}, engine: {self.engine.name}")
         logger.info(f"Using models directory: {self.model_dir}")
         
     def _get_device(self) -> str:
@@ -74,27 +121,16 @@ class BackgroundRemover:
             logger.info(f"Using bundled model: {bundled_model_path}")
             return str(bundled_model_path)
         
-        # Model download URLs (GitHub releases or other sources)
-        model_urls = {
-            "u2netp": "https://github.com/danielgatis/rembg/releases/download/v0.0.0/u2netp.pth",
-            "u2net": "https://github.com/danielgatis/rembg/releases/download/v0.0.0/u2net.pth",
-            "u2net_human_seg": "https://github.com/danielgatis/rembg/releases/download/v0.0.0/u2net_human_seg.pth"
-        }
-        
-        if model_name not in model_urls:
+        if model_name not in MODEL_PARTS:
             logger.warning(f"Unknown model {model_name}, falling back to default")
             model_name = self.default_model
             model_filename = f"{model_name}.pth"
             model_path = self.model_dir / model_filename
         
-        # Try to download model
+        # Try to download model (parallel, resumable, md5-verified, atomic install)
         try:
             logger.info(f"Downloading model {model_name}...")
-            response = requests.get(model_urls[model_name], timeout=30)
-            response.raise_for_status()
-            
-            with open(model_path, 'wb') as f:
-                f.write(response.content)
+            download_files_from_github(str(model_path), model_name)
             
             logger.info(f"Model {model_name} downloaded successfully")
             return str(model_path)
@@ -119,6 +155,70 @@ class BackgroundRemover:
         }
         return model_mapping.get(hint.lower(), self.default_model)
     
+    def _resolve_model_name(self, model_hint: str) -> str:
+        """Model actually used for a hint, after deployment overrides"""
+        model_name = self._get_model_name_from_hint(model_hint)
+        
+        # For deployment optimization, always use the most efficient model
+        if model_name != "u2netp":
+            logger.info(f"Using u2netp instead of {model_name} for deployment optimization")
+            model_name = "u2netp"
+        
+        return model_name
+    
+    def estimate_cost(
+        self,
+        image_size: Tuple[int, int],
+        model_hint: str = "general",
+        alpha_matting: bool = False,
+        alpha_matting_base_size: int = 1000
+    ) -> float:
+        """
+        Estimate relative processing cost of a request from its sniffed
+        dimensions, model and matting settings (1.0 ~ one u2netp pass)
+        """
+        width, height = image_size
+        megapixels = width * height / 1_000_000
+        
+        cost = MODEL_COST.get(self._resolve_model_name(model_hint), 1.0)
+        cost += megapixels * PIXEL_COST_PER_MP
+        
+        if alpha_matting:
+            # Matting runs on a thumbnail bounded by alpha_matting_base_size
+            scale = min(1.0, alpha_matting_base_size / max(width, height, 1))
+            cost += megapixels * scale * scale * MATTING_COST_PER_MP
+        
+        return cost
+    
+    def estimate_peak_memory(
+        self,
+        image_size: Tuple[int, int],
+        model_hint: str = "general",
+        alpha_matting: bool = False,
+        alpha_matting_base_size: int = 1000,
+        output_format: str = "PNG"
+    ) -> int:
+        """Estimate peak memory in bytes one request needs on top of the shared model weights"""
+        width, height = image_size
+        pixels = width * height
+        
+        memory = INFERENCE_MEMORY.get(self._resolve_model_name(model_hint), INFERENCE_MEMORY["u2net"])
+        memory += pixels * PIPELINE_BYTES_PER_PIXEL
+        memory += pixels * OUTPUT_BYTES_PER_PIXEL.get(output_format.upper(), 4)
+        
+        if alpha_matting:
+            scale = min(1.0, alpha_matting_base_size / max(width, height, 1))
+            memory += int(pixels * scale * scale * MATTING_BYTES_PER_PIXEL)
+        
+        return int(memory)
+    
+    def resident_memory(self) -> int:
+        """Bytes of model weights held once per process for the models requests can use"""
+        if self.engine.name == "fake":
+            return 0
+        models = {self._resolve_model_name(hint) for hint in ("general", "human", "object")}
+        return sum(MODEL_WEIGHTS_MEMORY.get(name, MODEL_WEIGHTS_MEMORY["u2net"]) for name in models)
+    
     def remove_background(
         self,
         image: Union[Image.Image, bytes],
@@ -145,48 +245,44 @@ class BackgroundRemover:
             Tuple of (processed_image, metadata)
         """
         start_time = time.time()
+        # Seconds per pipeline stage, reported in metadata["timings"]
+        timings: Dict[str, float] = {}
         
         try:
-            # Convert bytes to PIL Image if needed
-            if isinstance(image, bytes):
-                image = Image.open(io.BytesIO(image))
-            
-            # Convert to RGB if needed
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
+            with stage(timings, "decode"):
+                # Convert bytes to PIL Image if needed
+                if isinstance(image, bytes):
+                    image = Image.open(io.BytesIO(image))
+                
+                # Convert to RGB if needed
+                if image.mode != 'RGB':
+                    image = image.convert('RGB')
             
             # Get model name from hint
-            model_name = self._get_model_name_from_hint(model_hint)
-            
-            # For deployment optimization, always use the most efficient model
-            if model_name != "u2netp":
-                logger.info(f"Using u2netp instead of {model_name} for deployment optimization")
-                model_name = "u2netp"
-            
-            # Ensure model is available
-            model_path = self._download_model_if_needed(model_name)
+            model_name = self._resolve_model_name(model_hint)
+            input_size = image.size
             
-            # Use BackgroundRemover-main's remove function
-            # Convert PIL to bytes for the remove function
-            img_bytes = io.BytesIO()
-            image.save(img_bytes, format='PNG')
-            img_bytes.seek(0)
+            # Ensure model is loaded (cached on the engine after the first request);
+            # only a request that actually waits for the load gets a model_load timing
+            self.engine.load(model_name, timings=timings)
             
-            # Process with BackgroundRemover-main
             try:
-                # Use the remove function with our optimized parameters
-                output_bytes = remove(
-                    data=img_bytes.getvalue(),
-                    alpha_matting=alpha_matting,
-                    alpha_matting_foreground_threshold=alpha_matting_foreground_threshold,
-                    alpha_matting_background_threshold=alpha_matting_background_threshold,
-                    alpha_matting_erode_structure_size=alpha_matting_erode_structure_size,
-                    alpha_matting_base_size=alpha_matting_base_size,
-                    model_name=model_name
-                )
+                mask = self.engine.predict_mask(image, model_name, timings=timings)
                 
-                # Convert back to PIL Image
-                processed_image = Image.open(io.BytesIO(output_bytes))
+                if alpha_matting:
+                    with stage(timings, "matting"):
+                        # alpha_matting_cutout thumbnails its input in place
+                        processed_image = alpha_matting_cutout(
+                            image.copy(),
+                            mask,
+                            alpha_matting_foreground_threshold,
+                            alpha_matting_background_threshold,
+                            alpha_matting_erode_structure_size,
+                            alpha_matting_base_size
+                        )
+                else:
+                    with stage(timings, "compositing"):
+                        processed_image = naive_cutout(image, mask)
                 
             except Exception as e:
                 logger.error(f"BackgroundRemover-main processing failed: {e}")
@@ -203,8 +299,9 @@ class BackgroundRemover:
                 "processing_time": processing_time,
                 "alpha_matting_enabled": alpha_matting,
                 "device": self.device,
-                "input_size": image.size,
-                "output_size": processed_image.size
+                "input_size": input_size,
+                "output_size": processed_image.size,
+                "timings": timings
             }
             
             logger.info(f"Background removal completed in {processing_time:.2f}s using {model_name}")
@@ -264,7 +361,9 @@ class BackgroundRemover:
                 "bundled_models": bundled_models,
                 "default_model": self.default_model,
                 "memory_usage_mb": round(memory_mb, 2),
-                "model_cache_size": len(self.model_cache)
+                "model_cache_size": len(self.model_cache),
+                "engine": self.engine.name,
+                "loaded_models": self.engine.loaded_models()
             }
             
         except Exception as e:
@@ -299,6 +398,6 @@ class BackgroundRemover:
     
     def clear_cache(self):
         """Clear model cache to free memory"""
-        self.model_cache.clear()
+        self.engine.clear()
         gc.collect()
         logger.info("Model cache cleared")
@@ -0,0 +1,135 @@
+import os
+import json
+import time
+import socket
+import platform
+import itertools
+import subprocess as sp
+
+import torch
+
+from .videoio import probe, scaled_size
+
+AUTOTUNE_CACHE = os.environ.get(
+    "BACKGROUNDREMOVER_AUTOTUNE_CACHE", os.path.expanduser(os.path.join("~", ".u2net", "autotune.json"))
+)
+
+
+def available_cpus():
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def _powers_of_two(limit):
+    value = 1
+    while value <= limit:
+        yield value
+        value *= 2
+
+
+def candidates(cpus=None, batch_sizes=(1, 2, 4)):
+    """
+    (worker_nodes, gpu_batchsize, threads) combinations to try: worker
+    counts are powers of two and each worker gets an equal share of the
+    cores as torch threads, so the cores are used without workers competing
+    for them.
+    """
+    cpus = cpus or available_cpus()
+    return [(workers, batch_size, cpus // workers)
+            for workers, batch_size in itertools.product(_powers_of_two(cpus), batch_sizes)]
+
+
+def host_key(model_name, frame_size):
+    """Cache key: what the best configuration depends on"""
+    cpu = platform.processor() or platform.machine()
+    return F"{socket.gethostname()}|{cpu}|{available_cpus()}cpu|torch {torch.__version__}|" \
+           F"{model_name}|{frame_size[0]}x{frame_size[1]}"
+
+
+def _load_cache(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_cache(path, cache):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = F"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(cache, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def measure(file_path, model_name, worker_nodes, gpu_batchsize, threads, frames):
+    """
+    Steady-state frames/s of the matte pipeline on the first frames of
+    file_path with the masks discarded. Time to the first mask (model
+    loading, tracing) is left out, since it is paid once per job rather
+    than per frame.
+    """
+    from .utilities import mask_input_args, run_matte_pipeline
+
+    def open_sink(width, height, rate):
+        return sp.Popen(['ffmpeg', '-v', 'error', '-y', *mask_input_args(width, height, rate), '-f', 'null', '-'],
+                        stdin=sp.PIPE)
+
+    written = []
+
+    def progress(count, _):
+        written.append((count, time.perf_counter()))
+
+    run_matte_pipeline(file_path, worker_nodes, gpu_batchsize, model_name, open_sink, frame_limit=frames,
+                       progress=progress, threads=threads)
+    # count from when every worker has delivered its first batch, which includes its startup
+    start = next((i for i, (count, _) in enumerate(written) if count >= worker_nodes * gpu_batchsize),
+                 len(written) - 1)
+    if len(written) - 1 <= start:
+        return 0.0
+    (first_count, first_time), (last_count, last_time) = written[start], written[-1]
+    return (last_count - first_count) / max(last_time - first_time, 1e-9)
+
+
+def tune(file_path, model_name, frames=None, batch_sizes=(1, 2, 4), retune=False, cache_path=None):
+    """
+    Best (worker_nodes, gpu_batchsize, threads) for model_name on this host,
+    as a dict. Calibrates on the first frames of file_path unless an earlier
+    run already stored a result for this host, model and frame size in
+    cache_path (default BACKGROUNDREMOVER_AUTOTUNE_CACHE).
+    """
+    cache_path = cache_path or AUTOTUNE_CACHE
+    info = probe(file_path)
+    frame_size = scaled_size(info["width"], info["height"], 320)
+    key = host_key(model_name, frame_size)
+
+    cache = _load_cache(cache_path)
+    if key in cache and not retune:
+        best = cache[key]
+        print(F"AUTOTUNE (CACHED): -wn {best['worker_nodes']} -gb {best['gpu_batchsize']} -th {best['threads']} "
+              F"({best['frames_per_second']:.2f} frames/s)")
+        return best
+
+    results = []
+    for worker_nodes, gpu_batchsize, threads in candidates(batch_sizes=batch_sizes):
+        # enough frames for a few batches per worker after the first
+        count = frames or worker_nodes * gpu_batchsize * 4
+        count = min(count, info["frames"])
+        rate = measure(file_path, model_name, worker_nodes, gpu_batchsize, threads, count)
+        print(F"AUTOTUNE: -wn {worker_nodes} -gb {gpu_batchsize} -th {threads}: {rate:.2f} frames/s")
+        results.append({"worker_nodes": worker_nodes, "gpu_batchsize": gpu_batchsize, "threads": threads,
+                        "frames_per_second": round(rate, 3)})
+
+    best = dict(max(results, key=lambda result: result["frames_per_second"]))
+    best["tuned_at"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+    best["candidates"] = results
+    cache = _load_cache(cache_path)
+    cache[key] = best
+    try:
+        _save_cache(cache_path, cache)
+    except OSError as e:
+        print(F"could not save autotune result to {cache_path}: {e}")
+    print(F"AUTOTUNE CHOSE: -wn {best['worker_nodes']} -gb {best['gpu_batchsize']} -th {best['threads']} "
+          F"({best['frames_per_second']:.2f} frames/s, saved to {cache_path})")
+    return best
@@ -2,18 +2,12 @@ import io
 import os
 import typing
 from PIL import Image
-from pymatting.alpha.estimate_alpha_cf import estimate_alpha_cf
-from pymatting.foreground.estimate_foreground_ml import estimate_foreground_ml
-from pymatting.util.util import stack_images
-from scipy.ndimage.morphology import binary_erosion
-from moviepy import VideoFileClip
 import numpy as np
 import torch
 import torch.nn.functional
-import torch.nn.functional
-from hsh.library.hash import Hasher
 from .u2net import detect, u2net
-from . import github
+from . import github, weights
+from .timing import stage
 
 # closes https://github.com/nadermx/backgroundremover/issues/18
 # closes https://github.com/nadermx/backgroundremover/issues/112
@@ -28,10 +22,19 @@ except Exception as e:
     print(f"Using CPU.  Setting Cuda or MPS failed: {e}")
     DEVICE = torch.device('cpu')
 
+def model_path(model_name):
+    """Weights file for model_name (U2NETP_PATH/U2NET_PATH or ~/.u2net), downloaded if missing"""
+    path = os.environ.get(
+        "U2NETP_PATH" if model_name == "u2netp" else "U2NET_PATH",
+        os.path.expanduser(os.path.join("~", ".u2net", model_name + ".pth")),
+    )
+    github.ensure_model(path, model_name)
+    return path
+
+
 class Net(torch.nn.Module):
     def __init__(self, model_name):
         super(Net, self).__init__()
-        hasher = Hasher()
         model = {
             'u2netp': (u2net.U2NETP,
                        'e4f636406ca4e2af789941e7f139ee2e',
@@ -48,49 +51,20 @@ class Net(torch.nn.Module):
         }[model_name]
 
         if model_name == "u2netp":
-            net = u2net.U2NETP(3, 1)
-            path = os.environ.get(
-                "U2NETP_PATH",
-                os.path.expanduser(os.path.join("~", ".u2net", model_name + ".pth")),
-            )
-            if (
-                not os.path.exists(path)
-            ):
-                github.download_files_from_github(
-                    path, model_name
-                )
+            net_cls = u2net.U2NETP
+            path = model_path(model_name)
 
         elif model_name == "u2net":
-            net = u2net.U2NET(3, 1)
-            path = os.environ.get(
-                "U2NET_PATH",
-                os.path.expanduser(os.path.join("~", ".u2net", model_name + ".pth")),
-            )
-            if (
-                not os.path.exists(path)
-                #or hasher.md5(path) != "09fb4e49b7f785c9f855baf94916840a"
-            ):
-                github.download_files_from_github(
-                    path, model_name
-                )
+            net_cls = u2net.U2NET
+            path = model_path(model_name)
 
         elif model_name == "u2net_human_seg":
-            net = u2net.U2NET(3, 1)
-            path = os.environ.get(
-                "U2NET_PATH",
-                os.path.expanduser(os.path.join("~", ".u2net", model_name + ".pth")),
-            )
-            if (
-                not os.path.exists(path)
-                #or hasher.md5(path) != "347c3d51b01528e5c6c071e3cff1cb55"
-            ):
-                github.download_files_from_github(
-                    path, model_name
-                )
+            net_cls = u2net.U2NET
+            path = model_path(model_name)
         else:
             print("Choose between u2net, u2net_human_seg or u2netp", file=sys.stderr)
 
-        net.load_state_dict(torch.load(path, map_location=torch.device(DEVICE)))
+        net = weights.build_model(lambda: net_cls(3, 1), path, device=DEVICE)
         net.to(device=DEVICE, dtype=torch.float32, non_blocking=True)
         net.eval()
         self.net = net
@@ -118,6 +92,12 @@ def alpha_matting_cutout(
     erode_structure_size,
     base_size,
 ):
+    # Matting dependencies (pymatting compiles numba kernels) load on first use
+    from pymatting.alpha.estimate_alpha_cf import estimate_alpha_cf
+    from pymatting.foreground.estimate_foreground_ml import estimate_foreground_ml
+    from pymatting.util.util import stack_images
+    from scipy.ndimage import binary_erosion
+
     size = img.size
 
     img.thumbnail((base_size, base_size), Image.LANCZOS)
@@ -184,39 +164,54 @@ def remove(
     alpha_matting_background_threshold=10,
     alpha_matting_erode_structure_size=10,
     alpha_matting_base_size=1000,
+    timings=None,
 ):
-    model = get_model(model_name)
-
-    if isinstance(data, np.ndarray):
-        img = Image.fromarray(data).convert("RGB")
-    else:
-        try:
-            img = Image.open(io.BytesIO(data)).convert("RGB")
-        except Exception as e:
-            raise ValueError(f"Invalid image input to `remove()`: {e}")
+    """
+    Remove the background of an image and return PNG bytes.
+
+    If a dict is passed as ``timings`` it is filled with the seconds spent
+    in each stage (model_load, decode, preprocess, inference, matting or
+    compositing, encode).
+    """
+    with stage(timings, "model_load"):
+        model = get_model(model_name)
+
+    with stage(timings, "decode"):
+        if isinstance(data, np.ndarray):
+            img = Image.fromarray(data).convert("RGB")
+        else:
+            try:
+                img = Image.open(io.BytesIO(data)).convert("RGB")
+            except Exception as e:
+                raise ValueError(f"Invalid image input to `remove()`: {e}")
 
-    mask = detect.predict(model, np.array(img)).convert("L")
+    mask = detect.predict(model, np.array(img), timings=timings).convert("L")
 
     if alpha_matting:
-        cutout = alpha_matting_cutout(
-            img,
-            mask,
-            alpha_matting_foreground_threshold,
-            alpha_matting_background_threshold,
-            alpha_matting_erode_structure_size,
-            alpha_matting_base_size,
-        )
+        with stage(timings, "matting"):
+            cutout = alpha_matting_cutout(
+                img,
+                mask,
+                alpha_matting_foreground_threshold,
+                alpha_matting_background_threshold,
+                alpha_matting_erode_structure_size,
+                alpha_matting_base_size,
+            )
     else:
-        cutout = naive_cutout(img, mask)
+        with stage(timings, "compositing"):
+            cutout = naive_cutout(img, mask)
 
-    bio = io.BytesIO()
-    cutout.save(bio, "PNG")
+    with stage(timings, "encode"):
+        bio = io.BytesIO()
+        cutout.save(bio, "PNG")
 
     return bio.getbuffer()
 
 
 def iter_frames(path):
-    return VideoFileClip(path).resized(height=320).iter_frames(dtype="uint8")
+    from .videoio import FrameReader, probe, scaled_size
+    info = probe(path)
+    return iter(FrameReader(path, scaled_size(info["width"], info["height"], 320)))
 
 
 @torch.no_grad()
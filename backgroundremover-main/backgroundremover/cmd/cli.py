@@ -1,8 +1,10 @@
 import argparse
 import os
+import sys
 from distutils.util import strtobool
-from .. import utilities
+from .. import folder, utilities
 from ..bg import remove
+from ..profiling import profile_call
 
 
 def main():
@@ -76,6 +78,35 @@ def main():
         help="GPU batchsize"
     )
 
+    ap.add_argument(
+        "-th",
+        "--threads",
+        default=0,
+        type=int,
+        help="Torch threads per worker, 0 for torch's default (all cores)"
+    )
+
+    ap.add_argument(
+        "-at",
+        "--autotune",
+        nargs="?",
+        const=True,
+        default=False,
+        type=lambda x: bool(strtobool(x)),
+        help="Pick workers, batch size and threads for this host by timing the first frames "
+        "(cached per host, model and frame size; overrides -wn, -gb and -th)",
+    )
+
+    ap.add_argument(
+        "-rt",
+        "--retune",
+        nargs="?",
+        const=True,
+        default=False,
+        type=lambda x: bool(strtobool(x)),
+        help="With --autotune, calibrate again instead of using the cached choice",
+    )
+
     ap.add_argument(
         "-fr",
         "--framerate",
@@ -147,6 +178,59 @@ def main():
         help="Make transparent background overlay a background image",
     )
 
+    ap.add_argument(
+        "-st",
+        "--streaming",
+        nargs="?",
+        const=True,
+        default=False,
+        type=lambda x: bool(strtobool(x)),
+        help="Pipe masks straight into the compositing ffmpeg instead of writing a matte file first",
+    )
+
+    ap.add_argument(
+        "-tm",
+        "--temporal",
+        nargs="?",
+        const=True,
+        default=False,
+        type=lambda x: bool(strtobool(x)),
+        help="Reuse the previous mask instead of running the model on frames that barely changed",
+    )
+
+    ap.add_argument(
+        "-tt",
+        "--temporal-threshold",
+        default=0.01,
+        type=float,
+        help="Mean frame difference (0-1) below which a mask is reused",
+    )
+
+    ap.add_argument(
+        "-ki",
+        "--keyframe-interval",
+        default=10,
+        type=int,
+        help="Most frames in a row that may reuse a mask before the model runs again",
+    )
+
+    ap.add_argument(
+        "-ms",
+        "--mask-smoothing",
+        default=0.0,
+        type=float,
+        help="Weight of the previous mask when smoothing masks over time, 0 to disable",
+    )
+
+    ap.add_argument(
+        "-sg",
+        "--segments",
+        default=1,
+        type=int,
+        help="Split a video at keyframes and process this many segments in parallel; "
+        "rerunning an interrupted job resumes from the finished segments",
+    )
+
     ap.add_argument(
         "-i",
         "--input",
@@ -197,105 +281,274 @@ def main():
         help="Path to the output folder for processed files.",
     )
 
+    ap.add_argument(
+        "-r",
+        "--recursive",
+        nargs="?",
+        const=True,
+        default=False,
+        type=lambda x: bool(strtobool(x)),
+        help="Also process files in subfolders of --input-folder, mirroring them in the output folder",
+    )
+
+    ap.add_argument(
+        "-gl",
+        "--glob",
+        action="append",
+        default=None,
+        help="Only process files whose name or path relative to --input-folder matches this pattern "
+        "(e.g. '*.png' or 'shoots/*/raw_*'); repeat for several",
+    )
+
+    ap.add_argument(
+        "-j",
+        "--jobs",
+        default=0,
+        type=int,
+        help="Threads decoding and encoding images in folder mode, 0 for one per core",
+    )
+
+    ap.add_argument(
+        "-ic",
+        "--incremental",
+        nargs="?",
+        const=True,
+        default=False,
+        type=lambda x: bool(strtobool(x)),
+        help="In folder mode, keep a manifest in the output folder and only process inputs that are new or "
+        "changed (content or parameters) since the last run; outputs of deleted inputs are removed",
+    )
+
+    ap.add_argument(
+        "-pf",
+        "--profile",
+        nargs="?",
+        const=True,
+        default=False,
+        type=lambda x: bool(strtobool(x)),
+        help="Capture a cProfile and torch.profiler trace of the run (main process only).",
+    )
+
+    ap.add_argument(
+        "-pd",
+        "--profile-dir",
+        default=os.environ.get("BACKGROUNDREMOVER_PROFILE_DIR", "profiles"),
+        type=str,
+        help="Directory where profiling artifacts are written.",
+    )
+
     args = ap.parse_args()
+    if args.streaming and args.segments > 1:
+        ap.error("--streaming and --segments can't be combined")
+
+    if args.profile:
+        _, artifact_id = profile_call(run, args, profile_dir=args.profile_dir)
+        print(f"Profile written to {os.path.join(args.profile_dir, artifact_id)}")
+        return
+
+    run(args)
 
-    def is_video_file(filename):
-        return filename.lower().endswith((".mp4", ".mov", ".webm", ".ogg", ".gif"))
 
-    def is_image_file(filename):
-        return filename.lower().endswith((".jpg", ".jpeg", ".png"))
+def run(args):
+    def apply_autotune(path):
+        if args.autotune:
+            from .. import autotune
+            best = autotune.tune(path, args.model, retune=args.retune)
+            args.workernodes, args.gpubatchsize, args.threads = \
+                best["worker_nodes"], best["gpu_batchsize"], best["threads"]
+            # one calibration per run is enough when a folder's videos share a frame size
+            args.retune = False
+
+    temporal = None
+    if args.temporal or args.mask_smoothing > 0:
+        temporal = utilities.TemporalReuse(threshold=args.temporal_threshold if args.temporal else 0,
+                                           keyframe_interval=args.keyframe_interval,
+                                           smoothing=args.mask_smoothing)
 
     if args.input_folder:
         input_folder = os.path.abspath(args.input_folder)
         output_folder = os.path.abspath(args.output_folder or input_folder)
         os.makedirs(output_folder, exist_ok=True)
 
-        files = [f for f in os.listdir(input_folder) if is_video_file(f) or is_image_file(f)]
-
-        for f in files:
-            input_path = os.path.join(input_folder, f)
-            output_path = os.path.join(output_folder, f"output_{f}")
-
-            if is_video_file(f):
-                if args.mattekey:
-                    utilities.matte_key(output_path, input_path,
-                                        worker_nodes=args.workernodes,
-                                        gpu_batchsize=args.gpubatchsize,
-                                        model_name=args.model,
-                                        frame_limit=args.framelimit,
-                                        framerate=args.framerate)
-                elif args.transparentvideo:
-                    utilities.transparentvideo(output_path, input_path,
-                                               worker_nodes=args.workernodes,
-                                               gpu_batchsize=args.gpubatchsize,
-                                               model_name=args.model,
-                                               frame_limit=args.framelimit,
-                                               framerate=args.framerate)
-                elif args.transparentvideoovervideo:
-                    utilities.transparentvideoovervideo(output_path, os.path.abspath(args.backgroundvideo.name),
-                                                        input_path,
-                                                        worker_nodes=args.workernodes,
-                                                        gpu_batchsize=args.gpubatchsize,
-                                                        model_name=args.model,
-                                                        frame_limit=args.framelimit,
-                                                        framerate=args.framerate)
-                elif args.transparentvideooverimage:
-                    utilities.transparentvideooverimage(output_path, os.path.abspath(args.backgroundimage.name),
-                                                        input_path,
-                                                        worker_nodes=args.workernodes,
-                                                        gpu_batchsize=args.gpubatchsize,
-                                                        model_name=args.model,
-                                                        frame_limit=args.framelimit,
-                                                        framerate=args.framerate)
-                elif args.transparentgif:
-                    utilities.transparentgif(output_path, input_path,
-                                             worker_nodes=args.workernodes,
-                                             gpu_batchsize=args.gpubatchsize,
-                                             model_name=args.model,
-                                             frame_limit=args.framelimit,
-                                             framerate=args.framerate)
-                elif args.transparentgifwithbackground:
-                    utilities.transparentgifwithbackground(output_path, os.path.abspath(args.backgroundimage.name), input_path,
-                                                           worker_nodes=args.workernodes,
-                                                           gpu_batchsize=args.gpubatchsize,
-                                                           model_name=args.model,
-                                                           frame_limit=args.framelimit,
-                                                           framerate=args.framerate)
-            elif is_image_file(f):
-                with open(input_path, "rb") as i, open(output_path, "wb") as o:
-                    r = lambda i: i.buffer.read() if hasattr(i, "buffer") else i.read()
-                    w = lambda o, data: o.buffer.write(data) if hasattr(o, "buffer") else o.write(data)
-                    w(
-                        o,
-                        remove(
-                            r(i),
-                            model_name=args.model,
-                            alpha_matting=args.alpha_matting,
-                            alpha_matting_foreground_threshold=args.alpha_matting_foreground_threshold,
-                            alpha_matting_background_threshold=args.alpha_matting_background_threshold,
-                            alpha_matting_erode_structure_size=args.alpha_matting_erode_size,
-                            alpha_matting_base_size=args.alpha_matting_base_size,
-                        ),
-                    )
+        images = folder.find_inputs(input_folder, folder.IMAGE_EXTENSIONS, args.recursive, args.glob)
+        videos = folder.find_inputs(input_folder, folder.VIDEO_EXTENSIONS, args.recursive, args.glob)
+
+        def output_for(relative):
+            # nested inputs keep their directory layout under the output folder
+            directory, name = os.path.split(relative)
+            return os.path.join(output_folder, directory, f"output_{name}")
+
+        video_modes = ["mattekey", "transparentvideo", "transparentvideoovervideo", "transparentvideooverimage",
+                       "transparentgif", "transparentgifwithbackground"]
+        video_mode = next((mode for mode in video_modes if getattr(args, mode)), None)
+        if video_mode is None:
+            # videos are only processed when one of the video options is given
+            videos = []
+        # everything that changes the outputs; a different value reprocesses the inputs
+        image_params = {"model": args.model, "alpha_matting": args.alpha_matting}
+        if args.alpha_matting:
+            image_params.update(foreground_threshold=args.alpha_matting_foreground_threshold,
+                                background_threshold=args.alpha_matting_background_threshold,
+                                erode_size=args.alpha_matting_erode_size,
+                                base_size=args.alpha_matting_base_size)
+        video_params = {"model": args.model, "mode": video_mode, "frame_limit": args.framelimit,
+                        "framerate": args.framerate,
+                        "temporal": temporal and [temporal.threshold, temporal.keyframe_interval, temporal.smoothing]}
+        if video_mode == "transparentvideoovervideo":
+            video_params["background"] = folder.file_hash(args.backgroundvideo.name)
+        elif video_mode in ("transparentvideooverimage", "transparentgifwithbackground"):
+            video_params["background"] = folder.file_hash(args.backgroundimage.name)
+
+        manifest = None
+        if args.incremental:
+            manifest = folder.Manifest(input_folder, output_folder)
+            removed = manifest.prune()
+            recorded = manifest.outputs()
+            images = [f for f in images if os.path.join(input_folder, f) not in recorded]
+            videos = [f for f in videos if os.path.join(input_folder, f) not in recorded]
+            found = len(images) + len(videos)
+            images = manifest.changed(images, image_params, jobs=args.jobs)
+            videos = manifest.changed(videos, video_params, jobs=args.jobs)
+            print(F"INCREMENTAL: {len(images) + len(videos)} OF {found} FILES TO PROCESS, "
+                  F"{removed} STALE OUTPUTS REMOVED")
+        on_done = None
+        if manifest:
+            def on_done(index):
+                manifest.record(images[index], output_for(images[index]), image_params)
+
+        try:
+            if images:
+                folder.remove_images(
+                    [os.path.join(input_folder, f) for f in images],
+                    [output_for(f) for f in images],
+                    model_name=args.model,
+                    batch_size=args.gpubatchsize,
+                    jobs=args.jobs,
+                    alpha_matting=args.alpha_matting,
+                    alpha_matting_foreground_threshold=args.alpha_matting_foreground_threshold,
+                    alpha_matting_background_threshold=args.alpha_matting_background_threshold,
+                    alpha_matting_erode_structure_size=args.alpha_matting_erode_size,
+                    alpha_matting_base_size=args.alpha_matting_base_size,
+                    on_done=on_done,
+                )
+
+            for f in videos:
+                input_path = os.path.join(input_folder, f)
+                output_path = output_for(f)
+                os.makedirs(os.path.dirname(output_path), exist_ok=True)
+                # written under another name and renamed when complete, so an interrupted
+                # run never leaves a truncated file at output_path
+                root, ext = os.path.splitext(output_path)
+                partial = F"{root}.partial{ext}"
+
+                apply_autotune(input_path)
+                try:
+                    if args.mattekey:
+                        utilities.matte_key(partial, input_path,
+                                            worker_nodes=args.workernodes,
+                                            gpu_batchsize=args.gpubatchsize,
+                                            model_name=args.model,
+                                            frame_limit=args.framelimit,
+                                            framerate=args.framerate,
+                                            temporal=temporal,
+                                            segments=args.segments,
+                                            threads=args.threads)
+                    elif args.transparentvideo:
+                        utilities.transparentvideo(partial, input_path,
+                                                   worker_nodes=args.workernodes,
+                                                   gpu_batchsize=args.gpubatchsize,
+                                                   model_name=args.model,
+                                                   frame_limit=args.framelimit,
+                                                   framerate=args.framerate,
+                                                   streaming=args.streaming,
+                                                   temporal=temporal,
+                                                   segments=args.segments,
+                                                   threads=args.threads)
+                    elif args.transparentvideoovervideo:
+                        utilities.transparentvideoovervideo(partial, os.path.abspath(args.backgroundvideo.name),
+                                                            input_path,
+                                                            worker_nodes=args.workernodes,
+                                                            gpu_batchsize=args.gpubatchsize,
+                                                            model_name=args.model,
+                                                            frame_limit=args.framelimit,
+                                                            framerate=args.framerate,
+                                                            streaming=args.streaming,
+                                                            temporal=temporal,
+                                                            segments=args.segments,
+                                                            threads=args.threads)
+                    elif args.transparentvideooverimage:
+                        utilities.transparentvideooverimage(partial, os.path.abspath(args.backgroundimage.name),
+                                                            input_path,
+                                                            worker_nodes=args.workernodes,
+                                                            gpu_batchsize=args.gpubatchsize,
+                                                            model_name=args.model,
+                                                            frame_limit=args.framelimit,
+                                                            framerate=args.framerate,
+                                                            streaming=args.streaming,
+                                                            temporal=temporal,
+                                                            segments=args.segments,
+                                                            threads=args.threads)
+                    elif args.transparentgif:
+                        utilities.transparentgif(partial, input_path,
+                                                 worker_nodes=args.workernodes,
+                                                 gpu_batchsize=args.gpubatchsize,
+                                                 model_name=args.model,
+                                                 frame_limit=args.framelimit,
+                                                 framerate=args.framerate,
+                                                 streaming=args.streaming,
+                                                 temporal=temporal,
+                                                 segments=args.segments,
+                                                 threads=args.threads)
+                    elif args.transparentgifwithbackground:
+                        utilities.transparentgifwithbackground(partial, os.path.abspath(args.backgroundimage.name), input_path,
+                                                               worker_nodes=args.workernodes,
+                                                               gpu_batchsize=args.gpubatchsize,
+                                                               model_name=args.model,
+                                                               frame_limit=args.framelimit,
+                                                               framerate=args.framerate,
+                                                               streaming=args.streaming,
+                                                               temporal=temporal,
+                                                               segments=args.segments,
+                                                               threads=args.threads)
+                except Exception as e:
+                    # ffmpeg may leave a truncated file behind; never install it or record it
+                    if os.path.exists(partial):
+                        os.remove(partial)
+                    print(F"FAILED {input_path}: {e}", file=sys.stderr)
+                    continue
+                os.replace(partial, output_path)
+                if manifest:
+                    manifest.record(f, output_path, video_params)
+        finally:
+            if manifest:
+                manifest.save()
         return
 
     ext = os.path.splitext(args.input.name)[1].lower()
 
     if ext in [".mp4", ".mov", ".webm", ".ogg", ".gif"]:
+        apply_autotune(os.path.abspath(args.input.name))
         if args.mattekey:
             utilities.matte_key(os.path.abspath(args.output.name), os.path.abspath(args.input.name),
                                 worker_nodes=args.workernodes,
                                 gpu_batchsize=args.gpubatchsize,
                                 model_name=args.model,
                                 frame_limit=args.framelimit,
-                                framerate=args.framerate)
+                                framerate=args.framerate,
+                                temporal=temporal,
+                                segments=args.segments,
+                                threads=args.threads)
         elif args.transparentvideo:
             utilities.transparentvideo(os.path.abspath(args.output.name), os.path.abspath(args.input.name),
                                        worker_nodes=args.workernodes,
                                        gpu_batchsize=args.gpubatchsize,
                                        model_name=args.model,
                                        frame_limit=args.framelimit,
-                                       framerate=args.framerate)
+                                       framerate=args.framerate,
+                                       streaming=args.streaming,
+                                       temporal=temporal,
+                                       segments=args.segments,
+                                       threads=args.threads)
         elif args.transparentvideoovervideo:
             utilities.transparentvideoovervideo(os.path.abspath(args.output.name), os.path.abspath(args.backgroundvideo.name),
                                                 os.path.abspath(args.input.name),
@@ -303,7 +556,11 @@ def main():
                                                 gpu_batchsize=args.gpubatchsize,
                                                 model_name=args.model,
                                                 frame_limit=args.framelimit,
-                                                framerate=args.framerate)
+                                                framerate=args.framerate,
+                                                streaming=args.streaming,
+                                                temporal=temporal,
+                                                segments=args.segments,
+                                                threads=args.threads)
         elif args.transparentvideooverimage:
             utilities.transparentvideooverimage(os.path.abspath(args.output.name), os.path.abspath(args.backgroundimage.name),
                                                 os.path.abspath(args.input.name),
@@ -311,21 +568,33 @@ def main():
                                                 gpu_batchsize=args.gpubatchsize,
                                                 model_name=args.model,
                                                 frame_limit=args.framelimit,
-                                                framerate=args.framerate)
+                                                framerate=args.framerate,
+                                                streaming=args.streaming,
+                                                temporal=temporal,
+                                                segments=args.segments,
+                                                threads=args.threads)
         elif args.transparentgif:
             utilities.transparentgif(os.path.abspath(args.output.name), os.path.abspath(args.input.name),
                                      worker_nodes=args.workernodes,
                                      gpu_batchsize=args.gpubatchsize,
                                      model_name=args.model,
                                      frame_limit=args.framelimit,
-                                     framerate=args.framerate)
+                                     framerate=args.framerate,
+                                     streaming=args.streaming,
+                                     temporal=temporal,
+                                     segments=args.segments,
+                                     threads=args.threads)
         elif args.transparentgifwithbackground:
             utilities.transparentgifwithbackground(os.path.abspath(args.output.name), os.path.abspath(args.backgroundimage.name), os.path.abspath(args.input.name),
                                                    worker_nodes=args.workernodes,
                                                    gpu_batchsize=args.gpubatchsize,
                                                    model_name=args.model,
                                                    frame_limit=args.framelimit,
-                                                   framerate=args.framerate)
+                                                   framerate=args.framerate,
+                                                   streaming=args.streaming,
+                                                   temporal=temporal,
+                                                   segments=args.segments,
+                                                   threads=args.threads)
 
     elif ext in [".jpg", ".jpeg", ".png"]:
         r = lambda i: i.buffer.read() if hasattr(i, "buffer") else i.read()
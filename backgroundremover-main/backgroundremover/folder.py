@@ -0,0 +1,269 @@
+import os
+import sys
+import json
+import time
+import fnmatch
+import hashlib
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from .bg import alpha_matting_cutout, get_model, naive_cutout
+from .u2net import detect
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+VIDEO_EXTENSIONS = (".mp4", ".mov", ".webm", ".ogg", ".gif")
+MANIFEST_NAME = ".backgroundremover-manifest.json"
+
+
+def find_inputs(folder, extensions, recursive=False, patterns=None):
+    """
+    Files under folder with one of extensions, as sorted paths relative to
+    folder. With patterns, only files whose relative path or name matches
+    one of the globs are kept.
+    """
+    found = []
+    for root, dirs, files in os.walk(folder):
+        if not recursive:
+            dirs[:] = []
+        dirs.sort()
+        for name in files:
+            relative = os.path.relpath(os.path.join(root, name), folder)
+            if not name.lower().endswith(extensions):
+                continue
+            if patterns and not any(fnmatch.fnmatch(relative.replace(os.sep, "/"), pattern)
+                                    or fnmatch.fnmatch(name, pattern) for pattern in patterns):
+                continue
+            found.append(relative)
+    return sorted(found)
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class Manifest:
+    """
+    Record in the output folder of what each output was made from: the
+    input's content hash and the parameters (model, matting, video mode...)
+    it was processed with. Entries are keyed by input path relative to the
+    input folder and only added once the output is complete, so after an
+    interrupted run the missing ones are simply processed again.
+    """
+
+    version = 1
+
+    def __init__(self, input_folder, output_folder, path=None, save_interval=5.0):
+        self.input_folder = input_folder
+        self.output_folder = output_folder
+        self.path = path or os.path.join(output_folder, MANIFEST_NAME)
+        self.save_interval = save_interval
+        self.entries = {}
+        self._hashes = {}
+        self._saved = time.monotonic()
+        self._dirty = False
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            if data.get("version") == self.version:
+                self.entries = data["files"]
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, AttributeError) as e:
+            print(F"ignoring unreadable manifest {self.path}, processing everything: {e}")
+
+    def outputs(self):
+        """Absolute paths of the outputs recorded, so in-place runs don't take them for inputs"""
+        return {os.path.join(self.output_folder, entry["output"]) for entry in self.entries.values()}
+
+    def _fingerprint(self, relative):
+        path = os.path.join(self.input_folder, relative)
+        stat = os.stat(path)
+        entry = self.entries.get(relative)
+        # unchanged size and mtime: trust the stored hash instead of reading the file again
+        if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            return entry["sha256"], stat.st_size, stat.st_mtime_ns
+        return file_hash(path), stat.st_size, stat.st_mtime_ns
+
+    def changed(self, relatives, params, jobs=None):
+        """
+        The inputs in relatives that need processing with params: new ones,
+        ones whose content or parameters changed and ones whose output is
+        missing. Files needing a hash are read by `jobs` threads.
+        """
+        with ThreadPoolExecutor(max_workers=jobs or os.cpu_count() or 1) as pool:
+            fingerprints = list(pool.map(self._fingerprint, relatives))
+
+        todo = []
+        for relative, fingerprint in zip(relatives, fingerprints):
+            self._hashes[relative] = fingerprint
+            entry = self.entries.get(relative)
+            if (entry is None or entry["sha256"] != fingerprint[0] or entry["params"] != params
+                    or not os.path.exists(os.path.join(self.output_folder, entry["output"]))):
+                todo.append(relative)
+            elif entry["mtime_ns"] != fingerprint[2]:
+                # touched but identical: refresh the stat so the next run skips hashing it
+                entry["size"], entry["mtime_ns"] = fingerprint[1:]
+                self._dirty = True
+        return todo
+
+    def record(self, relative, output_path, params):
+        """Mark relative as processed into output_path; call once the output is complete"""
+        sha256, size, mtime_ns = self._hashes.get(relative) or self._fingerprint(relative)
+        self.entries[relative] = {"sha256": sha256, "size": size, "mtime_ns": mtime_ns, "params": params,
+                                  "output": os.path.relpath(output_path, self.output_folder)}
+        self._dirty = True
+        if time.monotonic() - self._saved >= self.save_interval:
+            self.save()
+
+    def prune(self):
+        """Delete the outputs of inputs that no longer exist and forget them. Returns how many"""
+        removed = 0
+        for relative in list(self.entries):
+            if os.path.exists(os.path.join(self.input_folder, relative)):
+                continue
+            output_path = os.path.join(self.output_folder, self.entries.pop(relative)["output"])
+            try:
+                os.remove(output_path)
+            except FileNotFoundError:
+                pass
+            removed += 1
+            self._dirty = True
+        return removed
+
+    def save(self):
+        if not self._dirty:
+            return
+        os.makedirs(self.output_folder, exist_ok=True)
+        tmp = F"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"version": self.version, "files": self.entries}, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.path)
+        self._saved = time.monotonic()
+        self._dirty = False
+
+
+def _load(path):
+    img = Image.open(path).convert("RGB")
+    return img, detect.preprocess(np.array(img))
+
+
+def _save(img, mask, output_path, alpha_matting, matting_args):
+    mask = mask.convert("L")
+    if alpha_matting:
+        cutout = alpha_matting_cutout(img, mask, *matting_args)
+    else:
+        cutout = naive_cutout(img, mask)
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    tmp = output_path + ".tmp"
+    cutout.save(tmp, "PNG")
+    os.replace(tmp, output_path)
+
+
+def remove_images(
+    inputs,
+    outputs,
+    model_name="u2net",
+    batch_size=2,
+    jobs=None,
+    alpha_matting=False,
+    alpha_matting_foreground_threshold=240,
+    alpha_matting_background_threshold=10,
+    alpha_matting_erode_structure_size=10,
+    alpha_matting_base_size=1000,
+    on_done=None,
+):
+    """
+    Remove the background of every image in inputs, writing PNGs to the
+    matching outputs. The model is loaded once; decoding and preprocessing,
+    batched inference and cutout plus encoding overlap, with `jobs` threads
+    (default: one per core) for the image work and bounded queues between
+    the stages. Failures are reported and skipped; on_done(index) is called
+    for each output written. Returns counts and throughput.
+    """
+    jobs = jobs or os.cpu_count() or 1
+    matting_args = (alpha_matting_foreground_threshold, alpha_matting_background_threshold,
+                    alpha_matting_erode_structure_size, alpha_matting_base_size)
+    net = get_model(model_name)
+
+    started = time.perf_counter()
+    total, done, failed = len(inputs), 0, 0
+
+    def report(force=False):
+        if force or done % max(batch_size, 10) == 0:
+            elapsed = time.perf_counter() - started
+            print(F"PROCESSED {done}/{total} IMAGES ({done / elapsed if elapsed else 0:.2f} IMAGES/S)", flush=True)
+
+    def fail(path, error):
+        nonlocal failed
+        failed += 1
+        print(F"FAILED {path}: {error}", file=sys.stderr)
+
+    def finish(future, index):
+        nonlocal done
+        try:
+            future.result()
+        except Exception as e:
+            fail(inputs[index], e)
+        else:
+            if on_done:
+                on_done(index)
+        done += 1
+        report()
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        # decoded images waiting for inference, in input order
+        loading = collections.deque()
+        # cutouts being encoded; waited on oldest first when too many are in flight
+        saving = collections.deque()
+        batch = []
+        next_input = 0
+
+        def flush():
+            nonlocal done
+            if not batch:
+                return
+            try:
+                masks = detect.predict_many(net, [sample for _, (_, sample) in batch])
+            except Exception as e:
+                for index, _ in batch:
+                    fail(inputs[index], e)
+                done += len(batch)
+                report()
+                masks = []
+            for (index, (img, _)), mask in zip(batch, masks):
+                saving.append((pool.submit(_save, img, mask, outputs[index], alpha_matting, matting_args), index))
+            batch.clear()
+            while len(saving) > jobs * 2:
+                finish(*saving.popleft())
+
+        while next_input < total or loading:
+            # keep a bounded number of decodes ahead of inference
+            while next_input < total and len(loading) < jobs + batch_size:
+                loading.append((next_input, pool.submit(_load, inputs[next_input])))
+                next_input += 1
+
+            index, future = loading.popleft()
+            try:
+                batch.append((index, future.result()))
+            except Exception as e:
+                fail(inputs[index], e)
+                done += 1
+                report()
+            if len(batch) >= batch_size:
+                flush()
+        flush()
+        while saving:
+            finish(*saving.popleft())
+
+    report(force=True)
+    seconds = time.perf_counter() - started
+    return {"images": total, "failed": failed, "seconds": seconds,
+            "images_per_second": total / seconds if seconds else 0.0}
+
@@ -1,38 +1,207 @@
 import os
+import json
+import shutil
+import hashlib
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
 
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# Point at a mirror (or a local HTTP server in tests) serving the files in MODEL_PARTS
+BASE_URL = os.environ.get(
+    "BACKGROUNDREMOVER_MODEL_BASE_URL", "https://github.com/nadermx/backgroundremover/raw/main/models"
+)
+# Set to "false" to skip checksum verification of the ~/.u2net cache
+VERIFY_MD5 = os.environ.get("BACKGROUNDREMOVER_VERIFY_MD5", "true").lower() == "true"
+DOWNLOAD_WORKERS = int(os.environ.get("BACKGROUNDREMOVER_DOWNLOAD_WORKERS", "4"))
+DOWNLOAD_RETRIES = 3
+CHUNK_SIZE = 1024 * 1024
+
+# Files concatenated, in order, into <model>.pth
+MODEL_PARTS = {
+    "u2net": ["u2aa", "u2ab", "u2ac", "u2ad"],
+    "u2net_human_seg": ["u2haa", "u2hab", "u2hac", "u2had"],
+    "u2netp": ["u2netp.pth"],
+}
+
+# md5 of the assembled checkpoint as published
+MODEL_MD5 = {
+    "u2netp": "e4f636406ca4e2af789941e7f139ee2e",
+    "u2net": "09fb4e49b7f785c9f855baf94916840a",
+    "u2net_human_seg": "347c3d51b01528e5c6c071e3cff1cb55",
+}
+
+
+def md5_file(path):
+    digest = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _sidecar(path):
+    return path + ".md5"
+
+
+def _write_sidecar(path, md5, source_md5):
+    stat = os.stat(path)
+    record = {"md5": md5, "source_md5": source_md5, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    tmp = _sidecar(path) + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(record, f)
+    os.replace(tmp, _sidecar(path))
+
+
+def is_verified(path, model_name, expected=None):
+    """
+    Whether path holds the published weights for model_name. The result is
+    cached in <path>.md5 keyed on size and mtime, so the file is only hashed
+    again after it changes.
+    """
+    if not os.path.exists(path):
+        return False
+    expected = expected or MODEL_MD5.get(model_name)
 
-def download_files_from_github(path, model_name):
-    if model_name not in ["u2net", "u2net_human_seg", "u2netp"]:
-        print("Invalid model name, please use 'u2net' or 'u2net_human_seg' or 'u2netp'")
-        return
-    print(f"downloading model [{model_name}] to {path} ...")
-    urls = []
-    if model_name == "u2net":
-        urls = ['https://github.com/nadermx/backgroundremover/raw/main/models/u2aa',
-                'https://github.com/nadermx/backgroundremover/raw/main/models/u2ab',
-                'https://github.com/nadermx/backgroundremover/raw/main/models/u2ac',
-                'https://github.com/nadermx/backgroundremover/raw/main/models/u2ad']
-    elif model_name == "u2net_human_seg":
-        urls = ['https://github.com/nadermx/backgroundremover/raw/main/models/u2haa',
-                'https://github.com/nadermx/backgroundremover/raw/main/models/u2hab',
-                'https://github.com/nadermx/backgroundremover/raw/main/models/u2hac',
-                'https://github.com/nadermx/backgroundremover/raw/main/models/u2had']
-    elif model_name == 'u2netp':
-        urls = ['https://github.com/nadermx/backgroundremover/raw/main/models/u2netp.pth']
     try:
-        os.makedirs(os.path.expanduser("~/.u2net"), exist_ok=True)
-    except Exception as e:
-        print(f"Error creating directory: {e}")
+        with open(_sidecar(path)) as f:
+            record = json.load(f)
+        stat = os.stat(path)
+        if (record.get("size"), record.get("mtime_ns")) == (stat.st_size, stat.st_mtime_ns):
+            return expected is None or record.get("source_md5") == expected
+    except (OSError, ValueError):
+        record = {}
+
+    md5 = md5_file(path)
+    # record["md5"] is the installed file after format conversion
+    if md5 == expected or (md5 == record.get("md5") and record.get("source_md5") == expected):
+        _write_sidecar(path, md5, expected)
+        return True
+    return False
+
+
+def default_model_path(model_name):
+    return os.path.expanduser(os.path.join("~", ".u2net", model_name + ".pth"))
+
+
+def ensure_model(path, model_name):
+    """
+    Download model_name to path unless a usable file is already there. Files
+    in the default ~/.u2net cache must match the published checksum; weights
+    at an explicitly configured path (U2NET_PATH, U2NETP_PATH) are trusted.
+    """
+    managed = os.path.abspath(os.path.expanduser(path)) == os.path.abspath(default_model_path(model_name))
+    if os.path.exists(path) and not (VERIFY_MD5 and managed):
+        return path
+    if os.path.exists(path) and is_verified(path, model_name):
+        return path
+    if os.path.exists(path):
+        print(f"{path} failed checksum verification, downloading again")
+    return download_files_from_github(path, model_name)
+
+
+def _download_part(url, part_path):
+    """Stream url to part_path, resuming from a previous partial download"""
+    for attempt in range(1, DOWNLOAD_RETRIES + 1):
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+        try:
+            with requests.get(url, headers=headers, stream=True, timeout=60) as response:
+                if response.status_code == 416:
+                    return part_path  # already complete
+                response.raise_for_status()
+                # 200 means the server ignored Range: start over
+                mode = "ab" if response.status_code == 206 else "wb"
+                with open(part_path, mode) as f:
+                    for chunk in response.iter_content(CHUNK_SIZE):
+                        f.write(chunk)
+            return part_path
+        except requests.RequestException as e:
+            if attempt == DOWNLOAD_RETRIES:
+                raise
+            print(f"retrying {url} after error: {e}")
+
+
+def _convert_legacy(path):
+    # Zipfile checkpoints can be memory-mapped (see weights.load_weights)
+    if not zipfile.is_zipfile(path):
+        from .weights import convert_checkpoint
+        convert_checkpoint(path)
+
+
+class _FileLock:
+    """Advisory lock so concurrent processes don't download the same model twice"""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    def __enter__(self):
+        self.file = open(self.path, "w")
+        if fcntl is not None:
+            fcntl.flock(self.file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl is not None:
+            fcntl.flock(self.file, fcntl.LOCK_UN)
+        self.file.close()
+
+
+def download_files_from_github(path, model_name, base_url=None, convert=True, expected_md5=None):
+    """
+    Download model_name to path: parts are streamed in parallel into
+    <path>.parts/ (resumable), joined, checked against expected_md5
+    (default MODEL_MD5), optionally converted to the memory-mappable format
+    and renamed into place, so path only ever holds complete, verified weights.
+    """
+    if model_name not in MODEL_PARTS:
+        print("Invalid model name, please use 'u2net' or 'u2net_human_seg' or 'u2netp'")
         return
+    path = os.path.abspath(os.path.expanduser(path))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
 
-    try:
+    with _FileLock(path + ".lock"):
+        expected = expected_md5 or MODEL_MD5[model_name]
+        # Another process may have finished while we waited for the lock
+        if is_verified(path, model_name, expected):
+            return path
+
+        base_url = (base_url or BASE_URL).rstrip("/")
+        urls = [f"{base_url}/{part}" for part in MODEL_PARTS[model_name]]
+        parts_dir = path + ".parts"
+        os.makedirs(parts_dir, exist_ok=True)
+        part_paths = [os.path.join(parts_dir, f"part{i}") for i in range(len(urls))]
+
+        print(f"downloading model [{model_name}] to {path} ({len(urls)} part(s)) ...")
+        with ThreadPoolExecutor(max_workers=max(1, min(DOWNLOAD_WORKERS, len(urls)))) as pool:
+            list(pool.map(_download_part, urls, part_paths))
+
+        tmp = path + ".tmp"
+        digest = hashlib.md5()
+        with open(tmp, "wb") as out_file:
+            for part_path in part_paths:
+                with open(part_path, "rb") as part:
+                    for chunk in iter(lambda: part.read(CHUNK_SIZE), b""):
+                        digest.update(chunk)
+                        out_file.write(chunk)
+
+        source_md5 = digest.hexdigest()
+        if source_md5 != expected:
+            os.remove(tmp)
+            # A corrupt part can't be resumed; fetch everything again next time
+            shutil.rmtree(parts_dir, ignore_errors=True)
+            raise ValueError(f"checksum mismatch for {model_name}: got {source_md5}, expected {expected}")
 
-        with open(path, 'wb') as out_file:
-            for i, url in enumerate(urls):
-                print(f'downloading part {i+1} of {model_name}')
-                part_content = requests.get(url)
-                out_file.write(part_content.content)
-                print(f'finished downloading part {i+1} of {model_name}')
-    except Exception as e:
-        print(e)
+        if convert:
+            _convert_legacy(tmp)
+        os.replace(tmp, path)
+        _write_sidecar(path, md5_file(path) if convert else source_md5, source_md5)
+        shutil.rmtree(parts_dir, ignore_errors=True)
+        print(f"finished downloading {model_name}")
+        return path
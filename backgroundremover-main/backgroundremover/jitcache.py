@@ -0,0 +1,70 @@
+import os
+import json
+import hashlib
+
+import torch
+
+from .bg import DEVICE, Net, model_path
+
+# Set to "false" to trace in every worker instead of reusing modules from disk
+JIT_CACHE = os.environ.get("BACKGROUNDREMOVER_JIT_CACHE", "true").lower() == "true"
+JIT_CACHE_DIR = os.environ.get(
+    "BACKGROUNDREMOVER_JIT_CACHE_DIR", os.path.expanduser(os.path.join("~", ".u2net", "jit"))
+)
+
+
+def cache_key(model_name, weights, example_shape, device=DEVICE):
+    """
+    Name of the cached module for model_name traced on example_shape. The
+    weights file's size and mtime are part of the key, since the frozen
+    module carries the weights as constants.
+    """
+    stat = os.stat(weights)
+    fields = {
+        "model": model_name,
+        "weights": [os.path.abspath(weights), stat.st_size, stat.st_mtime_ns],
+        "shape": list(example_shape),
+        "device": torch.device(device).type,
+        "torch": torch.__version__,
+    }
+    digest = hashlib.sha1(json.dumps(fields, sort_keys=True).encode()).hexdigest()[:16]
+    batch, height, width = example_shape[:3]
+    return F"{model_name}-b{batch}-{width}x{height}-{digest}.pt"
+
+
+def trace(model_name, example_shape, device=DEVICE):
+    """Net(model_name) traced on a float batch of example_shape (n, h, w, 3) and frozen for inference"""
+    net = Net(model_name)
+    example = torch.zeros(example_shape, dtype=torch.float32, device=device)
+    with torch.no_grad():
+        traced = torch.jit.trace(net, example)
+    return torch.jit.freeze(traced.eval())
+
+
+def load_traced(model_name, example_shape, device=DEVICE, cache_dir=None):
+    """
+    Frozen TorchScript module for model_name, loaded from cache_dir (default
+    BACKGROUNDREMOVER_JIT_CACHE_DIR) when a matching one was saved by an
+    earlier run, otherwise traced and saved for the next one.
+    """
+    if not JIT_CACHE:
+        return trace(model_name, example_shape, device)
+
+    cache_dir = cache_dir or JIT_CACHE_DIR
+    path = os.path.join(cache_dir, cache_key(model_name, model_path(model_name), example_shape, device))
+    if os.path.exists(path):
+        try:
+            return torch.jit.load(path, map_location=device)
+        except (RuntimeError, OSError) as e:
+            print(F"ignoring unreadable cached module {path}: {e}")
+
+    module = trace(model_name, example_shape, device)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # workers tracing the same key race here; each rename is atomic
+        tmp = F"{path}.{os.getpid()}.tmp"
+        torch.jit.save(module, tmp)
+        os.replace(tmp, path)
+    except OSError as e:
+        print(F"could not cache traced module in {cache_dir}: {e}")
+    return module
@@ -0,0 +1,76 @@
+import io
+import os
+import time
+import secrets
+import pstats
+import cProfile
+import threading
+
+# torch.profiler is process-wide: a second profile running at the same time
+# would fail to start or record the first one's ops into its trace
+_profile_lock = threading.Lock()
+
+
+class ProfilerBusy(RuntimeError):
+    pass
+
+
+def new_artifact_id():
+    return time.strftime("%Y%m%d-%H%M%S") + "-" + secrets.token_hex(4)
+
+
+def profile_call(fn, *args, profile_dir="profiles", torch_trace=True, wait=True, **kwargs):
+    """
+    Run fn(*args, **kwargs) under cProfile (and torch.profiler when available)
+    and write the results to profile_dir/<artifact_id>/:
+
+        cprofile.prof     - raw stats, open with snakeviz or pstats
+        cprofile.txt      - top functions by cumulative time
+        torch_trace.json  - chrome://tracing / Perfetto trace of torch ops
+
+    Only the calling thread is profiled, and one profile runs at a time:
+    concurrent calls wait for it, or raise ProfilerBusy with wait=False.
+    Returns (result, artifact_id).
+    """
+    if not _profile_lock.acquire(blocking=wait):
+        raise ProfilerBusy("another profile is already running")
+    try:
+        return _profile_call(fn, args, kwargs, profile_dir, torch_trace)
+    finally:
+        _profile_lock.release()
+
+
+def _profile_call(fn, args, kwargs, profile_dir, torch_trace):
+    artifact_id = new_artifact_id()
+    artifact_dir = os.path.join(profile_dir, artifact_id)
+    os.makedirs(artifact_dir, exist_ok=True)
+
+    torch_profiler = None
+    if torch_trace:
+        try:
+            from torch.profiler import profile, ProfilerActivity
+            torch_profiler = profile(activities=[ProfilerActivity.CPU], record_shapes=True)
+        except Exception as e:
+            print(f"torch.profiler unavailable, skipping trace: {e}")
+
+    profiler = cProfile.Profile()
+    if torch_profiler is not None:
+        torch_profiler.__enter__()
+    try:
+        profiler.enable()
+        try:
+            result = fn(*args, **kwargs)
+        finally:
+            profiler.disable()
+    finally:
+        if torch_profiler is not None:
+            torch_profiler.__exit__(None, None, None)
+            torch_profiler.export_chrome_trace(os.path.join(artifact_dir, "torch_trace.json"))
+
+        profiler.dump_stats(os.path.join(artifact_dir, "cprofile.prof"))
+        summary = io.StringIO()
+        pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(50)
+        with open(os.path.join(artifact_dir, "cprofile.txt"), "w") as f:
+            f.write(summary.getvalue())
+
+    return result, artifact_id
@@ -0,0 +1,15 @@
+import time
+from contextlib import contextmanager
+
+
+@contextmanager
+def stage(timings, name):
+    """Add the wall time of the block to timings[name]; no-op when timings is None"""
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
@@ -5,7 +5,6 @@ import random
 
 import numpy as np
 import torch
-from skimage import color, io, transform
 from torch.utils.data import DataLoader, Dataset
 
 
@@ -16,6 +15,7 @@ class RescaleT(object):
         self.output_size = output_size
 
     def __call__(self, sample):
+        from skimage import transform
         imidx, image, label = sample["imidx"], sample["image"], sample["label"]
 
         h, w = image.shape[:2]
@@ -54,6 +54,7 @@ class Rescale(object):
         self.output_size = output_size
 
     def __call__(self, sample):
+        from skimage import transform
         imidx, image, label = sample["imidx"], sample["image"], sample["label"]
 
         if random.random() >= 0.5:
@@ -155,6 +156,7 @@ class ToTensorLab(object):
         self.flag = flag
 
     def __call__(self, sample):
+        from skimage import color
 
         imidx, image, label = sample["imidx"], sample["image"], sample["label"]
 
@@ -291,6 +293,7 @@ class SalObjDataset(Dataset):
         return len(self.image_name_list)
 
     def __getitem__(self, idx):
+        from skimage import io
 
         # image = Image.open(self.image_name_list[idx])#io.imread(self.image_name_list[idx])
         # label = Image.open(self.label_name_list[idx])#io.imread(self.label_name_list[idx])
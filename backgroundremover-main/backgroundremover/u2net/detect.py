@@ -3,17 +3,15 @@ import os
 import sys
 import numpy as np
 import torch
-from hsh.library.hash import Hasher
 from PIL import Image
-from torchvision import transforms
 
 from . import data_loader, u2net
-from .. import github
+from .. import github, weights
+from ..timing import stage
 
 
-def load_model(model_name: str = "u2net"):
-    hasher = Hasher()
-
+def load_model(model_name: str = "u2net", model_path: str = None):
+    """Load a U2Net variant; model_path overrides the U2NET(P)_PATH / ~/.u2net lookup"""
     model = {
         'u2netp': (u2net.U2NETP,
                    'e4f636406ca4e2af789941e7f139ee2e',
@@ -30,64 +28,36 @@ def load_model(model_name: str = "u2net"):
     }[model_name]
 
     if model_name == "u2netp":
-        net = u2net.U2NETP(3, 1)
-        path = os.environ.get(
+        net_cls = u2net.U2NETP
+        path = model_path or os.environ.get(
             "U2NETP_PATH",
             os.path.expanduser(os.path.join("~", ".u2net", model_name + ".pth")),
         )
-        if (
-            not os.path.exists(path)
-            #or hasher.md5(path) != "e4f636406ca4e2af789941e7f139ee2e"
-        ):
-            github.download_files_from_github(
-                path, model_name
-            )
+        github.ensure_model(path, model_name)
 
     elif model_name == "u2net":
-        net = u2net.U2NET(3, 1)
-        path = os.environ.get(
+        net_cls = u2net.U2NET
+        path = model_path or os.environ.get(
             "U2NET_PATH",
             os.path.expanduser(os.path.join("~", ".u2net", model_name + ".pth")),
         )
 
-        print(f"DEBUG: path to be checked: {path}")
-
-        if (
-            not os.path.exists(path)
-            #or hasher.md5(path) != "09fb4e49b7f785c9f855baf94916840a"
-        ):
-            github.download_files_from_github(
-                path, model_name
-            )
+        github.ensure_model(path, model_name)
 
     elif model_name == "u2net_human_seg":
-        net = u2net.U2NET(3, 1)
-        path = os.environ.get(
+        net_cls = u2net.U2NET
+        path = model_path or os.environ.get(
             "U2NET_PATH",
             os.path.expanduser(os.path.join("~", ".u2net", model_name + ".pth")),
         )
-        if (
-            not os.path.exists(path)
-            #or hasher.md5(path) != "347c3d51b01528e5c6c071e3cff1cb55"
-        ):
-            github.download_files_from_github(
-                path, model_name
-            )
+        github.ensure_model(path, model_name)
 
     else:
         print("Choose between u2net, u2net_human_seg or u2netp", file=sys.stderr)
 
     try:
-        if torch.cuda.is_available():
-            net.load_state_dict(torch.load(path))
-            net.to(torch.device("cuda"))
-        else:
-            net.load_state_dict(
-                torch.load(
-                    path,
-                    map_location="cpu",
-                )
-            )
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+        net = weights.build_model(lambda: net_cls(3, 1), path, device=device)
     except FileNotFoundError:
         raise FileNotFoundError(
             errno.ENOENT, os.strerror(errno.ENOENT), model_name + ".pth"
@@ -121,18 +91,18 @@ def preprocess(image):
         image = image[:, :, np.newaxis]
         label = label[:, :, np.newaxis]
 
-    transform = transforms.Compose(
-        [data_loader.RescaleT(320), data_loader.ToTensorLab(flag=0)]
-    )
-    sample = transform({"imidx": np.array([0]), "image": image, "label": label})
+    # Same as transforms.Compose([RescaleT(320), ToTensorLab(flag=0)]) without importing torchvision
+    sample = {"imidx": np.array([0]), "image": image, "label": label}
+    sample = data_loader.ToTensorLab(flag=0)(data_loader.RescaleT(320)(sample))
 
     return sample
 
 
-def predict(net, item):
-    sample = preprocess(item)
+def predict(net, item, timings=None):
+    with stage(timings, "preprocess"):
+        sample = preprocess(item)
 
-    with torch.no_grad():
+    with torch.no_grad(), stage(timings, "inference"):
 
         if torch.cuda.is_available():
             inputs_test = torch.cuda.FloatTensor(
@@ -154,3 +124,21 @@ def predict(net, item):
         torch.cuda.empty_cache() if torch.cuda.is_available() else None
 
         return img
+
+
+def predict_many(net, samples):
+    """
+    Masks for several preprocess()ed images in one forward pass, each
+    normalised on its own as in predict()
+    """
+    with torch.no_grad():
+        inputs = torch.stack([sample["image"] for sample in samples]).float()
+        if torch.cuda.is_available():
+            inputs = inputs.cuda()
+
+        pred = net(inputs)[0][:, 0, :, :]
+        mi = pred.amin(dim=(1, 2), keepdim=True)
+        ma = pred.amax(dim=(1, 2), keepdim=True)
+        pred = ((pred - mi) / (ma - mi)).cpu().numpy()
+
+        return [Image.fromarray(p * 255).convert("RGB") for p in pred]
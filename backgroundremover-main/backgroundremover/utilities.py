@@ -1,12 +1,15 @@
 import os
+import json
 import math
+import shutil
 import torch.multiprocessing as multiprocessing
 import subprocess as sp
-import time
-import ffmpeg
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import torch
-from .bg import DEVICE, Net, iter_frames, remove_many
+from .bg import DEVICE
+from .jitcache import load_traced
+from .videoio import FrameReader, concat_copy, parse_frame_rate, probe, scaled_size, split_at_keyframes
 import tempfile
 import requests
 from pathlib import Path
@@ -14,163 +17,449 @@ from pathlib import Path
 multiprocessing.set_start_method('spawn', force=True)
 
 
+class FrameRing:
+    """
+    Preallocated frame slots in shared memory. Frame i lives in slot
+    i % slots; held[slot] is the frame a slot currently holds (-1 when free)
+    and is guarded by a condition, so producers and consumers block until
+    a slot changes hands instead of polling.
+    """
+
+    def __init__(self, slots, shape):
+        self.slots = slots
+        self.data = torch.zeros((slots,) + tuple(shape), dtype=torch.uint8).share_memory_()
+        self.held = multiprocessing.RawArray('q', [-1] * slots)
+        # number of frames in the stream, once the producer knows it
+        self.count = multiprocessing.RawValue('q', -1)
+        self.cond = multiprocessing.Condition()
+
+    def _end(self, stop):
+        return stop if self.count.value < 0 else min(stop, self.count.value)
+
+    def wait_free(self, start, stop):
+        """Block until frames [start, stop) can be written; returns the first slot"""
+        with self.cond:
+            self.cond.wait_for(lambda: all(self.held[i % self.slots] == -1 for i in range(start, stop)))
+        return start % self.slots
+
+    def publish(self, start, stop):
+        with self.cond:
+            for i in range(start, stop):
+                self.held[i % self.slots] = i
+            self.cond.notify_all()
+
+    def wait_ready(self, start, stop, timeout=None):
+        """
+        Block until frames [start, stop) are in the ring. Returns how many of
+        them exist (fewer at the end of the stream), or None on timeout.
+        """
+        def ready():
+            return all(self.held[i % self.slots] == i for i in range(start, self._end(stop)))
+
+        with self.cond:
+            if not self.cond.wait_for(ready, timeout):
+                return None
+            return max(0, self._end(stop) - start)
+
+    def release(self, start, stop):
+        with self.cond:
+            for i in range(start, stop):
+                self.held[i % self.slots] = -1
+            self.cond.notify_all()
+
+    def close(self, count):
+        with self.cond:
+            self.count.value = count
+            self.cond.notify_all()
+
+
+class TemporalReuse:
+    """
+    Options for skipping inference on near-static video. A frame reuses the
+    mask of the last frame the model ran on when their downscaled mean
+    absolute difference (0-1) is below threshold, for at most
+    keyframe_interval frames in a row. smoothing is the weight given to
+    the previous output mask (0 disables the exponential moving average).
+    """
+
+    def __init__(self, threshold=0.01, keyframe_interval=10, smoothing=0.0):
+        self.threshold = threshold
+        self.keyframe_interval = keyframe_interval
+        self.smoothing = smoothing
+
+    def thumbnail(self, frames):
+        # every 8th pixel of the 320 px frames, grayscale, 0-1
+        return frames[:, ::8, ::8].to(dtype=torch.float32).mean(dim=-1) / 255
+
+
 def worker(worker_nodes,
            worker_index,
-           result_dict,
+           frames,
+           results,
            model_name,
            gpu_batchsize,
            total_frames,
-           frames_dict):
+           temporal=None,
+           inferred=None,
+           threads=0):
     print(F"WORKER {worker_index} ONLINE")
-
-    output_index = worker_index + 1
-    base_index = worker_index * gpu_batchsize
-    net = Net(model_name)
-    script_net = None
-    for fi in (list(range(base_index + i * worker_nodes * gpu_batchsize,
-                          min(base_index + i * worker_nodes * gpu_batchsize + gpu_batchsize, total_frames)))
-               for i in range(math.ceil(total_frames / worker_nodes / gpu_batchsize))):
-        if not fi:
+    if threads:
+        # intra-op threads per worker; the default (all cores) oversubscribes with several workers
+        torch.set_num_threads(threads)
+
+    # traced once per model, batch size and frame size, then reused from disk
+    script_net = load_traced(model_name, (gpu_batchsize, *frames.data.shape[1:]))
+    # thumbnail and mask of the last frame inference ran on
+    reference = None
+    reused_in_a_row = 0
+    for start in range(worker_index * gpu_batchsize, total_frames, worker_nodes * gpu_batchsize):
+        # rings hold a whole number of batches, so a batch is a contiguous run of slots
+        count = frames.wait_ready(start, min(start + gpu_batchsize, total_frames))
+        if not count:
             break
-
-        # are we processing frames faster than the frame ripper is saving them?
-        last = fi[-1]
-        while last not in frames_dict:
-            time.sleep(0.1)
-
-        input_frames = [frames_dict[index] for index in fi]
-        if script_net is None:
-            script_net = torch.jit.trace(net,
-                                         torch.as_tensor(np.stack(input_frames), dtype=torch.float32, device=DEVICE))
-
-        result_dict[output_index] = remove_many(input_frames, script_net)
-
-        # clean up the frame buffer
-        for fdex in fi:
-            del frames_dict[fdex]
-        output_index += worker_nodes
-
-
-def capture_frames(file_path, frames_dict, prefetched_samples, total_frames):
+        stop = start + count
+
+        slot = start % frames.slots
+        batch = frames.data[slot:slot + count]
+        # source[j] is the batch index whose mask frame j gets, or -1 for the reference mask
+        source = list(range(count))
+        if temporal is not None:
+            thumbnails = temporal.thumbnail(batch)
+            last_thumbnail = reference[0] if reference is not None else None
+            last_source = -1
+            for j in range(count):
+                if (last_thumbnail is not None
+                        and reused_in_a_row < temporal.keyframe_interval
+                        and (thumbnails[j] - last_thumbnail).abs().mean() < temporal.threshold):
+                    source[j] = last_source
+                    reused_in_a_row += 1
+                else:
+                    last_thumbnail, last_source = thumbnails[j], j
+                    reused_in_a_row = 0
+        selected = sorted(set(j for j in source if j >= 0))
+        if len(selected) < count:
+            batch = batch[selected]
+        batch = batch.to(device=DEVICE, dtype=torch.float32)
+        frames.release(start, stop)
+
+        if selected:
+            with torch.no_grad():
+                masks = script_net(batch)
+        if inferred is not None:
+            with inferred.get_lock():
+                inferred.value += len(selected)
+
+        slot = results.wait_free(start, stop)
+        for j in range(count):
+            if source[j] >= 0:
+                results.data[slot + j] = masks[selected.index(source[j])]
+            else:
+                results.data[slot + j] = reference[1]
+        results.publish(start, stop)
+
+        if selected and temporal is not None:
+            last = selected[-1]
+            reference = (thumbnails[last], masks[len(selected) - 1].clone())
+
+
+def capture_frames(file_path, frames, results, total_frames):
     print(F"WORKER FRAMERIPPER ONLINE")
-    for idx, frame in enumerate(iter_frames(file_path)):
-        frames_dict[idx] = frame
-        while len(frames_dict) > prefetched_samples:
-            time.sleep(0.1)
-        if idx > total_frames:
-            break
-
-
-def matte_key(output, file_path,
-              worker_nodes,
-              gpu_batchsize,
-              model_name,
-              frame_limit=-1,
-              prefetched_batches=4,
-              framerate=-1):
-    manager = multiprocessing.Manager()
-
-    results_dict = manager.dict()
-    frames_dict = manager.dict()
-
-
-    info = ffmpeg.probe(file_path)
-    cmd = [
-        "ffprobe",
-        "-v",
-        "error",
-        "-select_streams",
-        "v:0",
-        "-count_packets",
-        "-show_entries",
-        "stream=nb_read_packets",
-        "-of",
-        "csv=p=0",
-        file_path
-    ]
-    framerate_output = sp.check_output(cmd, universal_newlines=True)
-
-    total_frames = int(framerate_output.split(",")[0])
+    height, width = frames.data.shape[1:3]
+    count = 0
+    with FrameReader(file_path, (width, height), limit=total_frames) as reader:
+        for idx in range(total_frames):
+            slot = frames.wait_free(idx, idx + 1)
+            # decode straight into shared memory
+            if not reader.read_into(frames.data[slot].numpy()):
+                break
+            frames.publish(idx, idx + 1)
+            count = idx + 1
+    frames.close(count)
+    results.close(count)
+
+
+def mask_input_args(width, height, framerate):
+    """ffmpeg input options for raw gray masks written to its stdin"""
+    return ['-f', 'rawvideo',
+            '-vcodec', 'rawvideo',
+            '-s', F"{width}x{height}",
+            '-pix_fmt', 'gray',
+            '-r', F"{framerate}",
+            '-i', '-']
+
+
+def run_matte_pipeline(file_path,
+                       worker_nodes,
+                       gpu_batchsize,
+                       model_name,
+                       open_sink,
+                       frame_limit=-1,
+                       prefetched_batches=4,
+                       framerate=-1,
+                       temporal=None,
+                       progress=None,
+                       threads=0):
+    """
+    Decode file_path, run the model over every frame (or, with a
+    TemporalReuse, the frames that changed) and write the masks, in order,
+    to the stdin of the ffmpeg process that open_sink(width, height,
+    framerate) starts. progress(frames_written, total_frames) is called
+    after every mask. threads sets torch's thread count in each worker (0
+    leaves torch's default). Returns frame counts.
+    """
+    info = probe(file_path)
+
+    total_frames = info["frames"]
     if frame_limit != -1:
         total_frames = min(frame_limit, total_frames)
 
-    video_stream = next((s for s in info["streams"] if s["codec_type"] == "video"), None)
-    if not video_stream:
-        raise Exception("Could not find video stream")
-
-    frame_rate_str = video_stream.get("r_frame_rate", "0/0")
+    frame_rate_str = info["frame_rate"]
     if frame_rate_str == "0/0":
         raise Exception("Could not detect framerate of video")
 
     if framerate == -1:
         print(F"FRAME RATE DETECTED: {frame_rate_str} (if this looks wrong, override the frame rate)")
-        framerate = math.ceil(eval(frame_rate_str))
+        framerate = math.ceil(parse_frame_rate(frame_rate_str))
 
     print(F"FRAME RATE: {framerate} TOTAL FRAMES: {total_frames}")
 
-    p = multiprocessing.Process(target=capture_frames,
-                                args=(file_path, frames_dict, gpu_batchsize * prefetched_batches, total_frames))
+    width, height = scaled_size(info["width"], info["height"], 320)
+    slots = gpu_batchsize * max(prefetched_batches, worker_nodes)
+    frames = FrameRing(slots, (height, width, 3))
+    results = FrameRing(slots, (height, width))
+
+    inferred = multiprocessing.Value('q', 0)
+
+    p = multiprocessing.Process(target=capture_frames, args=(file_path, frames, results, total_frames))
     p.start()
 
     # note I am deliberately not using pool
     # we can't trust it to run all the threads concurrently (or at all)
     workers = [multiprocessing.Process(target=worker,
-                                       args=(worker_nodes, wn, results_dict, model_name, gpu_batchsize, total_frames,
-                                             frames_dict))
+                                       args=(worker_nodes, wn, frames, results, model_name, gpu_batchsize,
+                                             total_frames, temporal, inferred, threads))
                for wn in range(worker_nodes)]
     for w in workers:
         w.start()
 
-    command = None
-    proc = None
+    proc = open_sink(width, height, framerate)
+
+    smoothing = temporal.smoothing if temporal is not None else 0
+    smoothed = None
     frame_counter = 0
-    for i in range(math.ceil(total_frames / worker_nodes)):
-        for wx in range(worker_nodes):
-
-            hash_index = i * worker_nodes + 1 + wx
-
-            while hash_index not in results_dict:
-                time.sleep(0.1)
-
-            frames = results_dict[hash_index]
-            # dont block access to it anymore
-            del results_dict[hash_index]
-
-            for frame in frames:
-                if command is None:
-                    command = ['ffmpeg',
-                               '-y',
-                               '-f', 'rawvideo',
-                               '-vcodec', 'rawvideo',
-                               '-s', F"{frame.shape[1]}x320",
-                               '-pix_fmt', 'gray',
-                               '-r', F"{framerate}",
-                               '-i', '-',
-                               '-an',
-                               '-vcodec', 'mpeg4',
-                               '-b:v', '2000k',
-                               '%s' % output]
-
-                    proc = sp.Popen(command, stdin=sp.PIPE)
-
-                proc.stdin.write(frame.tostring())
-                frame_counter = frame_counter + 1
-
-                if frame_counter >= total_frames:
-                    p.join()
-                    for w in workers:
-                        w.join()
-                    proc.stdin.close()
-                    proc.wait()
-                    print(F"FINISHED ALL FRAMES ({total_frames})!")
-                    return
+    while frame_counter < total_frames:
+        available = results.wait_ready(frame_counter, frame_counter + 1, timeout=1)
+        if available is None:
+            # a crashed child would otherwise leave us waiting forever
+            failed = [c for c in [p] + workers if c.exitcode not in (None, 0)]
+            if failed:
+                proc.stdin.close()
+                proc.wait()
+                for c in [p] + workers:
+                    c.terminate()
+                raise RuntimeError(F"video worker exited with code {failed[0].exitcode}")
+            continue
+        if not available:
+            break  # the video had fewer frames than ffprobe counted
+
+        slot = frame_counter % results.slots
+        mask = results.data[slot].numpy()
+        if smoothing:
+            # masks arrive in order here, whichever worker made them
+            current = mask.astype(np.float32)
+            smoothed = current if smoothed is None else smoothing * smoothed + (1 - smoothing) * current
+            mask = smoothed.round().astype(np.uint8)
+        try:
+            proc.stdin.write(memoryview(mask))
+        except BrokenPipeError:
+            # ffmpeg stopped reading: fine if it finished early (e.g. -shortest against
+            # a shorter overlay), an error otherwise; its exit code below tells which
+            for c in [p] + workers:
+                c.terminate()
+            break
+        results.release(frame_counter, frame_counter + 1)
+        frame_counter = frame_counter + 1
+        if progress is not None:
+            progress(frame_counter, total_frames)
 
     p.join()
     for w in workers:
         w.join()
-    proc.stdin.close()
-    proc.wait()
-    return
+    try:
+        proc.stdin.close()
+    except BrokenPipeError:
+        pass
+    if proc.wait() != 0:
+        raise sp.CalledProcessError(proc.returncode, proc.args)
+    print(F"FINISHED ALL FRAMES ({frame_counter})!")
+
+    stats = {"frames": frame_counter, "inferred": inferred.value}
+    # workers run ahead of the writer, so after an early stop they may have inferred more than was written
+    stats["skipped_fraction"] = max(0.0, 1 - stats["inferred"] / frame_counter) if frame_counter else 0.0
+    if temporal is not None:
+        print(F"INFERENCE SKIPPED ON {frame_counter - inferred.value}/{frame_counter} FRAMES "
+              F"({stats['skipped_fraction']:.1%})")
+    return stats
+
+
+def matte_key(output, file_path,
+              worker_nodes,
+              gpu_batchsize,
+              model_name,
+              frame_limit=-1,
+              prefetched_batches=4,
+              framerate=-1,
+              temporal=None,
+              segments=1,
+              segment_dir=None,
+              progress=None,
+              threads=0):
+    if segments > 1:
+        return matte_key_segmented(output, file_path, worker_nodes, gpu_batchsize, model_name, segments,
+                                   frame_limit, prefetched_batches, framerate, temporal, segment_dir, progress,
+                                   threads)
+
+    def open_sink(width, height, rate):
+        command = ['ffmpeg', '-y', *mask_input_args(width, height, rate),
+                   '-an',
+                   '-vcodec', 'mpeg4',
+                   '-b:v', '2000k',
+                   '%s' % output]
+        return sp.Popen(command, stdin=sp.PIPE)
+
+    return run_matte_pipeline(file_path, worker_nodes, gpu_batchsize, model_name, open_sink,
+                              frame_limit, prefetched_batches, framerate, temporal, progress, threads)
+
+
+def _file_identity(path):
+    stat = os.stat(path)
+    return {"path": os.path.abspath(path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def matte_key_segmented(output, file_path,
+                        worker_nodes,
+                        gpu_batchsize,
+                        model_name,
+                        segments,
+                        frame_limit=-1,
+                        prefetched_batches=4,
+                        framerate=-1,
+                        temporal=None,
+                        segment_dir=None,
+                        progress=None,
+                        threads=0):
+    """
+    Split file_path at keyframes into about `segments` pieces, matte the
+    pieces in parallel (each with its own decoder and workers) and join the
+    mattes with a stream copy. Finished pieces are kept in segment_dir
+    (default output + ".segments"), so rerunning the same job after a crash
+    only redoes the unfinished ones.
+    """
+    segment_dir = os.path.abspath(segment_dir or output + ".segments")
+    info = probe(file_path)
+    if framerate == -1:
+        # one rate for every piece, or the mattes won't concatenate cleanly
+        framerate = math.ceil(parse_frame_rate(info["frame_rate"]))
+
+    job = {
+        "source": _file_identity(file_path),
+        "segments": segments,
+        "frame_limit": frame_limit,
+        "framerate": framerate,
+        "model_name": model_name,
+        "temporal": vars(temporal) if temporal is not None else None,
+    }
+    job_file = os.path.join(segment_dir, "job.json")
+    pieces = None
+    if os.path.exists(job_file):
+        with open(job_file) as f:
+            saved = json.load(f)
+        if {k: v for k, v in saved.items() if k != "pieces"} == job:
+            pieces = saved["pieces"]
+            print(F"RESUMING FROM {segment_dir}")
+        else:
+            shutil.rmtree(segment_dir)
+
+    if pieces is None:
+        duration = info["duration"]
+        if frame_limit != -1 and info["frames"]:
+            duration = duration * min(1.0, frame_limit / info["frames"])
+        pieces = split_at_keyframes(file_path, max(duration / segments, 0.001), os.path.join(segment_dir, "source"),
+                                    frame_limit)
+        pieces = [os.path.relpath(piece, segment_dir) for piece in pieces]
+        tmp = job_file + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(dict(job, pieces=pieces), f)
+        os.replace(tmp, job_file)
+
+    mattes = [os.path.join(segment_dir, "matte_%03d.mp4" % index) for index in range(len(pieces))]
+    total_frames = min(frame_limit, info["frames"]) if frame_limit != -1 else info["frames"]
+    # frames written per piece, summed into one count for progress
+    written = {}
+
+    def piece_progress(index):
+        def update(frames, _):
+            written[index] = frames
+            progress(sum(written.values()), total_frames)
+        return update if progress is not None else None
+
+    def matte_piece(index):
+        partial = os.path.join(segment_dir, "matte_%03d.partial.mp4" % index)
+        stats = matte_key(partial, os.path.join(segment_dir, pieces[index]), worker_nodes, gpu_batchsize, model_name,
+                          prefetched_batches=prefetched_batches, framerate=framerate, temporal=temporal,
+                          progress=piece_progress(index), threads=threads)
+        # a piece only counts as done once its matte is complete
+        os.replace(partial, mattes[index])
+        return stats
+
+    todo = [index for index in range(len(pieces)) if not os.path.exists(mattes[index])]
+    print(F"SEGMENTS: {len(pieces)} ({len(pieces) - len(todo)} ALREADY DONE)")
+    # each piece runs its own frame ripper and workers; threads only drive them
+    with ThreadPoolExecutor(max_workers=max(1, min(segments, len(todo)))) as pool:
+        futures = [pool.submit(matte_piece, index) for index in todo]
+    errors = [future.exception() for future in futures if future.exception() is not None]
+    if errors:
+        raise RuntimeError(F"{len(errors)} of {len(todo)} segments failed, rerun to resume: {errors[0]}")
+
+    concat_copy(mattes, output)
+    shutil.rmtree(segment_dir)
+    print(F"FINISHED ALL SEGMENTS ({len(pieces)})!")
+
+    # counts cover the segments processed by this call, not ones resumed from disk
+    frames = sum(future.result()["frames"] for future in futures)
+    inferred = sum(future.result()["inferred"] for future in futures)
+    return {"frames": frames, "inferred": inferred, "skipped_fraction": 1 - inferred / frames if frames else 0.0}
+
+
+def composite_streaming(output, file_path, before_inputs, after_inputs, filter_args,
+                        worker_nodes,
+                        gpu_batchsize,
+                        model_name,
+                        frame_limit=-1,
+                        prefetched_batches=4,
+                        framerate=-1,
+                        temporal=None,
+                        progress=None,
+                        threads=0):
+    """
+    Single pass: masks go straight into the compositing ffmpeg as a raw
+    input on stdin, so the matte is never encoded to a temp file and read
+    back. Inputs are before_inputs, then the masks, then after_inputs.
+    """
+    def open_sink(width, height, rate):
+        command = ['ffmpeg', '-y', *before_inputs, *mask_input_args(width, height, rate), *after_inputs,
+                   *filter_args, output]
+        return sp.Popen(command, stdin=sp.PIPE)
+
+    stats = run_matte_pipeline(file_path, worker_nodes, gpu_batchsize, model_name, open_sink,
+                               frame_limit, prefetched_batches, framerate, temporal, progress, threads)
+    print("Process finished")
+    return stats
+
+
+def _check_segments(streaming, segments):
+    if streaming and segments > 1:
+        raise ValueError("streaming writes a single pass over the input and can't be split into segments")
 
 
 def transparentgif(output, file_path,
@@ -179,7 +468,22 @@ def transparentgif(output, file_path,
                    model_name,
                    frame_limit=-1,
                    prefetched_batches=4,
-                   framerate=-1):
+                   framerate=-1,
+                   streaming=False,
+                   temporal=None,
+                   segments=1,
+                   progress=None,
+                   threads=0):
+    _check_segments(streaming, segments)
+    if streaming:
+        composite_streaming(output, file_path, ['-i', file_path], [],
+                            ['-filter_complex',
+                             '[1][0]scale2ref[mask][main];[main][mask]alphamerge=shortest=1,fps=10,split[s0][s1];[s0]palettegen[p];[s1][p]paletteuse',
+                             '-shortest'],
+                            worker_nodes, gpu_batchsize, model_name,
+                            frame_limit, prefetched_batches, framerate, temporal=temporal, progress=progress,
+                            threads=threads)
+        return
     temp_dir = tempfile.TemporaryDirectory()
     tmpdirname = Path(temp_dir.name)
     temp_file = os.path.abspath(os.path.join(tmpdirname, "matte.mp4"))
@@ -189,14 +493,19 @@ def transparentgif(output, file_path,
               model_name,
               frame_limit,
               prefetched_batches,
-              framerate)
+              framerate,
+              temporal=temporal,
+              segments=segments,
+              segment_dir=output + ".segments",
+              progress=progress,
+              threads=threads)
     cmd = [
         'ffmpeg', '-y', '-i', file_path, '-i', temp_file, '-filter_complex',
         '[1][0]scale2ref[mask][main];[main][mask]alphamerge=shortest=1,fps=10,split[s0][s1];[s0]palettegen[p];[s1][p]paletteuse',
         '-shortest', output
     ]
 
-    sp.run(cmd)
+    sp.run(cmd, check=True)
 
     print("Process finished")
 
@@ -209,7 +518,22 @@ def transparentgifwithbackground(output, overlay, file_path,
                       model_name,
                       frame_limit=-1,
                       prefetched_batches=4,
-                      framerate=-1):
+                      framerate=-1,
+                      streaming=False,
+                      temporal=None,
+                      segments=1,
+                      progress=None,
+                      threads=0):
+    _check_segments(streaming, segments)
+    if streaming:
+        composite_streaming(output, file_path, ['-i', file_path], ['-i', overlay],
+                            ['-filter_complex',
+                             '[1][0]scale2ref[mask][main];[main][mask]alphamerge=shortest=1[fg];[2][fg]overlay=(main_w-overlay_w)/2:(main_h-overlay_h)/2:format=auto,fps=10,split[s0][s1];[s0]palettegen[p];[s1][p]paletteuse',
+                             '-shortest'],
+                            worker_nodes, gpu_batchsize, model_name,
+                            frame_limit, prefetched_batches, framerate, temporal=temporal, progress=progress,
+                            threads=threads)
+        return
     temp_dir = tempfile.TemporaryDirectory()
     tmpdirname = Path(temp_dir.name)
     temp_file = os.path.abspath(os.path.join(tmpdirname, "matte.mp4"))
@@ -219,14 +543,19 @@ def transparentgifwithbackground(output, overlay, file_path,
               model_name,
               frame_limit,
               prefetched_batches,
-              framerate)
+              framerate,
+              temporal=temporal,
+              segments=segments,
+              segment_dir=output + ".segments",
+              progress=progress,
+              threads=threads)
     print("Starting alphamerge")
     cmd = [
         'ffmpeg', '-y', '-i', file_path, '-i', temp_file, '-i', overlay, '-filter_complex',
         '[1][0]scale2ref[mask][main];[main][mask]alphamerge=shortest=1[fg];[2][fg]overlay=(main_w-overlay_w)/2:(main_h-overlay_h)/2:format=auto,fps=10,split[s0][s1];[s0]palettegen[p];[s1][p]paletteuse',
         '-shortest', output
     ]
-    sp.run(cmd)
+    sp.run(cmd, check=True)
     print("Process finished")
     try:
         temp_dir.cleanup()
@@ -241,7 +570,21 @@ def transparentvideo(output, file_path,
                      model_name,
                      frame_limit=-1,
                      prefetched_batches=4,
-                     framerate=-1):
+                     framerate=-1,
+                     streaming=False,
+                     temporal=None,
+                     segments=1,
+                     progress=None,
+                     threads=0):
+    _check_segments(streaming, segments)
+    if streaming:
+        composite_streaming(output, file_path, ['-i', file_path], [],
+                            ['-filter_complex',
+                             '[1][0]scale2ref[mask][main];[main][mask]alphamerge=shortest=1', '-c:v', 'qtrle', '-shortest'],
+                            worker_nodes, gpu_batchsize, model_name,
+                            frame_limit, prefetched_batches, framerate, temporal=temporal, progress=progress,
+                            threads=threads)
+        return
     temp_dir = tempfile.TemporaryDirectory()
     tmpdirname = Path(temp_dir.name)
     temp_file = os.path.abspath(os.path.join(tmpdirname, "matte.mp4"))
@@ -251,14 +594,19 @@ def transparentvideo(output, file_path,
               model_name,
               frame_limit,
               prefetched_batches,
-              framerate)
+              framerate,
+              temporal=temporal,
+              segments=segments,
+              segment_dir=output + ".segments",
+              progress=progress,
+              threads=threads)
     print("Starting alphamerge")
     cmd = [
         'ffmpeg', '-y', '-i', file_path, '-i', temp_file, '-filter_complex',
         '[1][0]scale2ref[mask][main];[main][mask]alphamerge=shortest=1', '-c:v', 'qtrle', '-shortest', output
     ]
 
-    sp.run(cmd)
+    sp.run(cmd, check=True)
     print("Process finished")
     try:
         temp_dir.cleanup()
@@ -273,7 +621,22 @@ def transparentvideoovervideo(output, overlay, file_path,
                          model_name,
                          frame_limit=-1,
                          prefetched_batches=4,
-                         framerate=-1):
+                         framerate=-1,
+                         streaming=False,
+                         temporal=None,
+                         segments=1,
+                         progress=None,
+                         threads=0):
+    _check_segments(streaming, segments)
+    if streaming:
+        composite_streaming(output, file_path, ['-i', file_path], ['-i', overlay],
+                            ['-filter_complex',
+                             '[1][0]scale2ref[mask][main];[main][mask]alphamerge=shortest=1[vid];[vid][2:v]scale2ref[fg][bg];[bg][fg]overlay=shortest=1[out]',
+                             '-map', '[out]', '-shortest'],
+                            worker_nodes, gpu_batchsize, model_name,
+                            frame_limit, prefetched_batches, framerate, temporal=temporal, progress=progress,
+                            threads=threads)
+        return
     temp_dir = tempfile.TemporaryDirectory()
     tmpdirname = Path(temp_dir.name)
     temp_file = os.path.abspath(os.path.join(tmpdirname, "matte.mp4"))
@@ -283,13 +646,18 @@ def transparentvideoovervideo(output, overlay, file_path,
               model_name,
               frame_limit,
               prefetched_batches,
-              framerate)
+              framerate,
+              temporal=temporal,
+              segments=segments,
+              segment_dir=output + ".segments",
+              progress=progress,
+              threads=threads)
     print("Starting alphamerge")
     cmd = [
         'ffmpeg', '-y', '-i', file_path, '-i', temp_file, '-i', overlay, '-filter_complex',
         '[1][0]scale2ref[mask][main];[main][mask]alphamerge=shortest=1[vid];[vid][2:v]scale2ref[fg][bg];[bg][fg]overlay=shortest=1[out]', '-map', '[out]', '-shortest', output
     ]
-    sp.run(cmd)
+    sp.run(cmd, check=True)
     print("Process finished")
     try:
         temp_dir.cleanup()
@@ -304,9 +672,33 @@ def transparentvideooverimage(output, overlay, file_path,
                          model_name,
                          frame_limit=-1,
                          prefetched_batches=4,
-                         framerate=-1):
+                         framerate=-1,
+                         streaming=False,
+                         temporal=None,
+                         segments=1,
+                         progress=None,
+                         threads=0):
+    _check_segments(streaming, segments)
     temp_dir = tempfile.TemporaryDirectory()
     tmpdirname = Path(temp_dir.name)
+    temp_image = os.path.abspath("%s/new.jpg" % tmpdirname)
+    if streaming:
+        print("Scale image")
+        cmd = [
+            'ffmpeg', '-y', '-i', overlay, '-i', file_path, '-filter_complex',
+            'scale2ref[img][vid];[img]setsar=1;[vid]nullsink', '-q:v', '2', temp_image
+        ]
+        sp.run(cmd, check=True)
+        # the still image loops under the video; the masks are input 2
+        composite_streaming(output, file_path, ['-loop', '1', '-i', temp_image, '-i', file_path], [],
+                            ['-filter_complex',
+                             '[2:v][1:v]scale2ref[mask][main];[main][mask]alphamerge[fg];[0:v][fg]overlay=(W-w)/2:(H-h)/2:shortest=1[out]',
+                             '-map', '[out]', '-shortest'],
+                            worker_nodes, gpu_batchsize, model_name,
+                            frame_limit, prefetched_batches, framerate, temporal=temporal, progress=progress,
+                            threads=threads)
+        temp_dir.cleanup()
+        return
     temp_file = os.path.abspath(os.path.join(tmpdirname, "matte.mp4"))
     matte_key(temp_file, file_path,
               worker_nodes,
@@ -314,21 +706,25 @@ def transparentvideooverimage(output, overlay, file_path,
               model_name,
               frame_limit,
               prefetched_batches,
-              framerate)
+              framerate,
+              temporal=temporal,
+              segments=segments,
+              segment_dir=output + ".segments",
+              progress=progress,
+              threads=threads)
     print("Scale image")
-    temp_image = os.path.abspath("%s/new.jpg" % tmpdirname)
     cmd = [
         'ffmpeg', '-y', '-i', overlay, '-i', file_path, '-filter_complex',
         'scale2ref[img][vid];[img]setsar=1;[vid]nullsink', '-q:v', '2', temp_image
     ]
-    sp.run(cmd)
+    sp.run(cmd, check=True)
     print("Starting alphamerge")
     cmd = [
         'ffmpeg', '-y', '-i', temp_image, '-i', file_path, '-i', temp_file, '-filter_complex',
         '[0:v]scale2ref=oh*mdar:ih[bg];[1:v]scale2ref=oh*mdar:ih[fg];[bg][fg]overlay=(W-w)/2:(H-h)/2:shortest=1[out]',
         '-map', '[out]', '-shortest', output
     ]
-    sp.run(cmd)
+    sp.run(cmd, check=True)
     print("Process finished")
     try:
         temp_dir.cleanup()
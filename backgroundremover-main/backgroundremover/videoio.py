@@ -0,0 +1,172 @@
+import os
+import glob
+import subprocess as sp
+from fractions import Fraction
+
+import ffmpeg
+import numpy as np
+
+
+def count_frames(path):
+    """Count video packets by demuxing the whole file; only used when the container doesn't say"""
+    cmd = [
+        "ffprobe",
+        "-v",
+        "error",
+        "-select_streams",
+        "v:0",
+        "-count_packets",
+        "-show_entries",
+        "stream=nb_read_packets",
+        "-of",
+        "csv=p=0",
+        path
+    ]
+    output = sp.check_output(cmd, universal_newlines=True)
+    return int(output.split(",")[0])
+
+
+def _rotation(stream):
+    rotation = stream.get("tags", {}).get("rotate")
+    for side_data in stream.get("side_data_list", []):
+        if "rotation" in side_data:
+            rotation = side_data["rotation"]
+    return int(float(rotation or 0))
+
+
+def _metadata_frames(stream):
+    # mp4/mov store the count in the stream header, mkv in statistics tags
+    candidates = [stream.get("nb_frames")]
+    candidates += [value for key, value in stream.get("tags", {}).items() if key.startswith("NUMBER_OF_FRAMES")]
+    for value in candidates:
+        try:
+            if int(value) > 0:
+                return int(value)
+        except (TypeError, ValueError):
+            pass
+    return None
+
+
+def probe(path):
+    """
+    Width and height as displayed (ffmpeg applies rotation metadata when
+    decoding), frame rate string and frame count of the first video stream.
+    """
+    info = ffmpeg.probe(path)
+    stream = next((s for s in info["streams"] if s["codec_type"] == "video"), None)
+    if not stream:
+        raise Exception("Could not find video stream")
+
+    width, height = int(stream["width"]), int(stream["height"])
+    if _rotation(stream) % 180 != 0:
+        width, height = height, width
+
+    frames = _metadata_frames(stream)
+    if frames is None:
+        print("Frame count not in container metadata, counting packets")
+        frames = count_frames(path)
+
+    return {
+        "width": width,
+        "height": height,
+        "frame_rate": stream.get("r_frame_rate", "0/0"),
+        "frames": frames,
+        "duration": float(stream.get("duration") or info.get("format", {}).get("duration") or 0),
+    }
+
+
+def parse_frame_rate(frame_rate):
+    return float(Fraction(frame_rate)) if frame_rate != "0/0" else 0.0
+
+
+def scaled_size(width, height, target_height=320):
+    """Size keeping the aspect ratio at target_height, width rounded to even for the encoders"""
+    scaled_width = max(2, int(width * target_height / height) // 2 * 2)
+    return scaled_width, target_height
+
+
+def split_at_keyframes(path, segment_seconds, out_dir, frame_limit=-1):
+    """
+    Stream-copy the first video stream of path into out_dir/segment_NNN.mkv.
+    Each cut lands on the first keyframe after a multiple of
+    segment_seconds, so every piece decodes on its own and nothing is
+    re-encoded. Returns the pieces in order.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    cmd = ["ffmpeg", "-v", "error", "-nostdin", "-y", "-i", path, "-map", "0:v:0", "-c", "copy"]
+    if frame_limit != -1:
+        cmd += ["-frames:v", str(frame_limit)]
+    cmd += ["-f", "segment", "-segment_time", F"{segment_seconds:.3f}", "-reset_timestamps", "1",
+            os.path.join(out_dir, "segment_%03d.mkv")]
+    sp.run(cmd, check=True)
+    return sorted(glob.glob(os.path.join(out_dir, "segment_*.mkv")))
+
+
+def concat_copy(paths, output):
+    """Join videos with identical encoding parameters without re-encoding"""
+    list_file = output + ".concat.txt"
+    with open(list_file, "w") as f:
+        for path in paths:
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            f.write(F"file '{escaped}'\n")
+    try:
+        sp.run(["ffmpeg", "-v", "error", "-nostdin", "-y", "-f", "concat", "-safe", "0", "-i", list_file,
+                "-c", "copy", output], check=True)
+    finally:
+        os.remove(list_file)
+    return output
+
+
+class FrameReader:
+    """
+    Decode a video with ffmpeg, scaled to size in native code, and read
+    fixed-size rgb24 frames from its stdout into caller-provided buffers.
+    """
+
+    def __init__(self, path, size, limit=None):
+        self.width, self.height = size
+        self.frame_bytes = self.width * self.height * 3
+        cmd = [
+            "ffmpeg", "-v", "error", "-nostdin",
+            "-i", path,
+            "-map", "0:v:0",
+            "-vf", F"scale={self.width}:{self.height}",
+            "-f", "rawvideo", "-pix_fmt", "rgb24",
+        ]
+        if limit is not None:
+            cmd += ["-frames:v", str(limit)]
+        cmd.append("-")
+        self.proc = sp.Popen(cmd, stdout=sp.PIPE, bufsize=self.frame_bytes)
+
+    def read_into(self, buffer):
+        """Fill buffer (height x width x 3 uint8, contiguous) with the next frame; False at the end"""
+        view = memoryview(buffer).cast("B")
+        filled = 0
+        while filled < self.frame_bytes:
+            read = self.proc.stdout.readinto(view[filled:])
+            if not read:
+                return False
+            filled += read
+        return True
+
+    def __iter__(self):
+        try:
+            while True:
+                frame = np.empty((self.height, self.width, 3), dtype=np.uint8)
+                if not self.read_into(frame):
+                    return
+                yield frame
+        finally:
+            self.close()
+
+    def close(self):
+        if self.proc.poll() is None:
+            self.proc.kill()
+        self.proc.stdout.close()
+        self.proc.wait()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
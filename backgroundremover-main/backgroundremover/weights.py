@@ -0,0 +1,87 @@
+import os
+import re
+import sys
+import zipfile
+
+import torch
+
+# Set to "false" to read weights into private memory the old way
+MMAP_WEIGHTS = os.environ.get("BACKGROUNDREMOVER_MMAP_WEIGHTS", "true").lower() == "true"
+
+# torch.load(mmap=True), load_state_dict(assign=True) and the torch.device
+# context manager all need torch 2.1; older versions load the old way
+TORCH_VERSION = tuple(int(part) for part in re.findall(r"\d+", torch.__version__)[:2])
+SUPPORTS_MMAP = TORCH_VERSION >= (2, 1)
+
+
+def load_weights(net, path, device="cpu", mmap=None):
+    """
+    Load a state dict from path into net, replacing its parameters.
+
+    With mmap (default) the checkpoint is memory-mapped and the parameters
+    become views of the file, so pages load on demand and are shared through
+    the page cache by every process that maps the same file. Legacy
+    (pre-zipfile) checkpoints and .safetensors files are handled too; the
+    former fall back to a regular load into private memory, as does
+    everything on torch < 2.1, where the weights are copied into net's
+    existing parameters.
+    """
+    if mmap is None:
+        mmap = MMAP_WEIGHTS
+    mmap = mmap and SUPPORTS_MMAP
+
+    if str(path).endswith(".safetensors"):
+        from safetensors.torch import load_file
+        state_dict = load_file(path, device="cpu")
+    elif mmap and zipfile.is_zipfile(path):
+        state_dict = torch.load(path, map_location="cpu", mmap=True, weights_only=True)
+    else:
+        if mmap:
+            print(
+                f"{path} uses the legacy checkpoint format and cannot be memory-mapped; "
+                f"convert it with: python -m backgroundremover.weights {path}",
+                file=sys.stderr,
+            )
+        state_dict = torch.load(path, map_location="cpu")
+
+    if SUPPORTS_MMAP:
+        # assign=True keeps the loaded tensors instead of copying into net's own
+        net.load_state_dict(state_dict, assign=True)
+    else:
+        net.load_state_dict(state_dict)
+    if torch.device(device).type != "cpu":
+        net.to(device)
+    return net
+
+
+def build_model(factory, path, device="cpu", mmap=None):
+    """
+    Construct factory() without allocating its randomly initialised
+    parameters (meta device, torch >= 2.1), then load the weights from path
+    into it. Older torch builds the model normally and copies the weights in.
+    """
+    if SUPPORTS_MMAP:
+        with torch.device("meta"):
+            net = factory()
+    else:
+        net = factory()
+    return load_weights(net, path, device=device, mmap=mmap)
+
+
+def convert_checkpoint(src, dst=None):
+    """Re-save a checkpoint in the zipfile format so it can be memory-mapped"""
+    dst = dst or src
+    state_dict = torch.load(src, map_location="cpu")
+    tmp = dst + ".tmp"
+    torch.save(state_dict, tmp)
+    os.replace(tmp, dst)
+    return dst
+
+
+if __name__ == "__main__":
+    for checkpoint in sys.argv[1:]:
+        if zipfile.is_zipfile(checkpoint):
+            print(f"{checkpoint}: already in zipfile format")
+        else:
+            convert_checkpoint(checkpoint)
+            print(f"{checkpoint}: converted")
@@ -0,0 +1,3 @@
+"""
+Offline benchmarks for the background removal pipeline and HTTP service
+"""
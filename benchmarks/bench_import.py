@@ -0,0 +1,144 @@
+"""
+Import-time benchmark
+
+Imports each module in a fresh interpreter under `python -X importtime`
+and reports wall time, the self-reported cumulative import time, RSS after
+import and the slowest top-level dependencies. The JSON shares the case
+format of bench_pipeline, so --baseline / compare work the same way.
+
+    python -m benchmarks.bench_import --output imports.json
+    python -m benchmarks.bench_import --modules main --baseline imports.json
+"""
+
+import os
+import re
+import sys
+import time
+import argparse
+import subprocess
+from typing import Any, Dict, List
+
+import numpy as np
+
+from benchmarks.common import (
+    LIBRARY_ROOT, REPO_ROOT, compare_results, environment_info, load_results,
+    parse_list, print_comparison, write_results
+)
+
+DEFAULT_MODULES = "backgroundremover.bg,background_remover,main"
+
+_IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)$")
+
+# Printed by the child after the import so RSS covers exactly the import
+_PROBE = (
+    "import resource, sys, time\n"
+    "started = time.perf_counter()\n"
+    "import {module}\n"
+    "elapsed = time.perf_counter() - started\n"
+    "peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss\n"
+    "peak = peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024\n"
+    "print(f'BENCH {{elapsed}} {{peak}}')\n"
+)
+
+
+def parse_importtime(stderr: str) -> List[Dict[str, Any]]:
+    """Rows of (module, self_us, cumulative_us, depth) from -X importtime output"""
+    rows = []
+    for line in stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            rows.append({
+                "module": module,
+                "self_us": int(self_us),
+                "cumulative_us": int(cumulative_us),
+                "depth": (len(indent) - 1) // 2
+            })
+    return rows
+
+
+def measure_import(module: str) -> Dict[str, Any]:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [REPO_ROOT, LIBRARY_ROOT, env.get("PYTHONPATH")]))
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _PROBE.format(module=module)],
+        capture_output=True, text=True, cwd=REPO_ROOT, env=env
+    )
+    marker = [line for line in completed.stdout.splitlines() if line.startswith("BENCH ")]
+    if completed.returncode != 0 or not marker:
+        tail = completed.stderr.strip().splitlines()[-1:] or ["no output"]
+        raise RuntimeError(f"import {module} failed: {tail[0]}")
+
+    _, elapsed, peak = marker[-1].split()
+    rows = parse_importtime(completed.stderr)
+    target = next((row for row in reversed(rows) if row["module"] == module), None)
+    return {
+        "wall_s": float(elapsed),
+        "peak_rss_mb": float(peak),
+        "importtime_us": target["cumulative_us"] if target else None,
+        "rows": rows
+    }
+
+
+def top_dependencies(rows: List[Dict[str, Any]], limit: int) -> List[Dict[str, Any]]:
+    """Slowest packages imported directly or one level below the target"""
+    candidates = [row for row in rows if 1 <= row["depth"] <= 2]
+    candidates.sort(key=lambda row: row["cumulative_us"], reverse=True)
+    return [
+        {"module": row["module"], "cumulative_ms": round(row["cumulative_us"] / 1000, 1)}
+        for row in candidates[:limit]
+    ]
+
+
+def run(args) -> int:
+    results = {"environment": environment_info(), "repeat": args.repeat, "cases": []}
+    failures = 0
+
+    for module in parse_list(args.modules):
+        print(f"import {module}", file=sys.stderr)
+        try:
+            runs = [measure_import(module) for _ in range(args.repeat)]
+        except RuntimeError as e:
+            failures += 1
+            print(f"    failed: {e}", file=sys.stderr)
+            results["cases"].append({"id": f"import/{module}", "error": str(e)})
+            continue
+
+        wall = np.asarray([r["wall_s"] for r in runs]) * 1000
+        row = {
+            "id": f"import/{module}",
+            "module": module,
+            "runs": len(runs),
+            "p50_ms": round(float(np.percentile(wall, 50)), 1),
+            "p95_ms": round(float(np.percentile(wall, 95)), 1),
+            "peak_rss_mb": round(float(np.median([r["peak_rss_mb"] for r in runs])), 1),
+            "importtime_ms": round(float(np.median([r["importtime_us"] or 0 for r in runs])) / 1000, 1),
+            "slowest_imports": top_dependencies(runs[-1]["rows"], args.top)
+        }
+        print(f"    p50 {row['p50_ms']} ms, RSS {row['peak_rss_mb']} MB", file=sys.stderr)
+        for dependency in row["slowest_imports"][:5]:
+            print(f"      {dependency['cumulative_ms']:>8} ms  {dependency['module']}", file=sys.stderr)
+        results["cases"].append(row)
+
+    write_results(args.output, results)
+
+    if args.baseline:
+        if print_comparison(compare_results(results, load_results(args.baseline), args.threshold)):
+            return 1
+    return 1 if failures else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure import time and RSS of service modules")
+    parser.add_argument("--modules", default=DEFAULT_MODULES, help="comma separated modules to import")
+    parser.add_argument("--repeat", type=int, default=5, help="fresh interpreters per module")
+    parser.add_argument("--top", type=int, default=15, help="slowest dependencies to list")
+    parser.add_argument("--output", "-o", default=None, help="write JSON results here instead of stdout")
+    parser.add_argument("--baseline", default=None, help="compare against this results file")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative change counted as a regression")
+    args = parser.parse_args()
+    sys.exit(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Startup benchmark for the traced module cache
+
+Times a short multi-worker video job (utilities.matte_key) three ways:
+"off" traces in every worker as before (BACKGROUNDREMOVER_JIT_CACHE=false),
+"cold" starts from an empty BACKGROUNDREMOVER_JIT_CACHE_DIR, and "warm"
+reruns against the modules the cold run saved. With only a few frames per
+worker, the job time is dominated by worker startup, so the gap between
+cold and warm is the tracing cost the cache removes.
+
+    python -m benchmarks.bench_jit_cache --random-weights --models u2net --workers 4
+    python -m benchmarks.bench_jit_cache --clip input.mp4 --frames 16 --baseline jit.json
+
+Requires ffmpeg and ffprobe on PATH.
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+from typing import Any, Dict, List
+
+from benchmarks.common import (
+    compare_results, environment_info, latency_stats, load_results, parse_list, parse_size,
+    print_comparison, set_model_path, write_results
+)
+from benchmarks.bench_video import make_clip
+from benchmarks.fixtures import ensure_random_weights
+
+MODES = ("off", "cold", "warm")
+
+
+def _dir_size_mb(path: str) -> float:
+    total = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path)) if os.path.isdir(path) else 0
+    return total / 1024 / 1024
+
+
+def run_job(clip: str, model_name: str, workers: int, batch_size: int, frames: int, mode: str,
+            cache_dir: str) -> float:
+    from backgroundremover import utilities
+
+    # Read by the spawned workers when they import backgroundremover.jitcache
+    os.environ["BACKGROUNDREMOVER_JIT_CACHE"] = "false" if mode == "off" else "true"
+    os.environ["BACKGROUNDREMOVER_JIT_CACHE_DIR"] = cache_dir
+    with tempfile.TemporaryDirectory() as tmp:
+        started = time.perf_counter()
+        utilities.matte_key(os.path.join(tmp, "matte.mp4"), clip, worker_nodes=workers, gpu_batchsize=batch_size,
+                            model_name=model_name, frame_limit=frames)
+        return time.perf_counter() - started
+
+
+def run_cases(clip: str, model_name: str, workers: int, batch_size: int, frames: int, repeat: int,
+              modes: List[str]) -> List[Dict[str, Any]]:
+    samples: Dict[str, List[float]] = {mode: [] for mode in modes}
+    cache_mb = 0.0
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory(prefix="bench-jit-") as cache_dir:
+            # warm needs the modules a cold run leaves behind
+            for mode in ("off", "cold", "warm"):
+                if mode in modes or (mode == "cold" and "warm" in modes):
+                    seconds = run_job(clip, model_name, workers, batch_size, frames, mode, cache_dir)
+                    if mode in modes:
+                        samples[mode].append(seconds)
+            cache_mb = max(cache_mb, _dir_size_mb(cache_dir))
+
+    rows = []
+    for mode in modes:
+        stats = latency_stats(samples[mode], frames)
+        rows.append({
+            "id": f"jit_cache/{model_name}/{mode}/w={workers}/b={batch_size}",
+            "model": model_name,
+            "mode": mode,
+            "workers": workers,
+            "batch_size": batch_size,
+            "frames": frames,
+            **stats,
+            "cache_mb": round(cache_mb, 1)
+        })
+    return rows
+
+
+def run(args) -> int:
+    models = parse_list(args.models)
+    modes = parse_list(args.modes)
+    for mode in modes:
+        if mode not in MODES:
+            raise SystemExit(f"Unknown mode {mode}, choose from {', '.join(MODES)}")
+    weights_dir = args.weights_dir
+    if weights_dir is None and args.random_weights:
+        weights_dir = ensure_random_weights(tempfile.mkdtemp(prefix="bench-weights-"), models)
+
+    frames = args.frames or args.workers * args.batch_size * 2
+    clip = args.clip
+    if clip is None:
+        width, height = parse_size(args.size)
+        clip = make_clip(os.path.join(tempfile.mkdtemp(prefix="bench-video-"), "clip.mp4"), width, height, frames)
+
+    results = {"environment": environment_info(), "clip": clip, "cases": []}
+    for model_name in models:
+        set_model_path(model_name, weights_dir)
+        for row in run_cases(clip, model_name, args.workers, args.batch_size, frames, args.repeat, modes):
+            print(f"{row['id']:<40} {row['p50_ms'] / 1000:>7.2f} s  ({row['cache_mb']} MB cached)", file=sys.stderr)
+            results["cases"].append(row)
+
+    write_results(args.output, results)
+    if args.baseline:
+        if print_comparison(compare_results(results, load_results(args.baseline), args.threshold)):
+            return 1
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure video job startup with and without the traced module cache")
+    parser.add_argument("--clip", default=None, help="input video (default: generate a test pattern)")
+    parser.add_argument("--size", default="1280x720", help="size of the generated clip")
+    parser.add_argument("--frames", type=int, default=0, help="frames to process (default: two batches per worker)")
+    parser.add_argument("--models", default="u2netp", help="comma separated model names")
+    parser.add_argument("--modes", default=",".join(MODES), help="comma separated: off, cold, warm")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=2)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--weights-dir", default=None, help="directory holding <model>.pth weights")
+    parser.add_argument("--random-weights", action="store_true", help="generate random weights offline")
+    parser.add_argument("--output", "-o", default=None, help="write JSON results here instead of stdout")
+    parser.add_argument("--baseline", default=None, help="compare against this results file")
+    parser.add_argument("--threshold", type=float, default=0.10)
+    args = parser.parse_args()
+    sys.exit(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+"""
+Offline benchmark of the background removal pipeline
+
+Measures three entry points on deterministic synthetic images:
+
+    remove       - backgroundremover.bg.remove (library, per model)
+    service      - BackgroundRemover.remove_background (what the API calls)
+    remove_many  - backgroundremover.bg.remove_many batched inference (video path)
+
+Each case reports p50/p95 latency, throughput, peak RSS and the p50 of
+every pipeline stage recorded through the timings dict. Cases run in a
+fresh process by default so peak RSS is per case.
+
+Examples:
+
+    python -m benchmarks.bench_pipeline run --weights-dir models --output results.json
+    python -m benchmarks.bench_pipeline run --random-weights --suite service --matting off
+    python -m benchmarks.bench_pipeline run --suite remove --models u2netp --sizes 640x480 --baseline results.json
+    python -m benchmarks.bench_pipeline compare results.json baseline.json
+"""
+
+import sys
+import argparse
+import tempfile
+import multiprocessing
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from benchmarks.fixtures import ensure_random_weights
+from benchmarks.common import (
+    compare_results, encode_image, environment_info, latency_stats, load_results,
+    parse_list, parse_size, peak_rss_mb, print_comparison, set_model_path,
+    synthetic_image, time_call, write_results
+)
+
+SUITES = ("remove", "service", "remove_many")
+MODELS = ("u2netp", "u2net", "u2net_human_seg")
+DEFAULT_SIZES = "320x240,1024x768,2048x1536"
+DEFAULT_BATCH_SIZES = "1,2,4,8,16,32"
+# bg.iter_frames scales video to a height of 320
+DEFAULT_FRAME_SIZE = "568x320"
+
+
+def case_id(spec: Dict[str, Any]) -> str:
+    if spec["suite"] == "remove_many":
+        return f"remove_many/{spec['model']}/{spec['size']}/batch={spec['batch']}"
+    matting = "on" if spec["matting"] else "off"
+    return f"{spec['suite']}/{spec['model']}/{spec['size']}/matting={matting}"
+
+
+def build_cases(args) -> List[Dict[str, Any]]:
+    suites = parse_list(args.suite)
+    models = parse_list(args.models)
+    sizes = parse_list(args.sizes)
+    matting_modes = [mode == "on" for mode in parse_list(args.matting)]
+    cases = []
+
+    for suite in suites:
+        if suite not in SUITES:
+            raise SystemExit(f"Unknown suite {suite!r}, choose from {', '.join(SUITES)}")
+
+    if "remove" in suites:
+        for model in models:
+            for size in sizes:
+                for matting in matting_modes:
+                    cases.append({"suite": "remove", "model": model, "size": size, "matting": matting})
+
+    if "service" in suites:
+        # The service always resolves to u2netp, whatever the model hint
+        for size in sizes:
+            for matting in matting_modes:
+                cases.append({"suite": "service", "model": "u2netp", "size": size, "matting": matting})
+
+    if "remove_many" in suites:
+        for model in models:
+            for batch in parse_list(args.batch_sizes, int):
+                cases.append({"suite": "remove_many", "model": model, "size": args.frame_size, "batch": batch})
+
+    for spec in cases:
+        spec["id"] = case_id(spec)
+    return cases
+
+
+def _stage_p50(stage_samples: Dict[str, List[float]]) -> Dict[str, float]:
+    return {
+        name: round(float(np.percentile(values, 50)) * 1000, 3)
+        for name, values in sorted(stage_samples.items())
+    }
+
+
+def _collect_stages(stage_samples: Dict[str, List[float]], timings: Dict[str, float]):
+    for name, seconds in timings.items():
+        stage_samples.setdefault(name, []).append(seconds)
+
+
+def run_case(spec: Dict[str, Any], repeat: int, warmup: int, weights_dir: Optional[str],
+             threads: Optional[int]) -> Dict[str, Any]:
+    """Run one case in the current process and return its result row"""
+    import torch
+    if threads:
+        torch.set_num_threads(threads)
+
+    set_model_path(spec["model"], weights_dir)
+    width, height = parse_size(spec["size"])
+    stage_samples: Dict[str, List[float]] = {}
+    items_per_sample = 1
+
+    if spec["suite"] == "remove":
+        from backgroundremover.bg import remove
+        data = encode_image(synthetic_image(width, height))
+
+        def call():
+            timings = {}
+            remove(data, model_name=spec["model"], alpha_matting=spec["matting"], timings=timings)
+            _collect_stages(stage_samples, timings)
+
+    elif spec["suite"] == "service":
+        from background_remover import BackgroundRemover
+        remover = BackgroundRemover()
+        if weights_dir:
+            remover.model_dir = Path(weights_dir)
+        data = encode_image(synthetic_image(width, height))
+
+        def call():
+            _, metadata = remover.remove_background(data, alpha_matting=spec["matting"])
+            _collect_stages(stage_samples, metadata.get("timings", {}))
+
+    else:
+        from backgroundremover.bg import Net, remove_many
+        items_per_sample = spec["batch"]
+        net = Net(spec["model"])
+        frames = [np.array(synthetic_image(width, height, seed=i)) for i in range(spec["batch"])]
+
+        def call():
+            remove_many(frames, net)
+
+    samples = time_call(call, repeat=repeat, warmup=warmup)
+    # Warmup runs also recorded stages; keep only the measured ones
+    stage_samples = {name: values[-repeat:] for name, values in stage_samples.items()}
+
+    result = dict(spec)
+    result.update(latency_stats(samples, items_per_sample))
+    result["stages_p50_ms"] = _stage_p50(stage_samples)
+    result["peak_rss_mb"] = round(peak_rss_mb(), 1)
+    return result
+
+
+def _isolated_worker(queue, spec, repeat, warmup, weights_dir, threads):
+    try:
+        queue.put(run_case(spec, repeat, warmup, weights_dir, threads))
+    except Exception as e:
+        queue.put({"id": spec["id"], "error": f"{type(e).__name__}: {e}"})
+
+
+def run_isolated(spec: Dict[str, Any], repeat: int, warmup: int, weights_dir: Optional[str],
+                 threads: Optional[int]) -> Dict[str, Any]:
+    """Run one case in a fresh interpreter so peak RSS belongs to that case alone"""
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(
+        target=_isolated_worker, args=(queue, spec, repeat, warmup, weights_dir, threads)
+    )
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def run(args) -> int:
+    cases = build_cases(args)
+    if args.random_weights and not args.weights_dir:
+        args.weights_dir = tempfile.mkdtemp(prefix="bench-weights-")
+        ensure_random_weights(args.weights_dir, sorted({spec["model"] for spec in cases}))
+    results = {"environment": environment_info(), "repeat": args.repeat, "cases": []}
+    failures = 0
+
+    for index, spec in enumerate(cases, 1):
+        print(f"[{index}/{len(cases)}] {spec['id']}", file=sys.stderr)
+        if args.no_isolate:
+            try:
+                row = run_case(spec, args.repeat, args.warmup, args.weights_dir, args.threads)
+            except Exception as e:
+                row = {"id": spec["id"], "error": f"{type(e).__name__}: {e}"}
+        else:
+            row = run_isolated(spec, args.repeat, args.warmup, args.weights_dir, args.threads)
+
+        if "error" in row:
+            failures += 1
+            print(f"    failed: {row['error']}", file=sys.stderr)
+        else:
+            print(
+                f"    p50 {row['p50_ms']} ms, p95 {row['p95_ms']} ms, "
+                f"{row['throughput_per_s']}/s, peak RSS {row['peak_rss_mb']} MB",
+                file=sys.stderr
+            )
+        results["cases"].append(row)
+
+    write_results(args.output, results)
+
+    if args.baseline:
+        regressions = print_comparison(compare_results(results, load_results(args.baseline), args.threshold))
+        if regressions:
+            return 1
+    return 1 if failures else 0
+
+
+def compare(args) -> int:
+    rows = compare_results(load_results(args.current), load_results(args.baseline), args.threshold)
+    return 1 if print_comparison(rows) else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the background removal pipeline")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="run benchmark cases")
+    run_parser.add_argument("--suite", default=",".join(SUITES),
+                            help="comma separated suites: remove, service, remove_many")
+    run_parser.add_argument("--models", default=",".join(MODELS), help="comma separated model names")
+    run_parser.add_argument("--sizes", default=DEFAULT_SIZES, help="comma separated WIDTHxHEIGHT image sizes")
+    run_parser.add_argument("--matting", default="off,on", help="alpha matting modes to run: off, on or both")
+    run_parser.add_argument("--batch-sizes", default=DEFAULT_BATCH_SIZES, help="batch sizes for remove_many")
+    run_parser.add_argument("--frame-size", default=DEFAULT_FRAME_SIZE, help="frame size for remove_many")
+    run_parser.add_argument("--repeat", type=int, default=5, help="measured runs per case")
+    run_parser.add_argument("--warmup", type=int, default=1, help="unmeasured runs per case")
+    run_parser.add_argument("--threads", type=int, default=None, help="torch intra-op threads")
+    run_parser.add_argument("--weights-dir", default=None,
+                            help="directory holding <model>.pth weights (defaults to ~/.u2net)")
+    run_parser.add_argument("--random-weights", action="store_true",
+                            help="generate random weights offline when --weights-dir is not given")
+    run_parser.add_argument("--no-isolate", action="store_true",
+                            help="run all cases in this process (faster, RSS is cumulative)")
+    run_parser.add_argument("--output", "-o", default=None, help="write JSON results here instead of stdout")
+    run_parser.add_argument("--baseline", default=None, help="compare against this results file")
+    run_parser.add_argument("--threshold", type=float, default=0.10,
+                            help="relative change counted as a regression")
+    run_parser.set_defaults(func=run)
+
+    compare_parser = subparsers.add_parser("compare", help="compare two results files")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("--threshold", type=float, default=0.10)
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    sys.exit(args.func(args))
+
+
+if __name__ == "__main__":
+    main()
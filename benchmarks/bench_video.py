@@ -0,0 +1,226 @@
+"""
+Video pipeline benchmark
+
+Generates a synthetic clip with ffmpeg (or uses --clip) and times
+backgroundremover.utilities.matte_key, or one of the compositing functions
+(--functions, with --streaming off,on to compare the single-pass mode),
+end to end, reporting frames/s. Model
+loading and tracing happen inside the timed region, as they do for a CLI
+run, so use enough frames for the steady state to dominate.
+
+    python -m benchmarks.bench_video --random-weights --models u2netp --frames 120
+    python -m benchmarks.bench_video --clip input.mp4 --workers 2 --batch-sizes 2,4 --baseline video.json
+    python -m benchmarks.bench_video --random-weights --functions transparentvideo --streaming off,on
+    python -m benchmarks.bench_video --random-weights --temporal off,on --mask-smoothing 0.5
+    python -m benchmarks.bench_video --random-weights --segments 1,2 --keyint 30
+    python -m benchmarks.bench_video --decode-only --frames 300
+
+--decode-only times just the frame source (bg.iter_frames), which the
+inference cost otherwise hides on CPU. --temporal on runs with
+utilities.TemporalReuse and reports the fraction of frames that skipped
+inference; matte_key cases also report mask_flicker, the mean absolute
+difference (0-255) between consecutive output masks. --segments N splits the
+clip at keyframes and mattes N pieces in parallel (two-pass only); --keyint
+sets the keyframe interval of the generated clip so it has places to split.
+
+Requires ffmpeg and ffprobe on PATH.
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import itertools
+import subprocess
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from benchmarks.common import (
+    compare_results, environment_info, latency_stats, load_results, parse_list, parse_size,
+    peak_rss_mb, print_comparison, set_model_path, time_call, write_results
+)
+from benchmarks.fixtures import ensure_random_weights
+
+
+def make_clip(path: str, width: int, height: int, frames: int, fps: int = 30, source: str = "testsrc2",
+              keyint: int = 250) -> str:
+    """lavfi test source (moving pattern by default) encoded as H.264, like a typical upload"""
+    subprocess.run([
+        "ffmpeg", "-v", "error", "-y",
+        "-f", "lavfi", "-i", f"{source}=size={width}x{height}:rate={fps}",
+        "-frames:v", str(frames), "-pix_fmt", "yuv420p", "-c:v", "libx264", "-g", str(keyint), path
+    ], check=True)
+    return path
+
+
+def run_decode_case(clip: str, frames: int, repeat: int) -> Dict[str, Any]:
+    from backgroundremover.bg import iter_frames
+
+    def decode():
+        for index, _ in enumerate(iter_frames(clip)):
+            if index + 1 >= frames:
+                break
+
+    stats = latency_stats(time_call(decode, repeat), frames)
+    return {"id": "video/decode", "frames": frames, **stats, "peak_rss_mb": round(peak_rss_mb(), 1)}
+
+
+# Output extension per function; the compositing ones take streaming=
+FUNCTIONS = {
+    "matte_key": ".mp4",
+    "transparentvideo": ".mov",
+    "transparentgif": ".gif"
+}
+
+
+def mask_flicker(matte: str) -> float:
+    """Mean absolute difference between consecutive frames of a matte video"""
+    from backgroundremover.videoio import FrameReader, probe
+
+    info = probe(matte)
+    previous, total, pairs = None, 0.0, 0
+    for frame in FrameReader(matte, (info["width"], info["height"])):
+        current = frame[..., 0].astype(np.float32)
+        if previous is not None:
+            total += float(np.abs(current - previous).mean())
+            pairs += 1
+        previous = current
+    return total / pairs if pairs else 0.0
+
+
+def run_case(clip: str, function: str, streaming: bool, temporal: Optional[Dict[str, float]], model_name: str,
+             workers: int, batch_size: int, frames: int, repeat: int, prefetched_batches: int,
+             segments: int = 1, threads: int = 0) -> Dict[str, Any]:
+    from backgroundremover import utilities
+
+    kwargs = {"streaming": True} if streaming else {}
+    if temporal is not None:
+        kwargs["temporal"] = utilities.TemporalReuse(**temporal)
+    if segments > 1:
+        kwargs["segments"] = segments
+    if threads:
+        kwargs["threads"] = threads
+    samples, skipped, flicker = [], [], []
+    with tempfile.TemporaryDirectory() as tmp:
+        for run in range(repeat):
+            output = os.path.join(tmp, f"out{run}{FUNCTIONS[function]}")
+            started = time.perf_counter()
+            stats = getattr(utilities, function)(output, clip, worker_nodes=workers, gpu_batchsize=batch_size,
+                                                 model_name=model_name, frame_limit=frames,
+                                                 prefetched_batches=prefetched_batches, **kwargs)
+            samples.append(time.perf_counter() - started)
+            if stats:
+                skipped.append(stats["skipped_fraction"])
+            if function == "matte_key":
+                flicker.append(mask_flicker(output))
+
+    stats = latency_stats(samples, frames)
+    name = function + ("/streaming" if streaming else "") + ("/temporal" if temporal is not None else "")
+    name += f"/segments={segments}" if segments > 1 else ""
+    suffix = f"/t={threads}" if threads else ""
+    row = {
+        "id": f"video/{name}/{model_name}/w={workers}/b={batch_size}{suffix}",
+        "function": function,
+        "streaming": streaming,
+        "temporal": temporal,
+        "segments": segments,
+        "model": model_name,
+        "workers": workers,
+        "batch_size": batch_size,
+        "threads": threads,
+        "frames": frames,
+        **stats,
+        "peak_rss_mb": round(peak_rss_mb(), 1)
+    }
+    if skipped:
+        row["skipped_fraction"] = round(float(np.mean(skipped)), 3)
+    if flicker:
+        row["mask_flicker"] = round(float(np.mean(flicker)), 3)
+    return row
+
+
+def run(args) -> int:
+    models = parse_list(args.models)
+    weights_dir = args.weights_dir
+    if weights_dir is None and args.random_weights:
+        weights_dir = ensure_random_weights(tempfile.mkdtemp(prefix="bench-weights-"), models)
+
+    clip = args.clip
+    if clip is None:
+        width, height = parse_size(args.size)
+        clip = make_clip(os.path.join(tempfile.mkdtemp(prefix="bench-video-"), "clip.mp4"),
+                         width, height, args.frames, source=args.source, keyint=args.keyint)
+
+    temporal = {
+        "threshold": args.temporal_threshold,
+        "keyframe_interval": args.keyframe_interval,
+        "smoothing": args.mask_smoothing
+    }
+    results = {"environment": environment_info(), "clip": clip, "cases": []}
+    if args.decode_only:
+        row = run_decode_case(clip, args.frames, args.repeat)
+        print(f"{row['id']:<40} {row['throughput_per_s']:>7} frames/s", file=sys.stderr)
+        results["cases"].append(row)
+        models = []
+
+    for model_name in models:
+        set_model_path(model_name, weights_dir)
+        for function in parse_list(args.functions):
+            if function not in FUNCTIONS:
+                raise SystemExit(f"Unknown function {function}, choose from {', '.join(FUNCTIONS)}")
+            # matte_key has no streaming mode
+            modes = [False] if function == "matte_key" else [m == "on" for m in parse_list(args.streaming)]
+            for streaming, temporal_mode, segments, workers, batch_size, threads in itertools.product(
+                    modes, parse_list(args.temporal), parse_list(args.segments, int),
+                    parse_list(args.workers, int), parse_list(args.batch_sizes, int), parse_list(args.threads, int)):
+                if streaming and segments > 1:
+                    continue
+                row = run_case(clip, function, streaming, temporal if temporal_mode == "on" else None, model_name,
+                               workers, batch_size, args.frames, args.repeat, args.prefetched_batches, segments,
+                               threads)
+                extra = f"  skipped {row['skipped_fraction']:.0%}" if row.get("temporal") else ""
+                extra += f"  flicker {row['mask_flicker']}" if "mask_flicker" in row else ""
+                print(f"{row['id']:<60} {row['throughput_per_s']:>7} frames/s{extra}", file=sys.stderr)
+                results["cases"].append(row)
+
+    write_results(args.output, results)
+    if args.baseline:
+        if print_comparison(compare_results(results, load_results(args.baseline), args.threshold)):
+            return 1
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure frames/s of the video matte pipeline")
+    parser.add_argument("--clip", default=None, help="input video (default: generate a test pattern)")
+    parser.add_argument("--size", default="1920x1080", help="size of the generated clip")
+    parser.add_argument("--source", default="testsrc2", help="lavfi source for the generated clip")
+    parser.add_argument("--frames", type=int, default=120, help="frames to process")
+    parser.add_argument("--keyint", type=int, default=250, help="keyframe interval of the generated clip")
+    parser.add_argument("--functions", default="matte_key", help="comma separated: " + ", ".join(FUNCTIONS))
+    parser.add_argument("--streaming", default="off", help="compositing modes to run: off, on or off,on")
+    parser.add_argument("--temporal", default="off", help="temporal mask reuse modes to run: off, on or off,on")
+    parser.add_argument("--temporal-threshold", type=float, default=0.01)
+    parser.add_argument("--keyframe-interval", type=int, default=10)
+    parser.add_argument("--mask-smoothing", type=float, default=0.0)
+    parser.add_argument("--segments", default="1", help="comma separated segment counts (two-pass modes only)")
+    parser.add_argument("--models", default="u2netp", help="comma separated model names")
+    parser.add_argument("--workers", default="1", help="comma separated worker process counts")
+    parser.add_argument("--batch-sizes", default="2", help="comma separated frames per inference batch")
+    parser.add_argument("--threads", default="0", help="comma separated torch threads per worker (0: torch default)")
+    parser.add_argument("--prefetched-batches", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--decode-only", action="store_true", help="time only the frame source, no model")
+    parser.add_argument("--weights-dir", default=None, help="directory holding <model>.pth weights")
+    parser.add_argument("--random-weights", action="store_true", help="generate random weights offline")
+    parser.add_argument("--output", "-o", default=None, help="write JSON results here instead of stdout")
+    parser.add_argument("--baseline", default=None, help="compare against this results file")
+    parser.add_argument("--threshold", type=float, default=0.10)
+    args = parser.parse_args()
+    sys.exit(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Memory benchmark for weight loading across processes
+
+Starts N processes that each load a model (the old copying torch.load, or
+the memory-mapped loader in backgroundremover.weights), run one forward pass so
+every weight page is touched, and then measure themselves while all N are
+alive. RSS double-counts shared pages, so PSS (proportional set size) and
+USS (private memory) are reported as well; the mmap loader should keep
+the weights out of USS and divide them across processes in PSS.
+
+    python -m benchmarks.bench_weights_rss --random-weights --models u2net --processes 1,4,8
+"""
+
+import os
+import sys
+import argparse
+import tempfile
+import multiprocessing
+from typing import Any, Dict
+
+from benchmarks.common import environment_info, load_results, compare_results, print_comparison, parse_list, write_results
+from benchmarks.fixtures import ARCHITECTURES, ensure_random_weights
+
+MODES = ("copy", "mmap")
+
+
+def _child(path: str, model_name: str, mode: str, ready, done, queue):
+    import psutil
+    import torch
+    from backgroundremover.u2net import u2net
+    from backgroundremover.weights import build_model
+
+    torch.set_num_threads(1)
+    net_cls = getattr(u2net, ARCHITECTURES[model_name])
+    if mode == "mmap":
+        net = build_model(lambda: net_cls(3, 1), path, mmap=True)
+    else:
+        # The loader before backgroundremover.weights: random init, then a copying load
+        net = net_cls(3, 1)
+        net.load_state_dict(torch.load(path, map_location="cpu"))
+    net.eval()
+    with torch.no_grad():
+        net(torch.zeros(1, 3, 320, 320))
+
+    ready.wait()
+    info = psutil.Process().memory_full_info()
+    queue.put({"rss": info.rss, "pss": getattr(info, "pss", 0), "uss": info.uss})
+    done.wait()
+
+
+def measure(path: str, model_name: str, mode: str, processes: int) -> Dict[str, Any]:
+    context = multiprocessing.get_context("spawn")
+    ready = context.Barrier(processes)
+    done = context.Barrier(processes + 1)
+    queue = context.Queue()
+    workers = [
+        context.Process(target=_child, args=(path, model_name, mode, ready, done, queue))
+        for _ in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+    samples = [queue.get() for _ in workers]
+    done.wait()
+    for worker in workers:
+        worker.join()
+
+    mb = 1024 * 1024
+    total = {key: sum(sample[key] for sample in samples) / mb for key in ("rss", "pss", "uss")}
+    return {
+        "id": f"weights_rss/{model_name}/{mode}/n={processes}",
+        "model": model_name,
+        "mode": mode,
+        "processes": processes,
+        "weights_mb": round(os.path.getsize(path) / mb, 1),
+        "peak_rss_mb": round(total["rss"], 1),
+        "pss_total_mb": round(total["pss"], 1),
+        "uss_total_mb": round(total["uss"], 1),
+        "pss_per_process_mb": round(total["pss"] / processes, 1),
+        "uss_per_process_mb": round(total["uss"] / processes, 1)
+    }
+
+
+def run(args) -> int:
+    models = parse_list(args.models)
+    weights_dir = args.weights_dir
+    if weights_dir is None:
+        if not args.random_weights:
+            raise SystemExit("Pass --weights-dir or --random-weights")
+        weights_dir = ensure_random_weights(tempfile.mkdtemp(prefix="bench-weights-"), models)
+
+    results = {"environment": environment_info(), "cases": []}
+    for model_name in models:
+        path = os.path.join(weights_dir, f"{model_name}.pth")
+        for processes in parse_list(args.processes, int):
+            for mode in parse_list(args.modes):
+                row = measure(path, model_name, mode, processes)
+                print(
+                    f"{row['id']:<36} RSS {row['peak_rss_mb']:>8} MB  PSS {row['pss_total_mb']:>8} MB  "
+                    f"USS {row['uss_total_mb']:>8} MB",
+                    file=sys.stderr
+                )
+                results["cases"].append(row)
+
+    write_results(args.output, results)
+    if args.baseline:
+        if print_comparison(compare_results(results, load_results(args.baseline), args.threshold)):
+            return 1
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure per-process memory of copied vs memory-mapped weights")
+    parser.add_argument("--models", default="u2net", help="comma separated model names")
+    parser.add_argument("--processes", default="1,4,8", help="comma separated process counts")
+    parser.add_argument("--modes", default=",".join(MODES), help="loaders to compare: copy, mmap")
+    parser.add_argument("--weights-dir", default=None, help="directory holding <model>.pth weights")
+    parser.add_argument("--random-weights", action="store_true", help="generate random weights offline")
+    parser.add_argument("--output", "-o", default=None, help="write JSON results here instead of stdout")
+    parser.add_argument("--baseline", default=None, help="compare against this results file")
+    parser.add_argument("--threshold", type=float, default=0.10)
+    args = parser.parse_args()
+    sys.exit(run(args))
+
+
+if __name__ == "__main__":
+    main()
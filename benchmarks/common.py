@@ -0,0 +1,190 @@
+"""
+Shared helpers for the benchmark scripts: synthetic inputs, latency
+statistics, peak RSS, result files and baseline comparison.
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import platform
+import resource
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LIBRARY_ROOT = os.path.join(REPO_ROOT, "backgroundremover-main")
+
+for path in (REPO_ROOT, LIBRARY_ROOT):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+MODEL_ENV_VARS = {
+    "u2netp": "U2NETP_PATH",
+    "u2net": "U2NET_PATH",
+    "u2net_human_seg": "U2NET_PATH"
+}
+
+
+def parse_size(spec: str) -> Tuple[int, int]:
+    width, height = spec.lower().split("x")
+    return int(width), int(height)
+
+
+def parse_list(spec: str, cast: Callable = str) -> List[Any]:
+    return [cast(item.strip()) for item in spec.split(",") if item.strip()]
+
+
+def synthetic_image(width: int, height: int, seed: int = 0) -> Image.Image:
+    """Deterministic RGB test image: noisy gradient background with a soft-edged subject"""
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 1, width, dtype=np.float32)
+    y = np.linspace(0, 1, height, dtype=np.float32)[:, None]
+    background = np.stack([
+        np.broadcast_to(x * 200 + 30, (height, width)),
+        np.broadcast_to(y * 180 + 40, (height, width)),
+        np.full((height, width), 120, dtype=np.float32)
+    ], axis=-1)
+    background += rng.normal(0, 8, background.shape).astype(np.float32)
+    img = Image.fromarray(np.clip(background, 0, 255).astype(np.uint8), "RGB")
+
+    mask = Image.new("L", (width, height), 0)
+    draw = ImageDraw.Draw(mask)
+    draw.ellipse((width * 0.3, height * 0.15, width * 0.7, height * 0.9), fill=255)
+    draw.ellipse((width * 0.4, height * 0.05, width * 0.6, height * 0.35), fill=255)
+    mask = mask.filter(ImageFilter.GaussianBlur(max(1, min(width, height) // 100)))
+    subject = Image.new("RGB", (width, height), (220, 60, 50))
+    return Image.composite(subject, img, mask)
+
+
+def encode_image(img: Image.Image, fmt: str = "PNG") -> bytes:
+    buffer = io.BytesIO()
+    img.save(buffer, format=fmt)
+    return buffer.getvalue()
+
+
+def set_model_path(model_name: str, weights_dir: Optional[str]):
+    if weights_dir:
+        os.environ[MODEL_ENV_VARS[model_name]] = os.path.join(weights_dir, f"{model_name}.pth")
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    if sys.platform == "darwin":
+        return peak / 1024 / 1024
+    return peak / 1024
+
+
+def latency_stats(samples: List[float], items_per_sample: int = 1) -> Dict[str, float]:
+    """p50/p95/mean latency in ms and throughput in items/s"""
+    values = np.asarray(samples, dtype=np.float64)
+    total = float(values.sum())
+    return {
+        "runs": len(samples),
+        "p50_ms": round(float(np.percentile(values, 50)) * 1000, 3),
+        "p95_ms": round(float(np.percentile(values, 95)) * 1000, 3),
+        "mean_ms": round(float(values.mean()) * 1000, 3),
+        "throughput_per_s": round(len(samples) * items_per_sample / total, 3) if total > 0 else 0.0
+    }
+
+
+def time_call(fn: Callable, repeat: int, warmup: int = 1) -> List[float]:
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def environment_info() -> Dict[str, Any]:
+    info = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+    }
+    try:
+        import torch
+        info["torch"] = torch.__version__
+        info["torch_threads"] = torch.get_num_threads()
+    except ImportError:
+        pass
+    return info
+
+
+def write_results(path: Optional[str], results: Dict[str, Any]):
+    payload = json.dumps(results, indent=2, sort_keys=True)
+    if path:
+        with open(path, "w") as f:
+            f.write(payload + "\n")
+        print(f"Results written to {path}")
+    else:
+        print(payload)
+
+
+def load_results(path: str) -> Dict[str, Any]:
+    with open(path) as f:
+        return json.load(f)
+
+
+# Metric name -> True when higher is better
+COMPARED_METRICS = {
+    "p50_ms": False,
+    "p95_ms": False,
+    "throughput_per_s": True,
+    "peak_rss_mb": False
+}
+
+
+def compare_results(
+    current: Dict[str, Any],
+    baseline: Dict[str, Any],
+    threshold: float = 0.10
+) -> List[Dict[str, Any]]:
+    """
+    Compare cases with the same id. Returns one row per metric; rows whose
+    relative change is worse than threshold are marked as regressions.
+    """
+    baseline_cases = {case["id"]: case for case in baseline.get("cases", [])}
+    rows = []
+    for case in current.get("cases", []):
+        base = baseline_cases.get(case["id"])
+        if base is None:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            if metric not in case or metric not in base or not base[metric]:
+                continue
+            change = (case[metric] - base[metric]) / base[metric]
+            worse = -change if higher_is_better else change
+            rows.append({
+                "id": case["id"],
+                "metric": metric,
+                "baseline": base[metric],
+                "current": case[metric],
+                "change_pct": round(change * 100, 1),
+                "regression": worse > threshold
+            })
+    return rows
+
+
+def print_comparison(rows: List[Dict[str, Any]]) -> int:
+    """Print a comparison table; returns the number of regressions"""
+    regressions = 0
+    for row in rows:
+        flag = "REGRESSION" if row["regression"] else ""
+        regressions += row["regression"]
+        print(
+            f"{row['id']:<60} {row['metric']:<18} {row['baseline']:>12} -> {row['current']:>12} "
+            f"({row['change_pct']:+.1f}%) {flag}"
+        )
+    print(f"{regressions} regression(s) across {len(rows)} compared metrics")
+    return regressions
@@ -0,0 +1,60 @@
+"""
+Offline model fixtures
+
+Writes randomly initialised U2Net weights with the same architecture and
+state_dict layout as the released .pth files, so the real inference path
+can be exercised without network access. Masks from these weights are
+meaningless (alpha matting may reject them as having no background), but
+shapes, memory and timing match the real models.
+
+    python -m benchmarks.fixtures --out models
+"""
+
+import os
+import argparse
+from typing import Iterable, Optional
+
+from benchmarks import common  # noqa: F401 - puts backgroundremover on sys.path
+
+ARCHITECTURES = {
+    "u2netp": "U2NETP",
+    "u2net": "U2NET",
+    "u2net_human_seg": "U2NET"
+}
+
+
+def write_random_weights(path: str, model_name: str = "u2netp", seed: int = 0) -> str:
+    """Save a seeded random state_dict for model_name to path"""
+    import torch
+    from backgroundremover.u2net import u2net
+
+    torch.manual_seed(seed)
+    net = getattr(u2net, ARCHITECTURES[model_name])(3, 1)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    torch.save(net.state_dict(), path)
+    return path
+
+
+def ensure_random_weights(directory: str, models: Iterable[str] = ("u2netp",), seed: int = 0,
+                          overwrite: bool = False):
+    """Create <directory>/<model>.pth for each model that is missing"""
+    for model_name in models:
+        path = os.path.join(directory, f"{model_name}.pth")
+        if overwrite or not os.path.exists(path):
+            write_random_weights(path, model_name, seed)
+            print(f"Wrote random {model_name} weights to {path}")
+    return directory
+
+
+def main(argv: Optional[list] = None):
+    parser = argparse.ArgumentParser(description="Generate random U2Net weights for offline runs")
+    parser.add_argument("--out", default="models", help="output directory")
+    parser.add_argument("--models", default="u2netp", help="comma separated: u2netp, u2net, u2net_human_seg")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--overwrite", action="store_true", help="replace existing files")
+    args = parser.parse_args(argv)
+    ensure_random_weights(args.out, common.parse_list(args.models), args.seed, args.overwrite)
+
+
+if __name__ == "__main__":
+    main()
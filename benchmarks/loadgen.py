@@ -0,0 +1,367 @@
+"""
+HTTP load generator for the background removal API
+
+Drives POST /remove-background either in-process through httpx's ASGI
+transport (no server, no network) or against a running server with --url.
+Reports throughput, p50/p95/p99 latency, status/error counts, server-side
+stage timings (from Server-Timing) and inference queue depth over time
+(sampled from /queue-stats).
+
+With --stub the service runs the fake inference engine (BG_REMOVER_ENGINE=fake)
+so the HTTP layer (multipart parsing, auth, scheduling, compositing,
+encoding) is measured on its own, without weights.
+
+Examples:
+
+    # closed loop: 16 clients back to back, in-process, stub model
+    python -m benchmarks.loadgen run --stub --concurrency 16 --requests 500
+
+    # open loop: Poisson arrivals at 20 req/s for 30 s against a server
+    python -m benchmarks.loadgen serve --stub --port 8000 &
+    python -m benchmarks.loadgen run --url http://127.0.0.1:8000 --rate 20 --duration 30
+
+    # image mix: 70% 640x480, 30% 1920x1080
+    python -m benchmarks.loadgen run --stub --mix 640x480:0.7,1920x1080:0.3
+"""
+
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from benchmarks.common import encode_image, parse_size, synthetic_image, write_results
+
+
+def parse_mix(spec: str) -> List[Tuple[str, float]]:
+    """"640x480:0.7,1920x1080:0.3" -> [("640x480", 0.7), ("1920x1080", 0.3)]"""
+    mix = []
+    for item in spec.split(","):
+        size, _, weight = item.strip().partition(":")
+        parse_size(size)
+        mix.append((size, float(weight) if weight else 1.0))
+    return mix
+
+
+def build_payloads(mix: List[Tuple[str, float]], image_format: str) -> List[Tuple[str, bytes, float]]:
+    """Pre-encode one image per size so encoding cost stays out of the measurement"""
+    extension = "jpg" if image_format == "JPEG" else "png"
+    payloads = []
+    for index, (size, weight) in enumerate(mix):
+        width, height = parse_size(size)
+        data = encode_image(synthetic_image(width, height, seed=index), image_format)
+        payloads.append((f"load-{size}.{extension}", data, weight))
+    return payloads
+
+
+def configure_stub(args):
+    """Select the fake inference engine; must run before main is imported"""
+    os.environ["BG_REMOVER_ENGINE"] = "fake"
+    os.environ["FAKE_ENGINE_LATENCY"] = str(args.stub_latency)
+    os.environ["FAKE_ENGINE_LATENCY_PER_MP"] = str(args.stub_latency_per_mp)
+    os.environ["FAKE_ENGINE_MASK"] = args.stub_mask
+
+
+def parse_server_timing(header: Optional[str]) -> Dict[str, float]:
+    """'queue;dur=1.2, infer;dur=40.0' -> {"queue": 1.2, "infer": 40.0} (ms)"""
+    result = {}
+    for part in (header or "").split(","):
+        name, _, params = part.strip().partition(";")
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "dur" and name:
+                try:
+                    result[name] = float(value)
+                except ValueError:
+                    pass
+    return result
+
+
+class LoadRun:
+    """Collects per-request outcomes and queue depth samples for one run"""
+
+    def __init__(self, client, api_keys: List[str], payloads, form: Dict[str, str], timeout: float):
+        self.client = client
+        self.api_keys = api_keys
+        self.payloads = payloads
+        self.weights = [weight for _, _, weight in payloads]
+        self.form = form
+        self.timeout = timeout
+        self.latencies: List[float] = []
+        self.statuses: Counter = Counter()
+        self.errors: Counter = Counter()
+        self.server_timings: Dict[str, List[float]] = {}
+        self.queue_samples: List[Dict[str, Any]] = []
+        self.started = time.perf_counter()
+        self.sent = 0
+
+    async def send(self, scheduled_at: Optional[float] = None):
+        """One request; latency counts from scheduled_at so open-loop backlog is not hidden"""
+        filename, data, _ = random.choices(self.payloads, weights=self.weights)[0]
+        api_key = self.api_keys[self.sent % len(self.api_keys)]
+        self.sent += 1
+        started = scheduled_at if scheduled_at is not None else time.perf_counter()
+        try:
+            response = await self.client.post(
+                "/remove-background",
+                data={**self.form, "api_key": api_key},
+                files={"file": (filename, data, "application/octet-stream")},
+                timeout=self.timeout
+            )
+        except Exception as e:
+            self.errors[type(e).__name__] += 1
+            return
+        elapsed = time.perf_counter() - started
+        self.statuses[response.status_code] += 1
+        if response.status_code == 200:
+            self.latencies.append(elapsed)
+            for name, ms in parse_server_timing(response.headers.get("server-timing")).items():
+                self.server_timings.setdefault(name, []).append(ms)
+
+    async def sample_queue(self, interval: float, stop: asyncio.Event):
+        while not stop.is_set():
+            try:
+                response = await self.client.get("/queue-stats", timeout=self.timeout)
+                stats = response.json()
+                self.queue_samples.append({
+                    "t": round(time.perf_counter() - self.started, 3),
+                    "queued": stats.get("queued", 0),
+                    "busy_workers": sum(lane.get("busy_workers", 0) for lane in stats.get("lanes", [])),
+                    "lanes": {lane["name"]: lane["queued"] for lane in stats.get("lanes", [])}
+                })
+            except Exception:
+                pass
+            try:
+                await asyncio.wait_for(stop.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def report(self, elapsed: float) -> Dict[str, Any]:
+        completed = sum(self.statuses.values()) + sum(self.errors.values())
+        failed = completed - self.statuses.get(200, 0)
+        latencies = np.asarray(self.latencies) * 1000
+        report = {
+            "elapsed_s": round(elapsed, 3),
+            "requests": completed,
+            "succeeded": self.statuses.get(200, 0),
+            "throughput_per_s": round(self.statuses.get(200, 0) / elapsed, 3) if elapsed > 0 else 0.0,
+            "error_rate": round(failed / completed, 4) if completed else 0.0,
+            "status_codes": {str(code): count for code, count in sorted(self.statuses.items())},
+            "exceptions": dict(self.errors),
+            "queue_depth": self.queue_samples,
+            "max_queue_depth": max((s["queued"] for s in self.queue_samples), default=0)
+        }
+        if len(latencies):
+            report["latency_ms"] = {
+                "p50": round(float(np.percentile(latencies, 50)), 2),
+                "p95": round(float(np.percentile(latencies, 95)), 2),
+                "p99": round(float(np.percentile(latencies, 99)), 2),
+                "mean": round(float(latencies.mean()), 2),
+                "max": round(float(latencies.max()), 2)
+            }
+        report["server_timing_p50_ms"] = {
+            name: round(float(np.percentile(values, 50)), 2)
+            for name, values in sorted(self.server_timings.items())
+        }
+        return report
+
+
+async def closed_loop(run: LoadRun, concurrency: int, total: Optional[int], deadline: Optional[float]):
+    """concurrency clients, each sending its next request when the last one returns"""
+    remaining = [total]
+
+    async def client():
+        while True:
+            if deadline is not None and time.perf_counter() >= deadline:
+                return
+            if remaining[0] is not None:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            await run.send()
+
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+
+
+async def open_loop(run: LoadRun, rate: float, arrival: str, total: Optional[int],
+                    deadline: Optional[float], max_outstanding: int):
+    """Requests start on a fixed schedule regardless of how many are still in flight"""
+    outstanding = set()
+    next_at = time.perf_counter()
+    sent = 0
+    while (total is None or sent < total) and (deadline is None or next_at < deadline):
+        delay = next_at - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if len(outstanding) >= max_outstanding:
+            run.errors["client_overloaded"] += 1
+        else:
+            task = asyncio.ensure_future(run.send(scheduled_at=next_at))
+            outstanding.add(task)
+            task.add_done_callback(outstanding.discard)
+        sent += 1
+        next_at += random.expovariate(rate) if arrival == "poisson" else 1.0 / rate
+    if outstanding:
+        await asyncio.gather(*outstanding)
+
+
+async def create_api_keys(client, count: int) -> List[str]:
+    keys = []
+    for index in range(count):
+        response = await client.post("/api-keys", data={"key_name": f"loadgen-{index}"})
+        response.raise_for_status()
+        body = response.json()
+        keys.append(body.get("key") or body["api_key"])
+    return keys
+
+
+async def execute(args, client) -> Dict[str, Any]:
+    api_keys = args.api_key or await create_api_keys(client, args.keys)
+    payloads = build_payloads(parse_mix(args.mix), args.format)
+    form = {"alpha_matting": str(args.alpha_matting).lower()}
+    run = LoadRun(client, api_keys, payloads, form, args.timeout)
+
+    deadline = time.perf_counter() + args.duration if args.duration else None
+    total = args.requests
+    stop = asyncio.Event()
+    sampler = asyncio.ensure_future(run.sample_queue(args.sample_interval, stop))
+
+    run.started = time.perf_counter()
+    if args.rate:
+        await open_loop(run, args.rate, args.arrival, total, deadline, args.max_outstanding)
+    else:
+        await closed_loop(run, args.concurrency, total, deadline)
+    elapsed = time.perf_counter() - run.started
+
+    stop.set()
+    await sampler
+
+    report = run.report(elapsed)
+    report["config"] = {
+        "target": args.url or "in-process",
+        "mode": "open" if args.rate else "closed",
+        "concurrency": None if args.rate else args.concurrency,
+        "rate": args.rate,
+        "arrival": args.arrival if args.rate else None,
+        "mix": args.mix,
+        "format": args.format,
+        "alpha_matting": args.alpha_matting,
+        "api_keys": len(api_keys),
+        "stub": args.stub
+    }
+    return report
+
+
+async def run_in_process(args) -> Dict[str, Any]:
+    import httpx
+    if args.stub:
+        configure_stub(args)
+    import main
+
+    # ASGITransport does not send lifespan events, so run startup/shutdown here
+    async with main.app.router.lifespan_context(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadgen") as client:
+            return await execute(args, client)
+
+
+async def run_remote(args) -> Dict[str, Any]:
+    import httpx
+    limits = httpx.Limits(max_connections=max(args.concurrency, args.max_outstanding))
+    async with httpx.AsyncClient(base_url=args.url, limits=limits) as client:
+        return await execute(args, client)
+
+
+def _use_scratch_database():
+    """In-process runs get a throwaway SQLite database unless DATABASE_URL is set"""
+    if "DATABASE_URL" not in os.environ:
+        path = os.path.join(tempfile.mkdtemp(prefix="loadgen-"), "loadgen.db")
+        os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+
+
+def run_command(args) -> int:
+    if args.seed is not None:
+        random.seed(args.seed)
+    if args.url:
+        report = asyncio.run(run_remote(args))
+    else:
+        _use_scratch_database()
+        report = asyncio.run(run_in_process(args))
+
+    latency = report.get("latency_ms", {})
+    print(
+        f"{report['succeeded']}/{report['requests']} ok in {report['elapsed_s']}s, "
+        f"{report['throughput_per_s']} req/s, p50 {latency.get('p50')} ms, p95 {latency.get('p95')} ms, "
+        f"p99 {latency.get('p99')} ms, errors {report['error_rate']:.1%}, max queue {report['max_queue_depth']}",
+        file=sys.stderr
+    )
+    write_results(args.output, report)
+    return 0
+
+
+def serve_command(args) -> int:
+    """Run uvicorn in this process, optionally with the stub model installed"""
+    import uvicorn
+    _use_scratch_database()
+    if args.stub:
+        configure_stub(args)
+    import main
+    uvicorn.run(main.app, host=args.host, port=args.port, log_level="warning")
+    return 0
+
+
+def _add_stub_arguments(parser):
+    parser.add_argument("--stub", action="store_true", help="use the fake inference engine instead of U2Net")
+    parser.add_argument("--stub-latency", type=float, default=0.05, help="stub seconds per request")
+    parser.add_argument("--stub-latency-per-mp", type=float, default=0.0, help="extra stub seconds per megapixel")
+    parser.add_argument("--stub-mask", default="ellipse", help="fake mask shape (see engines.FAKE_MASK_SHAPES)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the background removal API")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="generate load and report latency")
+    run_parser.add_argument("--url", default=None, help="server base URL; omit to drive the app in-process")
+    run_parser.add_argument("--concurrency", "-c", type=int, default=8, help="closed-loop clients")
+    run_parser.add_argument("--rate", type=float, default=None,
+                            help="open-loop arrival rate in req/s (overrides --concurrency)")
+    run_parser.add_argument("--arrival", choices=("poisson", "uniform"), default="poisson")
+    run_parser.add_argument("--max-outstanding", type=int, default=1000,
+                            help="open-loop cap on in-flight requests")
+    run_parser.add_argument("--requests", "-n", type=int, default=None,
+                            help="total requests (default 200 unless --duration is given)")
+    run_parser.add_argument("--duration", "-d", type=float, default=None, help="run for this many seconds")
+    run_parser.add_argument("--mix", default="640x480", help="image sizes with weights, e.g. 640x480:0.7,1920x1080:0.3")
+    run_parser.add_argument("--format", choices=("PNG", "JPEG"), default="JPEG", help="upload encoding")
+    run_parser.add_argument("--alpha-matting", action="store_true")
+    run_parser.add_argument("--api-key", action="append", default=None,
+                            help="existing API key (repeatable); otherwise keys are created")
+    run_parser.add_argument("--keys", type=int, default=1, help="API keys to create and round-robin over")
+    run_parser.add_argument("--sample-interval", type=float, default=0.5, help="seconds between /queue-stats samples")
+    run_parser.add_argument("--timeout", type=float, default=300.0, help="per-request timeout in seconds")
+    run_parser.add_argument("--seed", type=int, default=None)
+    run_parser.add_argument("--output", "-o", default=None, help="write the JSON report here instead of stdout")
+    _add_stub_arguments(run_parser)
+    run_parser.set_defaults(func=run_command)
+
+    serve_parser = subparsers.add_parser("serve", help="run the API under uvicorn for --url runs")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8000)
+    _add_stub_arguments(serve_parser)
+    serve_parser.set_defaults(func=serve_command)
+
+    args = parser.parse_args()
+    if args.command == "run" and not args.requests and not args.duration:
+        args.requests = 200
+    sys.exit(args.func(args))
+
+
+if __name__ == "__main__":
+    main()
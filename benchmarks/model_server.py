@@ -0,0 +1,136 @@
+"""
+Local stand-in for the model download host
+
+Serves a directory over HTTP with Range support, optional bandwidth
+throttling and dropped connections, so the downloader in
+backgroundremover.github can be exercised (and timed) offline:
+
+    python -m benchmarks.model_server --split models/u2net.pth --parts u2aa,u2ab,u2ac,u2ad --dir /tmp/mirror
+    python -m benchmarks.model_server --dir /tmp/mirror --port 8765 --drop-after 1000000 &
+    BACKGROUNDREMOVER_MODEL_BASE_URL=http://127.0.0.1:8765 python -c \\
+        "from backgroundremover import github; github.download_files_from_github('/tmp/u2net.pth', 'u2net', expected_md5='<md5>')"
+
+--drop-after closes the first response for each file after that many bytes,
+forcing the client to resume with a Range request.
+"""
+
+import os
+import re
+import time
+import argparse
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from typing import List
+
+from benchmarks import common  # noqa: F401 - puts backgroundremover on sys.path
+
+_RANGE = re.compile(r"bytes=(\d+)-(\d*)")
+
+
+def split_file(src: str, names: List[str], out_dir: str) -> str:
+    """Split src into len(names) parts under out_dir; returns the md5 of src"""
+    from backgroundremover.github import md5_file
+
+    os.makedirs(out_dir, exist_ok=True)
+    size = os.path.getsize(src)
+    part_size = -(-size // len(names))
+    with open(src, "rb") as f:
+        for name in names:
+            with open(os.path.join(out_dir, name), "wb") as part:
+                part.write(f.read(part_size))
+    return md5_file(src)
+
+
+def make_handler(directory: str, bytes_per_second: float, drop_after: int):
+    dropped = set()
+    lock = threading.Lock()
+
+    class Handler(SimpleHTTPRequestHandler):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, directory=directory, **kwargs)
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            path = self.translate_path(self.path)
+            if not os.path.isfile(path):
+                self.send_error(404)
+                return
+            size = os.path.getsize(path)
+            start, end = 0, size - 1
+            match = _RANGE.match(self.headers.get("Range", ""))
+            if match:
+                start = int(match.group(1))
+                end = int(match.group(2)) if match.group(2) else size - 1
+                if start >= size:
+                    self.send_response(416)
+                    self.send_header("Content-Range", f"bytes */{size}")
+                    self.end_headers()
+                    return
+                self.send_response(206)
+                self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+            else:
+                self.send_response(200)
+            self.send_header("Content-Length", str(end - start + 1))
+            self.send_header("Accept-Ranges", "bytes")
+            self.end_headers()
+
+            with lock:
+                drop = drop_after > 0 and path not in dropped
+                if drop:
+                    dropped.add(path)
+            limit = min(end - start + 1, drop_after) if drop else end - start + 1
+
+            with open(path, "rb") as f:
+                f.seek(start)
+                sent = 0
+                while sent < limit:
+                    chunk = f.read(min(64 * 1024, limit - sent))
+                    if not chunk:
+                        break
+                    self.wfile.write(chunk)
+                    sent += len(chunk)
+                    if bytes_per_second:
+                        time.sleep(len(chunk) / bytes_per_second)
+            if drop:
+                self.close_connection = True
+                self.connection.shutdown(2)
+
+    return Handler
+
+
+def serve(directory: str, host: str = "127.0.0.1", port: int = 0, bytes_per_second: float = 0,
+          drop_after: int = 0) -> ThreadingHTTPServer:
+    """Start the server in a daemon thread; server.server_address has the bound port"""
+    server = ThreadingHTTPServer((host, port), make_handler(directory, bytes_per_second, drop_after))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve model files with Range support for offline download tests")
+    parser.add_argument("--dir", required=True, help="directory to serve (or write parts into with --split)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--bandwidth-mbps", type=float, default=0, help="throttle each response (MB/s)")
+    parser.add_argument("--drop-after", type=int, default=0, help="cut the first response per file after N bytes")
+    parser.add_argument("--split", default=None, help="checkpoint to split into --parts and exit")
+    parser.add_argument("--parts", default="u2aa,u2ab,u2ac,u2ad", help="part names for --split")
+    args = parser.parse_args()
+
+    if args.split:
+        md5 = split_file(args.split, common.parse_list(args.parts), args.dir)
+        print(f"Split {args.split} into {args.dir} (md5 {md5})")
+        return
+
+    server = serve(args.dir, args.host, args.port, args.bandwidth_mbps * 1024 * 1024, args.drop_after)
+    print(f"Serving {args.dir} on http://{args.host}:{server.server_address[1]}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
 import os
-from sqlalchemy import create_engine, Column, String, DateTime, Integer
+from sqlalchemy import create_engine, Column, String, DateTime, Integer, Float
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime, timedelta
@@ -26,6 +26,19 @@ class APIKey(Base):
     usage_count = Column(Integer, default=0)
     is_active = Column(String, default="true")  # Using string for SQLite compatibility
 
+class UsageEvent(Base):
+    """Append-only per-request usage record (written only when USAGE_EVENTS_ENABLED)"""
+    __tablename__ = "usage_events"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    api_key_id = Column(Integer, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    endpoint = Column(String)
+    model = Column(String, nullable=True)
+    processing_time = Column(Float, nullable=True)
+    bytes_in = Column(Integer, nullable=True)
+    bytes_out = Column(Integer, nullable=True)
+
 def create_tables():
     Base.metadata.create_all(bind=engine)
 
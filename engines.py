@@ -0,0 +1,182 @@
+"""
+Inference engines for BackgroundRemover
+
+An engine turns a decoded RGB image into an "L" mode foreground mask; the
+remover handles decoding, matting/compositing and encoding around it.
+BG_REMOVER_ENGINE selects the implementation:
+
+    u2net - U2Net weights through backgroundremover (default)
+    fake  - deterministic synthetic mask after a configurable sleep; needs
+            no weights or network, for load tests and local development
+"""
+
+import os
+import time
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from backgroundremover.timing import stage
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+BG_REMOVER_ENGINE = os.getenv("BG_REMOVER_ENGINE", "u2net")
+# Fake engine: seconds per call, extra seconds per input megapixel, mask shape
+FAKE_ENGINE_LATENCY = float(os.getenv("FAKE_ENGINE_LATENCY", "0.05"))
+FAKE_ENGINE_LATENCY_PER_MP = float(os.getenv("FAKE_ENGINE_LATENCY_PER_MP", "0"))
+FAKE_ENGINE_MASK = os.getenv("FAKE_ENGINE_MASK", "ellipse")
+
+FAKE_MASK_SHAPES = ("ellipse", "rectangle", "gradient", "full", "empty")
+# U2Net predicts at 320x320; the fake engine returns masks at the same size
+MASK_RESOLUTION = 320
+
+
+class InferenceEngine:
+    """Base class: load() caches a model, predict_mask() runs it"""
+
+    name = "base"
+
+    def __init__(self):
+        # model name -> loaded model (BackgroundRemover.model_cache)
+        self.models: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def load(self, model_name: str, timings: Optional[Dict[str, float]] = None) -> Any:
+        """
+        Return the cached model, loading it on first use. Only a call that
+        had to load (or wait for another thread's load) adds "model_load" to
+        timings; the load itself is recorded in the model load histogram.
+        """
+        model = self.models.get(model_name)
+        if model is not None:
+            return model
+        with stage(timings, "model_load"), self._lock:
+            if model_name not in self.models:
+                started = time.perf_counter()
+                self.models[model_name] = self._load(model_name)
+                metrics.observe_model_load(model_name, time.perf_counter() - started)
+            return self.models[model_name]
+
+    def _load(self, model_name: str) -> Any:
+        raise NotImplementedError
+
+    def predict_mask(
+        self,
+        image: Image.Image,
+        model_name: str,
+        timings: Optional[Dict[str, float]] = None
+    ) -> Image.Image:
+        raise NotImplementedError
+
+    def warmup(self, model_name: str, batch_size: int = 1):
+        """Run a throwaway forward pass so kernels for this batch shape are ready"""
+        self.load(model_name)
+
+    def loaded_models(self) -> List[str]:
+        return sorted(self.models)
+
+    def clear(self):
+        with self._lock:
+            self.models.clear()
+
+
+class U2NetEngine(InferenceEngine):
+    """U2Net models loaded once per process and shared by all worker threads"""
+
+    name = "u2net"
+
+    def __init__(self, resolve_path: Callable[[str], str]):
+        super().__init__()
+        # Returns a local weights path for a model name, downloading if needed
+        self.resolve_path = resolve_path
+
+    def _load(self, model_name: str):
+        from backgroundremover.u2net import detect
+        model_path = self.resolve_path(model_name)
+        logger.info(f"Loading {model_name} weights from {model_path}")
+        return detect.load_model(model_name=model_name, model_path=model_path)
+
+    def warmup(self, model_name, batch_size=1):
+        import torch
+        net = self.load(model_name)
+        device = next(net.parameters()).device
+        with torch.no_grad():
+            net(torch.zeros(batch_size, 3, MASK_RESOLUTION, MASK_RESOLUTION, device=device))
+
+    def predict_mask(self, image, model_name, timings=None):
+        from backgroundremover.u2net import detect
+        net = self.load(model_name)
+        return detect.predict(net, np.array(image), timings=timings).convert("L")
+
+
+class FakeEngine(InferenceEngine):
+    """
+    Deterministic stand-in for U2Net: sleeps latency + latency_per_mp * MP,
+    then returns a fixed mask shape. Output depends only on the settings.
+    """
+
+    name = "fake"
+
+    def __init__(
+        self,
+        latency: float = FAKE_ENGINE_LATENCY,
+        latency_per_mp: float = FAKE_ENGINE_LATENCY_PER_MP,
+        mask_shape: str = FAKE_ENGINE_MASK
+    ):
+        super().__init__()
+        if mask_shape not in FAKE_MASK_SHAPES:
+            raise ValueError(f"Unknown fake mask shape {mask_shape!r}, choose from {', '.join(FAKE_MASK_SHAPES)}")
+        self.latency = latency
+        self.latency_per_mp = latency_per_mp
+        self.mask_shape = mask_shape
+        self._mask = self._build_mask(mask_shape)
+
+    def _load(self, model_name: str):
+        return model_name
+
+    @staticmethod
+    def _build_mask(shape: str) -> Image.Image:
+        size = MASK_RESOLUTION
+        if shape == "full":
+            return Image.new("L", (size, size), 255)
+        if shape == "empty":
+            return Image.new("L", (size, size), 0)
+        if shape == "gradient":
+            row = np.linspace(0, 255, size, dtype=np.float32)
+            return Image.fromarray(np.tile(row, (size, 1)).astype(np.uint8), "L")
+
+        mask = Image.new("L", (size, size), 0)
+        draw = ImageDraw.Draw(mask)
+        box = (size * 0.2, size * 0.1, size * 0.8, size * 0.9)
+        if shape == "ellipse":
+            draw.ellipse(box, fill=255)
+        else:
+            draw.rectangle(box, fill=255)
+        return mask
+
+    def predict_mask(self, image, model_name, timings=None):
+        self.load(model_name)
+        with stage(timings, "inference"):
+            megapixels = image.size[0] * image.size[1] / 1_000_000
+            delay = self.latency + self.latency_per_mp * megapixels
+            if delay > 0:
+                time.sleep(delay)
+            return self._mask.copy()
+
+
+def create_engine(name: str, resolve_path: Callable[[str], str]) -> InferenceEngine:
+    """Build the engine named by BG_REMOVER_ENGINE"""
+    if name == "u2net":
+        return U2NetEngine(resolve_path)
+    if name == "fake":
+        logger.warning(
+            f"Using fake inference engine ({FAKE_ENGINE_MASK} mask, {FAKE_ENGINE_LATENCY}s latency) "
+            "- output is synthetic"
+        )
+        return FakeEngine()
+    raise ValueError(f"Unknown BG_REMOVER_ENGINE {name!r}, choose 'u2net' or 'fake'")
@@ -1,11 +1,17 @@
 from fastapi import FastAPI, File, UploadFile, Depends, HTTPException, status, Form, Request
-from fastapi.responses import StreamingResponse, JSONResponse, FileResponse
+from fastapi.responses import StreamingResponse, JSONResponse, FileResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+from fastapi.security import APIKeyHeader
 from sqlalchemy.orm import Session
 import io
 import os
+import hmac
+import asyncio
+import json
+import time
 import logging
+import threading
 from typing import Optional
 from dotenv import load_dotenv
 
@@ -52,22 +58,49 @@ async def handle_options(path: str):
 try:
     from database import get_db, APIKey, generate_api_key, create_tables
     from models import APIKeyCreate, APIKeyResponse, BackgroundRemovalResponse, ErrorResponse
-    from background_remover import BackgroundRemover
+    from background_remover import BackgroundRemover, sniff_image_size
     from auth import validate_api_key
+    from usage import usage_recorder
+    from scheduler import inference_scheduler, SchedulerRejected
+    from admission import memory_budget
+    from auth import api_key_cache
+    import metrics
+    metrics.register_runtime_collectors(api_key_cache, inference_scheduler)
+    from warmup import warmup, WARMUP_ENABLED
+    from video_jobs import video_jobs, VideoJobRejected, OUTPUT_FORMATS, VIDEO_EXTENSIONS, VIDEO_MAX_UPLOAD_MB
     FULL_FUNCTIONALITY = True
     logger.info("All dependencies loaded successfully - full functionality enabled")
 except ImportError as e:
     logger.warning(f"Some dependencies missing: {e} - running in limited mode")
     FULL_FUNCTIONALITY = False
 
+# On-demand profiling (admin API keys only)
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+ADMIN_API_KEYS = {key.strip() for key in os.getenv("ADMIN_API_KEYS", "").split(",") if key.strip()}
+
+# API key sent as a header by the management and video job endpoints, so it stays out of URLs
+api_key_header = APIKeyHeader(name="X-API-Key", auto_error=False)
+
+def is_admin_key(api_key: Optional[str]) -> bool:
+    """Constant-time check of api_key against ADMIN_API_KEYS"""
+    if not api_key:
+        return False
+    return any(hmac.compare_digest(api_key.encode(), admin_key.encode()) for admin_key in ADMIN_API_KEYS)
+
 # Initialize background remover lazily
 logger.info("Setting up background remover (lazy initialization)...")
 bg_remover = None
+# Startup warmup and the first request may race to initialize
+bg_remover_lock = threading.Lock()
 
 def get_background_remover():
     """Get background remover instance with lazy initialization"""
     global bg_remover
-    if bg_remover is None:
+    if bg_remover is not None:
+        return bg_remover
+    with bg_remover_lock:
+        if bg_remover is not None:
+            return bg_remover
         try:
             logger.info("Initializing background remover on first use...")
             if FULL_FUNCTIONALITY:
@@ -92,9 +125,36 @@ async def startup_event():
         except Exception as e:
             logger.error(f"Failed to create database tables: {e}")
             # Don't fail startup, just log the error
+        if memory_budget is not None:
+            # Weights are shared by all requests: charge them to the budget once, not per request
+            try:
+                memory_budget.set_resident(get_background_remover().resident_memory())
+            except HTTPException:
+                logger.error("Could not size model weights for the memory budget")
+        usage_recorder.start()
+        inference_scheduler.start()
+        video_jobs.start()
+        if WARMUP_ENABLED:
+            # Load models and prime kernels in the background; /ready flips when done
+            warmup.start(get_background_remover)
+        else:
+            warmup.mark_ready()
     else:
         logger.info("Running in limited mode - database initialization skipped")
 
+# Flush buffered API key usage on graceful shutdown
+@app.on_event("shutdown")
+async def shutdown_event():
+    if FULL_FUNCTIONALITY:
+        warmup.stop()
+        logger.info("Draining inference queue before shutdown...")
+        # Joining the lane workers blocks for up to 30s; keep the event loop free meanwhile
+        await asyncio.to_thread(inference_scheduler.stop)
+        logger.info("Cancelling video jobs...")
+        video_jobs.stop()
+        logger.info("Flushing API key usage before shutdown...")
+        usage_recorder.stop()
+
 @app.get("/")
 async def root():
     """Serve the main HTML interface"""
@@ -113,8 +173,15 @@ async def api_info():
         "endpoints": {
             "generate_api_key": "POST /api-keys",
             "list_api_keys": "GET /api-keys",
+            "deactivate_api_key": "DELETE /api-keys/{api_key_id}",
             "remove_background": "POST /remove-background",
-            "health": "GET /health"
+            "remove_background_video": "POST /remove-background/video",
+            "video_job_status": "GET /remove-background/video/{job_id}",
+            "video_job_result": "GET /remove-background/video/{job_id}/result",
+            "queue_stats": "GET /queue-stats",
+            "metrics": "GET /metrics",
+            "health": "GET /health",
+            "ready": "GET /ready"
         }
     }
 
@@ -168,7 +235,9 @@ async def health_check():
                 "system_memory_available_gb": round(system_memory.available / 1024 / 1024 / 1024, 2),
                 "system_memory_percent": system_memory.percent
             },
-            "background_remover": bg_health
+            "background_remover": bg_health,
+            "warmup": warmup.stats() if FULL_FUNCTIONALITY else None,
+            "video_jobs": video_jobs.stats() if FULL_FUNCTIONALITY else None
         }
     except Exception as e:
         logger.error(f"Health check failed: {e}")
@@ -177,6 +246,46 @@ async def health_check():
             content={"status": "error", "message": str(e)}
         )
 
+@app.get("/ready")
+async def readiness_check():
+    """Readiness probe: 200 once models are loaded and warmed up, 503 before"""
+    if not FULL_FUNCTIONALITY:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "not_ready", "reason": "dependencies_missing"}
+        )
+    
+    stats = warmup.stats()
+    if not stats["ready"]:
+        return JSONResponse(status_code=503, content={"status": "not_ready", "warmup": stats})
+    
+    return {"status": "ready", "warmup": stats}
+
+@app.get("/queue-stats")
+async def queue_stats(api_key: Optional[str] = Depends(api_key_header)):
+    """
+    Queue depth and wait times per lane for the inference scheduler. The
+    per-API-key breakdown (ids and names) is only included for admin keys
+    sent in X-API-Key.
+    """
+    if not FULL_FUNCTIONALITY:
+        return {"status": "disabled", "reason": "dependencies_missing"}
+    
+    return inference_scheduler.stats(per_key=is_admin_key(api_key))
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus metrics: per-stage latency histograms, queue state, cache hits"""
+    payload = metrics.render_metrics() if FULL_FUNCTIONALITY else None
+    if payload is None:
+        return Response(
+            content="prometheus_client not installed\n",
+            status_code=503,
+            media_type="text/plain"
+        )
+    
+    return Response(content=payload, media_type=metrics.CONTENT_TYPE_LATEST)
+
 # API key generation endpoint
 @app.post("/api-keys")
 async def generate_api_key_endpoint(
@@ -220,9 +329,12 @@ async def generate_api_key_endpoint(
             name=key_name,
             is_active=True
         )
-        db.add(db_api_key)
-        db.commit()
-        db.refresh(db_api_key)
+        try:
+            db.add(db_api_key)
+            db.commit()
+            db.refresh(db_api_key)
+        finally:
+            db.close()
         
         logger.info(f"API key generated successfully: {api_key[:8]}...")
         
@@ -251,12 +363,16 @@ async def list_api_keys():
     
     try:
         from database import get_db
+        from auth import is_active
         db = next(get_db())
         
         logger.info("Listing API keys")
         
         # Get all API keys
-        api_keys = db.query(APIKey).all()
+        try:
+            api_keys = db.query(APIKey).all()
+        finally:
+            db.close()
         
         # Convert to response format
         response_keys = []
@@ -264,7 +380,7 @@ async def list_api_keys():
             response_keys.append({
                 "api_key": key.key[:8] + "..." + key.key[-4:],  # Show partial key for security
                 "name": key.name,
-                "status": "active" if key.is_active else "inactive",
+                "status": "active" if is_active(key.is_active) else "inactive",
                 "created_at": key.created_at.isoformat()
             })
         
@@ -273,6 +389,44 @@ async def list_api_keys():
         logger.error(f"Failed to list API keys: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to list API keys: {str(e)}")
 
+# Deactivate API key endpoint
+@app.delete("/api-keys/{api_key_id}")
+async def deactivate_api_key_endpoint(api_key_id: int, api_key: Optional[str] = Depends(api_key_header)):
+    """
+    Deactivate an API key and evict it from the validation cache.
+    
+    Requires an X-API-Key header holding either an admin key (ADMIN_API_KEYS)
+    or the secret of the key being deactivated.
+    """
+    if not FULL_FUNCTIONALITY:
+        raise HTTPException(
+            status_code=503,
+            detail="API key management not available in limited mode"
+        )
+    if not api_key:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Missing X-API-Key header"
+        )
+    
+    from database import get_db
+    from auth import deactivate_api_key, owns_api_key
+    db = next(get_db())
+    try:
+        # Unknown ids and other keys' ids are indistinguishable to non-admins
+        if not is_admin_key(api_key) and not owns_api_key(api_key_id, api_key, db):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Not allowed to deactivate this API key"
+            )
+        if not deactivate_api_key(api_key_id, db):
+            raise HTTPException(status_code=404, detail="API key not found")
+        
+        logger.info(f"API key {api_key_id} deactivated")
+        return {"id": api_key_id, "status": "inactive"}
+    finally:
+        db.close()
+
 # Mount static files for assets (only if directory exists)
 if os.path.exists("assets"):
     app.mount("/assets", StaticFiles(directory="assets"), name="assets")
@@ -294,9 +448,20 @@ async def remove_background(
     alpha_matting_background_threshold: int = Form(10),
     alpha_matting_erode_structure_size: int = Form(10),
     alpha_matting_base_size: int = Form(1000),
+    include_metadata: bool = Form(False),
+    profile: bool = Form(False),
     api_key: str = Form(...)
 ):
-    """Remove background from image"""
+    """
+    Remove background from image.
+    
+    Every response carries a Server-Timing header with per-stage durations;
+    with include_metadata=true an X-Processing-Metadata header adds the same
+    breakdown as JSON together with model and input/output sizes.
+    
+    profile=true (admin API keys only) captures a cProfile and torch.profiler
+    trace of the processing under PROFILE_DIR and returns its id in X-Profile-Id.
+    """
     if not FULL_FUNCTIONALITY:
         raise HTTPException(
             status_code=503,
@@ -305,17 +470,29 @@ async def remove_background(
     
     try:
         from database import get_db
-        from auth import validate_api_key_string
+        from auth import resolve_api_key
         db = next(get_db())
         
         logger.info(f"Processing background removal request for file: {file.filename}")
         
-        # Validate API key
-        if not validate_api_key_string(api_key, db):
+        # Validate API key (cached); release the session before inference
+        try:
+            key_record = resolve_api_key(api_key, db)
+        finally:
+            db.close()
+        
+        if key_record is None:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid API key"
             )
+        usage_recorder.record(key_record.id)
+        
+        if profile and not is_admin_key(api_key):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Profiling is restricted to admin API keys"
+            )
         
         # Validate file
         if not file.filename.lower().endswith(('.png', '.jpg', '.jpeg')):
@@ -324,38 +501,144 @@ async def remove_background(
                 detail="Only PNG, JPG, and JPEG files are supported"
             )
         
+        # Per-stage timings for this request (merged with the pipeline's own)
+        request_started = time.perf_counter()
+        timings = {}
+        
         # Read file content
+        read_started = time.perf_counter()
         content = await file.read()
+        timings["upload_read"] = time.perf_counter() - read_started
+        
+        # Sniff dimensions from the header to estimate cost before decoding
+        image_size = sniff_image_size(content)
+        if image_size is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid image file"
+            )
         
         # Get background remover instance
         remover = get_background_remover()
+        cost = remover.estimate_cost(
+            image_size,
+            alpha_matting=alpha_matting,
+            alpha_matting_base_size=alpha_matting_base_size
+        )
+        memory = remover.estimate_peak_memory(
+            image_size,
+            alpha_matting=alpha_matting,
+            alpha_matting_base_size=alpha_matting_base_size,
+            output_format="PNG"
+        )
         
-        # Process image
+        # Process image on the per-API-key fair queue of the matching cost lane
         logger.info("Starting background removal process...")
-        result_image, metadata = remover.remove_background(
-            content,
+        process_kwargs = dict(
             alpha_matting=alpha_matting,
             alpha_matting_foreground_threshold=alpha_matting_foreground_threshold,
             alpha_matting_background_threshold=alpha_matting_background_threshold,
             alpha_matting_erode_structure_size=alpha_matting_erode_structure_size,
             alpha_matting_base_size=alpha_matting_base_size
         )
+        job_fn, job_args = remover.remove_background, (content,)
+        if profile:
+            # Imported only when requested so unprofiled requests pay nothing
+            from backgroundremover.profiling import profile_call, ProfilerBusy
+            job_fn, job_args = profile_call, (remover.remove_background, content)
+            process_kwargs["profile_dir"] = PROFILE_DIR
+            # Don't hold an inference worker while another request is being profiled
+            process_kwargs["wait"] = False
+        
+        profile_id = None
+        try:
+            result = await inference_scheduler.submit(
+                key_record.id,
+                job_fn,
+                *job_args,
+                key_name=key_record.name,
+                cost=cost,
+                memory=memory,
+                timings=timings,
+                **process_kwargs
+            )
+        except SchedulerRejected as e:
+            metrics.observe_rejection(e.status_code)
+            headers = {"Retry-After": str(max(1, round(e.retry_after)))} if e.retry_after else None
+            raise HTTPException(status_code=e.status_code, detail=e.detail, headers=headers)
+        except Exception as e:
+            if profile and isinstance(e, ProfilerBusy):
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail="Another profiled request is running; retry without profile=true or later"
+                )
+            raise
+        
+        if profile:
+            result, profile_id = result
+            logger.info(f"Profile {profile_id} written to {PROFILE_DIR}")
+        result_image, metadata = result
         
         logger.info("Background removal completed successfully")
+        warmup.mark_request_succeeded()
+        
+        timings.update(metadata.get("timings", {}))
         
         # Convert PIL Image to bytes
+        encode_started = time.perf_counter()
         img_byte_arr = io.BytesIO()
         result_image.save(img_byte_arr, format='PNG')
         img_byte_arr.seek(0)
+        timings["encode"] = timings.get("encode", 0.0) + time.perf_counter() - encode_started
+        
+        lane = inference_scheduler.lane_for(cost).name
+        bytes_out = img_byte_arr.getbuffer().nbytes
+        metrics.observe_request(
+            metadata,
+            timings,
+            lane=lane,
+            bytes_in=len(content),
+            bytes_out=bytes_out
+        )
+        
+        usage_recorder.record_event(
+            key_record.id,
+            endpoint="/remove-background",
+            model=metadata.get("model_used"),
+            processing_time=metadata.get("processing_time"),
+            bytes_in=len(content),
+            bytes_out=bytes_out
+        )
+        
+        total_time = time.perf_counter() - request_started
+        response_headers = {
+            "Content-Disposition": f"attachment; filename=processed_{file.filename.replace('.jpg', '.png').replace('.jpeg', '.png')}",
+            "Access-Control-Allow-Origin": "*",
+            "Access-Control-Expose-Headers": "Server-Timing, X-Processing-Metadata, X-Profile-Id",
+            "Timing-Allow-Origin": "*",
+            "Server-Timing": metrics.format_server_timing(timings, total_time)
+        }
+        if profile_id is not None:
+            response_headers["X-Profile-Id"] = profile_id
+        if include_metadata:
+            response_headers["X-Processing-Metadata"] = json.dumps({
+                "model_used": metadata.get("model_used"),
+                "alpha_matting_enabled": metadata.get("alpha_matting_enabled"),
+                "lane": lane,
+                "processing_time": metadata.get("processing_time"),
+                "total_time": total_time,
+                "timings_ms": {stage_name: round(value * 1000, 1) for stage_name, value in timings.items()},
+                "input_size": list(metadata.get("input_size", ())),
+                "output_size": list(metadata.get("output_size", ())),
+                "input_bytes": len(content),
+                "output_bytes": bytes_out
+            }, separators=(",", ":"))
         
         # Return processed image
         return StreamingResponse(
             img_byte_arr,
             media_type="image/png",
-            headers={
-                "Content-Disposition": f"attachment; filename=processed_{file.filename.replace('.jpg', '.png').replace('.jpeg', '.png')}",
-                "Access-Control-Allow-Origin": "*"
-            }
+            headers=response_headers
         )
         
     except HTTPException:
@@ -367,6 +650,154 @@ async def remove_background(
             detail=f"Background removal failed: {str(e)}"
         )
 
+def _authorize_video_request(api_key: str):
+    """Resolve an API key for the video endpoints; 503 in limited mode, 401 if invalid"""
+    if not FULL_FUNCTIONALITY:
+        raise HTTPException(
+            status_code=503,
+            detail="Video background removal not available in limited mode"
+        )
+    
+    from database import get_db
+    from auth import resolve_api_key
+    db = next(get_db())
+    try:
+        key_record = resolve_api_key(api_key, db)
+    finally:
+        db.close()
+    
+    if key_record is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid API key"
+        )
+    return key_record
+
+def _get_video_job(job_id: str, api_key: Optional[str]):
+    if not api_key:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Missing X-API-Key header"
+        )
+    key_record = _authorize_video_request(api_key)
+    job = video_jobs.get(job_id)
+    # Other keys' jobs look the same as missing ones
+    if job is None or job.api_key_id != key_record.id:
+        raise HTTPException(status_code=404, detail="Video job not found")
+    return job
+
+# Video background removal endpoints
+@app.post("/remove-background/video", status_code=status.HTTP_202_ACCEPTED)
+async def remove_background_video(
+    file: UploadFile = File(...),
+    output_format: str = Form("mov"),
+    model: str = Form("u2net"),
+    frame_limit: int = Form(-1),
+    api_key: str = Form(...)
+):
+    """
+    Start an asynchronous video background removal job.
+    
+    output_format is "mov" (transparent video), "gif" (transparent GIF) or
+    "matte" (black and white mask video). The upload is spooled to disk and
+    the job runs in its own process with bounded concurrency; poll
+    GET /remove-background/video/{job_id} for progress (frames processed,
+    frames/s) and download GET /remove-background/video/{job_id}/result
+    once the state is "done", sending the API key in an X-API-Key header.
+    """
+    key_record = _authorize_video_request(api_key)
+    
+    if not file.filename.lower().endswith(VIDEO_EXTENSIONS):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Only {', '.join(ext[1:].upper() for ext in VIDEO_EXTENSIONS)} files are supported"
+        )
+    if output_format not in OUTPUT_FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"output_format must be one of: {', '.join(OUTPUT_FORMATS)}"
+        )
+    if model not in ("u2net", "u2netp", "u2net_human_seg"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="model must be one of: u2net, u2netp, u2net_human_seg"
+        )
+    if frame_limit != -1 and frame_limit < 1:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="frame_limit must be -1 (whole video) or a positive number of frames"
+        )
+    
+    try:
+        job = video_jobs.create(key_record.id, output_format, model, file.filename, frame_limit=frame_limit)
+    except VideoJobRejected as e:
+        headers = {"Retry-After": str(max(1, round(e.retry_after)))} if e.retry_after else None
+        raise HTTPException(status_code=503, detail=e.detail, headers=headers)
+    
+    # Copy the upload to the job directory in chunks, never holding the whole video in memory
+    max_bytes = int(VIDEO_MAX_UPLOAD_MB * 1024 * 1024)
+    bytes_in = 0
+    try:
+        with open(job.input_path, "wb") as f:
+            while True:
+                chunk = await file.read(1024 * 1024)
+                if not chunk:
+                    break
+                bytes_in += len(chunk)
+                if bytes_in > max_bytes:
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail=f"Video larger than {VIDEO_MAX_UPLOAD_MB:g}MB"
+                    )
+                f.write(chunk)
+    except BaseException:
+        video_jobs.discard(job)
+        raise
+    
+    video_jobs.submit(job)
+    # Only accepted jobs count as usage
+    usage_recorder.record(key_record.id)
+    logger.info(f"Video job {job.id} accepted: {file.filename} ({bytes_in} bytes)")
+    
+    return JSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        content={
+            **job.to_dict(),
+            "status_url": f"/remove-background/video/{job.id}",
+            "result_url": f"/remove-background/video/{job.id}/result"
+        },
+        headers={"Location": f"/remove-background/video/{job.id}"}
+    )
+
+@app.get("/remove-background/video/{job_id}")
+async def video_job_status(job_id: str, api_key: Optional[str] = Depends(api_key_header)):
+    """State and progress of a video job"""
+    return _get_video_job(job_id, api_key).to_dict()
+
+@app.get("/remove-background/video/{job_id}/result")
+async def video_job_result(job_id: str, api_key: Optional[str] = Depends(api_key_header)):
+    """Stream the finished video from disk; 409 while the job is still queued or running"""
+    job = _get_video_job(job_id, api_key)
+    if job.state != "done":
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Video job is {job.state}" + (f": {job.error}" if job.error else "")
+        )
+    
+    return FileResponse(
+        job.output_path,
+        media_type=job.media_type,
+        filename=job.result_filename,
+        headers={"Access-Control-Allow-Origin": "*"}
+    )
+
+@app.delete("/remove-background/video/{job_id}")
+async def cancel_video_job(job_id: str, api_key: Optional[str] = Depends(api_key_header)):
+    """Cancel a queued or running video job"""
+    job = _get_video_job(job_id, api_key)
+    video_jobs.cancel(job)
+    return job.to_dict()
+
 # Contact form endpoint
 @app.post("/contact")
 async def send_contact_message(
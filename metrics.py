@@ -0,0 +1,183 @@
+"""
+Prometheus metrics for the background removal service
+
+prometheus_client is optional: without it every observe_* call is a no-op
+and /metrics answers 503.
+"""
+
+import logging
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+try:
+    from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Histogram, generate_latest
+    from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+    PROMETHEUS_AVAILABLE = True
+except ImportError:
+    PROMETHEUS_AVAILABLE = False
+    CONTENT_TYPE_LATEST = "text/plain; charset=utf-8"
+
+# Pipeline stages recorded in BackgroundRemover metadata["timings"] / main.py
+PIPELINE_STAGES = (
+    "upload_read", "decode", "preprocess", "inference", "matting", "compositing", "encode"
+)
+
+# Server-Timing metric names for each recorded stage, in response order
+SERVER_TIMING_NAMES = (
+    ("queue", "queue"),
+    ("upload_read", "upload"),
+    ("model_load", "model"),
+    ("decode", "decode"),
+    ("preprocess", "preprocess"),
+    ("inference", "infer"),
+    ("matting", "matting"),
+    ("compositing", "composite"),
+    ("encode", "encode")
+)
+
+_SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+_BYTES_BUCKETS = tuple(10_000 * 4 ** i for i in range(8))  # 10 KB .. ~160 MB
+
+if PROMETHEUS_AVAILABLE:
+    STAGE_SECONDS = Histogram(
+        "bgremover_stage_duration_seconds",
+        "Time spent in each background removal pipeline stage",
+        ["stage", "model", "matting"],
+        buckets=_SECONDS_BUCKETS
+    )
+    REQUEST_SECONDS = Histogram(
+        "bgremover_request_duration_seconds",
+        "End-to-end processing time of a background removal request",
+        ["model", "matting"],
+        buckets=_SECONDS_BUCKETS
+    )
+    QUEUE_WAIT_SECONDS = Histogram(
+        "bgremover_queue_wait_seconds",
+        "Time a request waited in the inference queue",
+        ["lane"],
+        buckets=_SECONDS_BUCKETS
+    )
+    MODEL_LOAD_SECONDS = Histogram(
+        "bgremover_model_load_seconds",
+        "Time spent loading model weights (warmup or first use)",
+        ["model"],
+        buckets=_SECONDS_BUCKETS
+    )
+    BYTES_IN = Histogram(
+        "bgremover_request_bytes",
+        "Size of uploaded images",
+        ["model", "matting"],
+        buckets=_BYTES_BUCKETS
+    )
+    BYTES_OUT = Histogram(
+        "bgremover_response_bytes",
+        "Size of returned images",
+        ["model", "matting"],
+        buckets=_BYTES_BUCKETS
+    )
+    REJECTED = Counter(
+        "bgremover_rejected_requests_total",
+        "Requests refused before processing",
+        ["status"]
+    )
+
+
+def observe_request(
+    metadata: Dict[str, Any],
+    timings: Dict[str, float],
+    lane: str,
+    bytes_in: int,
+    bytes_out: int
+):
+    """Record one completed request"""
+    if not PROMETHEUS_AVAILABLE:
+        return
+
+    model = metadata.get("model_used", "unknown")
+    matting = "true" if metadata.get("alpha_matting_enabled") else "false"
+
+    for stage_name in PIPELINE_STAGES:
+        if stage_name in timings:
+            STAGE_SECONDS.labels(stage_name, model, matting).observe(timings[stage_name])
+    if "queue" in timings:
+        QUEUE_WAIT_SECONDS.labels(lane).observe(timings["queue"])
+    if metadata.get("processing_time") is not None:
+        REQUEST_SECONDS.labels(model, matting).observe(metadata["processing_time"])
+    BYTES_IN.labels(model, matting).observe(bytes_in)
+    BYTES_OUT.labels(model, matting).observe(bytes_out)
+
+
+def observe_model_load(model: str, seconds: float):
+    """Record an actual model load; called by the inference engine, not per request"""
+    if PROMETHEUS_AVAILABLE:
+        MODEL_LOAD_SECONDS.labels(model).observe(seconds)
+
+
+def format_server_timing(timings: Dict[str, float], total: Optional[float] = None) -> str:
+    """Render stage timings (seconds) as a Server-Timing header value in ms"""
+    parts = [
+        f"{name};dur={timings[stage_name] * 1000:.1f}"
+        for stage_name, name in SERVER_TIMING_NAMES
+        if stage_name in timings
+    ]
+    if total is not None:
+        parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+def observe_rejection(status_code: int):
+    if PROMETHEUS_AVAILABLE:
+        REJECTED.labels(str(status_code)).inc()
+
+
+class _RuntimeCollector:
+    """Exports API key cache counters and scheduler queue state at scrape time"""
+
+    def __init__(self, api_key_cache, scheduler):
+        self.api_key_cache = api_key_cache
+        self.scheduler = scheduler
+
+    def collect(self):
+        cache = self.api_key_cache.stats()
+        requests = CounterMetricFamily(
+            "bgremover_cache_requests", "Cache lookups by result", labels=["cache", "result"]
+        )
+        requests.add_metric(["api_key", "hit"], cache["hits"])
+        requests.add_metric(["api_key", "miss"], cache["misses"])
+        yield requests
+
+        stats = self.scheduler.stats(per_key=False)
+        depth = GaugeMetricFamily("bgremover_queue_depth", "Queued inference requests", labels=["lane"])
+        busy = GaugeMetricFamily("bgremover_busy_workers", "Workers running inference", labels=["lane"])
+        for lane in stats["lanes"]:
+            depth.add_metric([lane["name"]], lane["queued"])
+            busy.add_metric([lane["name"]], lane["busy_workers"])
+        yield depth
+        yield busy
+
+        if stats.get("memory"):
+            reserved = GaugeMetricFamily(
+                "bgremover_memory_reserved_bytes", "Memory reserved by admitted inference jobs"
+            )
+            reserved.add_metric([], stats["memory"]["reserved_mb"] * 1024 * 1024)
+            yield reserved
+
+
+_collector: Optional[_RuntimeCollector] = None
+
+
+def register_runtime_collectors(api_key_cache, scheduler):
+    """Expose cache and queue state; safe to call more than once"""
+    global _collector
+    if not PROMETHEUS_AVAILABLE or _collector is not None:
+        return
+    _collector = _RuntimeCollector(api_key_cache, scheduler)
+    REGISTRY.register(_collector)
+
+
+def render_metrics() -> Optional[bytes]:
+    """Prometheus text exposition, or None when prometheus_client is missing"""
+    if not PROMETHEUS_AVAILABLE:
+        return None
+    return generate_latest(REGISTRY)
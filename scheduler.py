@@ -0,0 +1,485 @@
+"""
+Weighted fair scheduling of inference work across API keys
+
+Requests are queued per API key and dispatched to a fixed pool of worker
+threads using deficit round robin (DRR), so a single key submitting a bulk
+upload cannot starve other keys. Each key additionally has an in-memory
+token bucket rate limit and a cap on concurrently running jobs.
+
+Requests are first routed by estimated cost into lanes (fast/slow), each
+a separate FairScheduler with its own workers, so small requests are not
+stuck behind multi-megapixel alpha matting jobs. All lanes share one
+memory budget (see admission.py): a lane only dispatches its next job once
+the job's estimated peak memory fits.
+"""
+
+import os
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from admission import MemoryBudget, memory_budget, ADMISSION_MAX_WAIT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "1"))
+FAIR_QUEUE_QUANTUM = float(os.getenv("FAIR_QUEUE_QUANTUM", "1"))
+FAIR_QUEUE_KEY_WEIGHTS = os.getenv("FAIR_QUEUE_KEY_WEIGHTS", "")  # e.g. "3:4,7:2" (api key id:weight)
+MAX_CONCURRENT_PER_KEY = int(os.getenv("MAX_CONCURRENT_PER_KEY", "2"))
+MAX_QUEUED_PER_KEY = int(os.getenv("MAX_QUEUED_PER_KEY", "50"))
+RATE_LIMIT_PER_KEY = float(os.getenv("RATE_LIMIT_PER_KEY", "0"))  # requests/second, 0 disables
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", "10"))
+
+# Requests with estimated cost <= FAST_LANE_MAX_COST go to the fast lane;
+# set it to 0 to route everything through a single lane
+FAST_LANE_MAX_COST = float(os.getenv("FAST_LANE_MAX_COST", "2.0"))
+FAST_LANE_WORKERS = int(os.getenv("FAST_LANE_WORKERS", "1"))
+SLOW_LANE_WORKERS = int(os.getenv("SLOW_LANE_WORKERS", str(INFERENCE_WORKERS)))
+
+
+def parse_key_weights(spec: str) -> Dict[int, float]:
+    """Parse "id:weight,id:weight" into a dict, ignoring malformed entries"""
+    weights = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        try:
+            key_id, weight = item.split(":")
+            weights[int(key_id)] = max(float(weight), 0.01)
+        except ValueError:
+            logger.warning(f"Ignoring malformed fair queue weight: {item!r}")
+    return weights
+
+
+class SchedulerRejected(Exception):
+    """Raised when a request is refused before being queued"""
+
+    def __init__(self, status_code: int, detail: str, retry_after: Optional[float] = None):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Classic token bucket; not thread-safe, callers hold the scheduler lock"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def try_consume(self, amount: float = 1.0) -> float:
+        """Consume tokens; returns 0 on success or seconds until enough are available"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+
+class _Job:
+    __slots__ = ("key_id", "fn", "args", "kwargs", "cost", "memory", "timings", "loop", "future", "enqueued_at", "wait")
+
+    def __init__(self, key_id, fn, args, kwargs, cost, memory, timings, loop, future):
+        self.key_id = key_id
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.cost = cost
+        self.memory = memory
+        self.timings = timings
+        self.loop = loop
+        self.future = future
+        self.enqueued_at = time.monotonic()
+        self.wait = 0.0
+
+
+class _KeyState:
+    def __init__(self, key_id: int, name: Optional[str], weight: float, bucket: Optional[TokenBucket]):
+        self.key_id = key_id
+        self.name = name
+        self.weight = weight
+        self.bucket = bucket
+        self.queue: Deque[_Job] = deque()
+        self.deficit = 0.0
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.last_wait = 0.0
+
+
+class FairScheduler:
+    """
+    Deficit round robin scheduler over per-API-key queues, served by a
+    pool of worker threads. Jobs are plain callables; submit() is awaited
+    from the event loop and resolves with the callable's return value.
+    """
+
+    def __init__(
+        self,
+        name: str = "inference",
+        workers: int = INFERENCE_WORKERS,
+        quantum: float = FAIR_QUEUE_QUANTUM,
+        max_concurrent_per_key: int = MAX_CONCURRENT_PER_KEY,
+        max_queued_per_key: int = MAX_QUEUED_PER_KEY,
+        rate_limit: float = RATE_LIMIT_PER_KEY,
+        rate_burst: float = RATE_LIMIT_BURST,
+        key_weights: Optional[Dict[int, float]] = None,
+        admission: Optional[MemoryBudget] = None
+    ):
+        self.name = name
+        self.workers = max(1, workers)
+        self.quantum = quantum
+        self.max_concurrent_per_key = max_concurrent_per_key
+        self.max_queued_per_key = max_queued_per_key
+        self.rate_limit = rate_limit
+        self.rate_burst = rate_burst
+        self.key_weights = key_weights if key_weights is not None else parse_key_weights(FAIR_QUEUE_KEY_WEIGHTS)
+
+        self._keys: Dict[int, _KeyState] = {}
+        # Keys with queued work, in round-robin order
+        self._active: Deque[int] = deque()
+        self._cond = threading.Condition()
+        self._threads: List[threading.Thread] = []
+        self._running = False
+        self._busy_workers = 0
+        # Exponentially weighted average job duration, for wait estimates
+        self._avg_service = 0.0
+        self._memory_blocked = False
+
+        self.admission = admission
+        if admission is not None:
+            admission.add_listener(self._on_memory_released)
+
+    def _on_memory_released(self):
+        with self._cond:
+            if self._memory_blocked:
+                self._cond.notify_all()
+
+    def _key_state(self, key_id: int, key_name: Optional[str]) -> _KeyState:
+        state = self._keys.get(key_id)
+        if state is None:
+            bucket = TokenBucket(self.rate_limit, self.rate_burst) if self.rate_limit > 0 else None
+            state = _KeyState(key_id, key_name, self.key_weights.get(key_id, 1.0), bucket)
+            self._keys[key_id] = state
+        elif key_name and state.name is None:
+            state.name = key_name
+        return state
+
+    async def submit(
+        self,
+        key_id: int,
+        fn: Callable[..., Any],
+        *args,
+        key_name: Optional[str] = None,
+        cost: float = 1.0,
+        memory: int = 0,
+        timings: Optional[Dict[str, float]] = None,
+        **kwargs
+    ) -> Any:
+        """
+        Queue fn(*args, **kwargs) for key_id and wait for its result.
+        If a timings dict is given, the time spent queued is stored under "queue".
+        """
+        self.start()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        job = _Job(key_id, fn, args, kwargs, cost, memory, timings, loop, future)
+
+        with self._cond:
+            state = self._key_state(key_id, key_name)
+            if state.bucket is not None:
+                retry_after = state.bucket.try_consume()
+                if retry_after > 0:
+                    state.rejected += 1
+                    raise SchedulerRejected(429, "Rate limit exceeded for API key", retry_after)
+            if len(state.queue) >= self.max_queued_per_key:
+                state.rejected += 1
+                raise SchedulerRejected(429, "Too many queued requests for API key", 1.0)
+
+            state.queue.append(job)
+            if len(state.queue) == 1:
+                self._active.append(key_id)
+            self._cond.notify()
+
+        return await future
+
+    def _next_job(self) -> Optional[_Job]:
+        """Pick the next job by deficit round robin; caller holds the lock"""
+        while self._active:
+            progressed = False
+            for _ in range(len(self._active)):
+                state = self._keys[self._active[0]]
+                if self.max_concurrent_per_key > 0 and state.in_flight >= self.max_concurrent_per_key:
+                    self._active.rotate(-1)
+                    continue
+                progressed = True
+                job = state.queue[0]
+                if state.deficit >= job.cost:
+                    if self.admission is not None and not self.admission.try_acquire(job.memory):
+                        # Head of the schedule waits for memory rather than being bypassed
+                        self._memory_blocked = True
+                        return None
+                    self._memory_blocked = False
+                    state.deficit -= job.cost
+                    state.queue.popleft()
+                    if not state.queue:
+                        self._active.popleft()
+                        state.deficit = 0.0
+                    return job
+                state.deficit += self.quantum * state.weight
+                self._active.rotate(-1)
+            if not progressed:
+                # Every key with queued work is at its concurrency cap
+                return None
+        return None
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                job = self._next_job()
+                while job is None:
+                    if not self._running:
+                        return
+                    self._cond.wait()
+                    job = self._next_job()
+
+                state = self._keys[job.key_id]
+                job.wait = time.monotonic() - job.enqueued_at
+                if job.timings is not None:
+                    job.timings["queue"] = job.wait
+                state.in_flight += 1
+                state.total_wait += job.wait
+                state.last_wait = job.wait
+                state.max_wait = max(state.max_wait, job.wait)
+                self._busy_workers += 1
+
+            started = time.monotonic()
+            try:
+                if job.future.cancelled():
+                    continue
+                result = job.fn(*job.args, **job.kwargs)
+                job.loop.call_soon_threadsafe(_resolve, job.future, result, None)
+            except BaseException as e:
+                job.loop.call_soon_threadsafe(_resolve, job.future, None, e)
+            finally:
+                duration = time.monotonic() - started
+                with self._cond:
+                    state.in_flight -= 1
+                    state.completed += 1
+                    self._busy_workers -= 1
+                    self._avg_service = duration if not self._avg_service else 0.8 * self._avg_service + 0.2 * duration
+                    # A slot freed up for this key; wake a worker to re-run DRR
+                    self._cond.notify()
+                if self.admission is not None:
+                    self.admission.release(job.memory)
+
+    def start(self):
+        """Start worker threads (idempotent)"""
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+            self._threads = [
+                threading.Thread(target=self._worker, name=f"{self.name}-worker-{i}", daemon=True)
+                for i in range(self.workers)
+            ]
+        for thread in self._threads:
+            thread.start()
+        logger.info(f"Fair scheduler '{self.name}' started with {self.workers} workers")
+
+    def stop(self, timeout: float = 30.0):
+        """Let workers drain the queues, then stop them"""
+        with self._cond:
+            if not self._running:
+                return
+            self._running = False
+            self._cond.notify_all()
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+        self._threads = []
+
+    def queue_depth(self) -> int:
+        with self._cond:
+            return sum(len(state.queue) for state in self._keys.values())
+
+    def estimate_wait(self) -> float:
+        """Rough seconds a newly queued job waits: work ahead / workers"""
+        with self._cond:
+            ahead = sum(len(state.queue) for state in self._keys.values()) + self._busy_workers
+            return ahead * self._avg_service / self.workers
+
+    def stats(self, per_key: bool = True) -> Dict[str, Any]:
+        """Queue depth and wait times; per_key adds each API key's id, name and counters"""
+        now = time.monotonic()
+        with self._cond:
+            keys = []
+            for state in self._keys.values():
+                if not per_key:
+                    keys.append({"queued": len(state.queue)})
+                    continue
+                oldest_wait = now - state.queue[0].enqueued_at if state.queue else 0.0
+                keys.append({
+                    "api_key_id": state.key_id,
+                    "name": state.name,
+                    "weight": state.weight,
+                    "queued": len(state.queue),
+                    "in_flight": state.in_flight,
+                    "completed": state.completed,
+                    "rejected": state.rejected,
+                    "oldest_queued_wait_seconds": round(oldest_wait, 4),
+                    "last_wait_seconds": round(state.last_wait, 4),
+                    "avg_wait_seconds": round(state.total_wait / state.completed, 4) if state.completed else 0.0,
+                    "max_wait_seconds": round(state.max_wait, 4)
+                })
+            if per_key:
+                keys.sort(key=lambda k: (k["queued"] + k["in_flight"], k["oldest_queued_wait_seconds"]),
+                          reverse=True)
+            lane_stats = {
+                "name": self.name,
+                "workers": self.workers,
+                "busy_workers": self._busy_workers,
+                "waiting_for_memory": self._memory_blocked,
+                "avg_service_seconds": round(self._avg_service, 4),
+                "estimated_wait_seconds": round(
+                    (sum(k["queued"] for k in keys) + self._busy_workers) * self._avg_service / self.workers, 4
+                ),
+                "queued": sum(k["queued"] for k in keys),
+                "active_keys": sum(1 for k in keys if k["queued"])
+            }
+            if per_key:
+                lane_stats["keys"] = keys
+            return lane_stats
+
+
+class LaneRouter:
+    """
+    Routes jobs into cost-bounded lanes, each served by its own
+    FairScheduler. Rate limiting is applied once per key across all lanes,
+    and all lanes draw from the same memory budget.
+    """
+
+    def __init__(
+        self,
+        lanes: List[Tuple[str, float, int]],
+        rate_limit: float = RATE_LIMIT_PER_KEY,
+        rate_burst: float = RATE_LIMIT_BURST,
+        admission: Optional[MemoryBudget] = None,
+        max_wait: float = ADMISSION_MAX_WAIT_SECONDS
+    ):
+        """lanes: (name, max_cost, workers) sorted by max_cost; the last lane takes everything else"""
+        self.admission = admission
+        self.max_wait = max_wait
+        self.lanes = [
+            (max_cost, FairScheduler(name=name, workers=workers, rate_limit=0, admission=admission))
+            for name, max_cost, workers in lanes
+        ]
+        self.rate_limit = rate_limit
+        self.rate_burst = rate_burst
+        self._buckets: Dict[int, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def lane_for(self, cost: float) -> FairScheduler:
+        for max_cost, lane in self.lanes:
+            if cost <= max_cost:
+                return lane
+        return self.lanes[-1][1]
+
+    async def submit(
+        self,
+        key_id: int,
+        fn: Callable[..., Any],
+        *args,
+        key_name: Optional[str] = None,
+        cost: float = 1.0,
+        memory: int = 0,
+        timings: Optional[Dict[str, float]] = None,
+        **kwargs
+    ) -> Any:
+        """Rate-limit and admission-check, then queue fn on the lane matching its cost"""
+        if self.admission is not None and not self.admission.fits(memory):
+            raise SchedulerRejected(
+                413,
+                f"Request needs an estimated {memory / 1024 / 1024:.0f} MB, more than the "
+                f"{self.admission.total / 1024 / 1024:.0f} MB memory budget; "
+                "use a smaller image or a lower alpha_matting_base_size"
+            )
+
+        lane = self.lane_for(cost)
+        estimated_wait = lane.estimate_wait()
+        if self.max_wait > 0 and estimated_wait > self.max_wait:
+            raise SchedulerRejected(
+                503,
+                f"Server busy, estimated wait {estimated_wait:.0f}s",
+                estimated_wait
+            )
+
+        if self.rate_limit > 0:
+            with self._lock:
+                bucket = self._buckets.get(key_id)
+                if bucket is None:
+                    bucket = self._buckets[key_id] = TokenBucket(self.rate_limit, self.rate_burst)
+                retry_after = bucket.try_consume()
+            if retry_after > 0:
+                raise SchedulerRejected(429, "Rate limit exceeded for API key", retry_after)
+
+        return await lane.submit(
+            key_id, fn, *args, key_name=key_name, cost=cost, memory=memory, timings=timings, **kwargs
+        )
+
+    def start(self):
+        for _, lane in self.lanes:
+            lane.start()
+
+    def stop(self, timeout: float = 30.0):
+        """Drain and stop every lane; blocks for up to timeout in total, so call it off the event loop"""
+        deadline = time.monotonic() + timeout
+        for _, lane in self.lanes:
+            lane.stop(max(0.0, deadline - time.monotonic()))
+
+    def queue_depth(self) -> int:
+        return sum(lane.queue_depth() for _, lane in self.lanes)
+
+    def stats(self, per_key: bool = True) -> Dict[str, Any]:
+        lanes = []
+        for max_cost, lane in self.lanes:
+            lane_stats = lane.stats(per_key)
+            lane_stats["max_cost"] = None if max_cost == float("inf") else max_cost
+            lanes.append(lane_stats)
+        return {
+            "queued": sum(lane["queued"] for lane in lanes),
+            "memory": self.admission.stats() if self.admission is not None else None,
+            "lanes": lanes
+        }
+
+
+def _default_lanes() -> List[Tuple[str, float, int]]:
+    if FAST_LANE_MAX_COST <= 0:
+        return [("inference", float("inf"), INFERENCE_WORKERS)]
+    return [
+        ("fast", FAST_LANE_MAX_COST, FAST_LANE_WORKERS),
+        ("slow", float("inf"), SLOW_LANE_WORKERS)
+    ]
+
+
+def _resolve(future: asyncio.Future, result: Any, error: Optional[BaseException]):
+    """Complete a job future on its event loop, ignoring cancelled requests"""
+    if future.done():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+inference_scheduler = LaneRouter(_default_lanes(), admission=memory_budget)
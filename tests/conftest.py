@@ -0,0 +1,12 @@
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "backgroundremover-main"))
+
+# Configuration is read at import time, so it has to be in place before main is imported
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="bgr-test-"), "test.db")
+os.environ["ADMIN_API_KEYS"] = "test-admin-key"
+os.environ["BG_REMOVER_ENGINE"] = "fake"
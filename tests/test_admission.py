@@ -0,0 +1,34 @@
+import pytest
+
+from admission import MemoryBudget
+from background_remover import BackgroundRemover, INFERENCE_MEMORY, MODEL_WEIGHTS_MEMORY
+from engines import U2NetEngine
+
+MB = 1024 * 1024
+
+
+@pytest.fixture
+def remover(tmp_path, monkeypatch):
+    # The remover creates ./models; the engine only loads weights on first use
+    monkeypatch.chdir(tmp_path)
+    return BackgroundRemover(engine=U2NetEngine(lambda model_name: ""))
+
+
+def test_request_estimate_excludes_shared_weights(remover):
+    estimate = remover.estimate_peak_memory((1000, 1000))
+    pixel_memory = estimate - INFERENCE_MEMORY["u2netp"]
+    assert 0 < pixel_memory < 100 * MB
+    assert remover.resident_memory() == MODEL_WEIGHTS_MEMORY["u2netp"]
+
+
+def test_weights_are_charged_to_the_budget_once(remover):
+    estimate = remover.estimate_peak_memory((1000, 1000))
+    budget = MemoryBudget(remover.resident_memory() + 3 * estimate)
+    budget.set_resident(remover.resident_memory())
+    # Setting it again (e.g. a second startup hook) doesn't charge the weights twice
+    budget.set_resident(remover.resident_memory())
+
+    assert [budget.try_acquire(estimate) for _ in range(4)] == [True, True, True, False]
+    assert budget.stats()["resident_mb"] == round(remover.resident_memory() / MB, 1)
+    budget.release(estimate)
+    assert budget.try_acquire(estimate)
@@ -0,0 +1,61 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from database import SessionLocal, APIKey, create_tables, generate_api_key
+
+
+@pytest.fixture
+def client():
+    create_tables()
+    return TestClient(main.app)
+
+
+def _create_key():
+    db = SessionLocal()
+    try:
+        record = APIKey(key=generate_api_key(), name="customer", is_active="true")
+        db.add(record)
+        db.commit()
+        db.refresh(record)
+        return record.id, record.key
+    finally:
+        db.close()
+
+
+def _is_active(api_key_id):
+    db = SessionLocal()
+    try:
+        return db.query(APIKey).filter(APIKey.id == api_key_id).first().is_active == "true"
+    finally:
+        db.close()
+
+
+def test_deactivate_without_credentials_is_rejected(client):
+    api_key_id, _ = _create_key()
+    response = client.delete(f"/api-keys/{api_key_id}")
+    assert response.status_code == 401
+    assert _is_active(api_key_id)
+
+
+def test_deactivate_with_another_customers_key_is_forbidden(client):
+    api_key_id, _ = _create_key()
+    _, other_key = _create_key()
+    response = client.delete(f"/api-keys/{api_key_id}", headers={"X-API-Key": other_key})
+    assert response.status_code == 403
+    assert _is_active(api_key_id)
+
+
+def test_deactivate_own_key(client):
+    api_key_id, key = _create_key()
+    response = client.delete(f"/api-keys/{api_key_id}", headers={"X-API-Key": key})
+    assert response.status_code == 200
+    assert not _is_active(api_key_id)
+
+
+def test_admin_can_deactivate_any_key(client):
+    api_key_id, _ = _create_key()
+    response = client.delete(f"/api-keys/{api_key_id}", headers={"X-API-Key": "test-admin-key"})
+    assert response.status_code == 200
+    assert not _is_active(api_key_id)
+    assert client.delete("/api-keys/999999", headers={"X-API-Key": "test-admin-key"}).status_code == 404
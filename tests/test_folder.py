@@ -0,0 +1,44 @@
+import json
+import subprocess as sp
+import sys
+
+
+def _run_cli(monkeypatch, *argv):
+    from backgroundremover.cmd import cli
+
+    monkeypatch.setattr(sys, "argv", ["backgroundremover", *argv])
+    cli.main()
+
+
+def test_failed_video_is_not_installed_or_recorded(tmp_path, monkeypatch):
+    from backgroundremover import utilities
+
+    source, output = tmp_path / "in", tmp_path / "out"
+    source.mkdir()
+    (source / "clip.mp4").write_bytes(b"not really a video")
+
+    def failing(partial, file_path, **kwargs):
+        # ffmpeg leaves a truncated file behind when it fails
+        with open(partial, "wb") as f:
+            f.write(b"truncated")
+        raise sp.CalledProcessError(1, ["ffmpeg"])
+
+    monkeypatch.setattr(utilities, "transparentvideo", failing)
+    _run_cli(monkeypatch, "-if", str(source), "-of", str(output), "-tv", "-ic")
+
+    # no output, no leftover partial and nothing recorded
+    assert [p.name for p in output.iterdir() if p.name != ".backgroundremover-manifest.json"] == []
+    manifest = output / ".backgroundremover-manifest.json"
+    assert not manifest.exists() or json.loads(manifest.read_text())["files"] == {}
+
+    def succeeding(partial, file_path, **kwargs):
+        with open(partial, "wb") as f:
+            f.write(b"video")
+
+    # the next run retries the file
+    monkeypatch.setattr(utilities, "transparentvideo", succeeding)
+    _run_cli(monkeypatch, "-if", str(source), "-of", str(output), "-tv", "-ic")
+
+    assert (output / "output_clip.mp4").read_bytes() == b"video"
+    manifest = json.loads((output / ".backgroundremover-manifest.json").read_text())
+    assert list(manifest["files"]) == ["clip.mp4"]
@@ -0,0 +1,29 @@
+from prometheus_client import REGISTRY
+
+import metrics
+from engines import FakeEngine
+
+
+def _model_loads(model):
+    return REGISTRY.get_sample_value("bgremover_model_load_seconds_count", {"model": model}) or 0.0
+
+
+def test_model_load_is_observed_once_per_actual_load():
+    engine = FakeEngine()
+    before = _model_loads("u2netp")
+
+    first, second = {}, {}
+    engine.load("u2netp", timings=first)
+    engine.load("u2netp", timings=second)
+
+    assert _model_loads("u2netp") == before + 1
+    assert "model_load" in first
+    # Cache hits add no model stage to Server-Timing
+    assert "model_load" not in second
+    assert "model;" not in metrics.format_server_timing(second, 0.1)
+
+
+def test_batch_size_histogram_is_not_exported():
+    # The HTTP path runs one image per forward pass, so a batch size metric carried no information
+    assert not hasattr(metrics, "BATCH_SIZE")
+    assert b"bgremover_inference_batch_size" not in metrics.render_metrics()
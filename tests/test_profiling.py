@@ -0,0 +1,55 @@
+import threading
+import time
+
+import pytest
+import torch
+
+from backgroundremover.profiling import ProfilerBusy, profile_call
+
+
+def _work(spans, hold):
+    started = time.monotonic()
+    hold.wait(5)
+    torch.ones(8, 8) @ torch.ones(8, 8)
+    spans.append((started, time.monotonic()))
+    return "done"
+
+
+def test_concurrent_profiled_calls_are_serialized(tmp_path):
+    spans, results, errors = [], [], []
+    hold = threading.Event()
+
+    def run():
+        try:
+            results.append(profile_call(_work, spans, hold, profile_dir=str(tmp_path)))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.2)
+    hold.set()
+    for thread in threads:
+        thread.join(30)
+
+    assert not errors
+    assert [result for result, _ in results] == ["done", "done"]
+    assert len({artifact_id for _, artifact_id in results}) == 2
+    (first_start, first_end), (second_start, _) = sorted(spans)
+    assert second_start >= first_end
+    for _, artifact_id in results:
+        assert (tmp_path / artifact_id / "torch_trace.json").exists()
+
+
+def test_profile_without_wait_is_rejected_while_another_runs(tmp_path):
+    hold = threading.Event()
+    thread = threading.Thread(target=profile_call, args=(_work, [], hold), kwargs={"profile_dir": str(tmp_path)})
+    thread.start()
+    try:
+        time.sleep(0.2)
+        with pytest.raises(ProfilerBusy):
+            profile_call(_work, [], hold, profile_dir=str(tmp_path), wait=False)
+    finally:
+        hold.set()
+        thread.join(30)
@@ -0,0 +1,60 @@
+import asyncio
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from scheduler import LaneRouter
+
+
+@pytest.fixture
+def router(monkeypatch):
+    router = LaneRouter([("fast", 2.0, 1), ("slow", float("inf"), 1)], rate_limit=0, max_wait=0)
+    monkeypatch.setattr(main, "inference_scheduler", router)
+    return router
+
+
+def _queue_job(router, key_id, name):
+    # Registers the key with the lane; workers are not started, so nothing runs
+    lane = router.lane_for(1.0)
+    loop = asyncio.new_event_loop()
+    try:
+        task = loop.create_task(lane.submit(key_id, lambda: None, key_name=name))
+        loop.run_until_complete(asyncio.sleep(0))
+        task.cancel()
+    finally:
+        loop.close()
+
+
+def test_queue_stats_hide_api_keys_without_admin_key(router):
+    _queue_job(router, 7, "acme-corp")
+    response = TestClient(main.app).get("/queue-stats")
+    assert response.status_code == 200
+    assert "acme-corp" not in response.text
+    assert all("keys" not in lane for lane in response.json()["lanes"])
+
+
+def test_queue_stats_per_key_for_admin(router):
+    _queue_job(router, 7, "acme-corp")
+    response = TestClient(main.app).get("/queue-stats", headers={"X-API-Key": "test-admin-key"})
+    keys = [key for lane in response.json()["lanes"] for key in lane["keys"]]
+    assert [(key["api_key_id"], key["name"]) for key in keys] == [(7, "acme-corp")]
+
+
+def test_shutdown_stops_scheduler_off_the_event_loop(monkeypatch):
+    stopped_on = []
+
+    class Scheduler:
+        def stop(self):
+            stopped_on.append(threading.current_thread())
+
+    class Stub:
+        def stop(self):
+            pass
+
+    monkeypatch.setattr(main, "inference_scheduler", Scheduler())
+    monkeypatch.setattr(main, "video_jobs", Stub())
+    monkeypatch.setattr(main, "usage_recorder", Stub())
+    asyncio.run(main.shutdown_event())
+    assert stopped_on and stopped_on[0] is not threading.main_thread()
@@ -0,0 +1,102 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from database import SessionLocal, APIKey, create_tables, generate_api_key
+from video_jobs import video_jobs
+
+
+def _create_key():
+    db = SessionLocal()
+    try:
+        record = APIKey(key=generate_api_key(), name="customer", is_active="true")
+        db.add(record)
+        db.commit()
+        db.refresh(record)
+        return record.id, record.key
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def job():
+    create_tables()
+    api_key_id, key = _create_key()
+    job = video_jobs.create(api_key_id, "mov", "u2netp", "clip.mp4")
+    yield job, key
+    video_jobs.discard(job)
+
+
+def test_job_status_reads_api_key_from_header(job):
+    job, key = job
+    response = TestClient(main.app).get(f"/remove-background/video/{job.id}", headers={"X-API-Key": key})
+    assert response.status_code == 200
+    assert response.json()["job_id"] == job.id
+
+
+def test_api_key_in_query_string_is_not_accepted(job):
+    job, key = job
+    client = TestClient(main.app)
+    assert client.get(f"/remove-background/video/{job.id}?api_key={key}").status_code == 401
+    assert client.delete(f"/remove-background/video/{job.id}?api_key={key}").status_code == 401
+
+
+def test_other_keys_jobs_are_not_found(job):
+    job, _ = job
+    _, other_key = _create_key()
+    client = TestClient(main.app)
+    headers = {"X-API-Key": other_key}
+    assert client.get(f"/remove-background/video/{job.id}", headers=headers).status_code == 404
+    assert client.get(f"/remove-background/video/{job.id}/result", headers=headers).status_code == 404
+    assert client.delete(f"/remove-background/video/{job.id}", headers=headers).status_code == 404
+
+
+@pytest.fixture
+def recorded(monkeypatch):
+    calls = []
+    monkeypatch.setattr(main.usage_recorder, "record", calls.append)
+    return calls
+
+
+@pytest.mark.parametrize("form", [
+    {"frame_limit": "0"},
+    {"frame_limit": "-5"},
+    {"output_format": "avi"},
+    {"model": "unknown"},
+])
+def test_rejected_uploads_are_not_billed(form, recorded):
+    create_tables()
+    _, key = _create_key()
+    jobs_before = set(video_jobs.jobs)
+    response = TestClient(main.app).post(
+        "/remove-background/video",
+        data={"api_key": key, **form},
+        files={"file": ("clip.mp4", b"not really a video", "video/mp4")},
+    )
+    assert response.status_code == 400
+    assert recorded == []
+    assert set(video_jobs.jobs) == jobs_before
+
+
+def test_cancelled_queued_job_never_starts(tmp_path):
+    from video_jobs import VideoJobManager
+
+    manager = VideoJobManager(job_dir=str(tmp_path))
+    job = manager.create(1, "mov", "u2netp", "clip.mp4")
+    manager.submit(job)
+    manager.cancel(job)
+    # the runner picked the job up before the cancel landed
+    manager._run(job, manager.cpu_slices[0])
+    assert job.state == "cancelled"
+    assert job.process is None
+
+
+def test_job_cancelled_while_uploading_is_not_queued(tmp_path):
+    from video_jobs import VideoJobManager
+
+    manager = VideoJobManager(job_dir=str(tmp_path))
+    job = manager.create(1, "mov", "u2netp", "clip.mp4")
+    manager.cancel(job)
+    manager.submit(job)
+    assert job.state == "cancelled"
+    assert manager._queue.empty()
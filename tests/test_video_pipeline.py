@@ -0,0 +1,51 @@
+import shutil
+import subprocess as sp
+import sys
+
+import pytest
+
+from benchmarks.fixtures import ensure_random_weights
+
+pytestmark = pytest.mark.skipif(
+    shutil.which("ffmpeg") is None or shutil.which("ffprobe") is None, reason="needs ffmpeg and ffprobe"
+)
+
+
+@pytest.fixture(scope="module")
+def clip(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("video") / "clip.mp4")
+    sp.run(["ffmpeg", "-v", "error", "-y", "-f", "lavfi", "-i", "testsrc=size=320x240:rate=10", "-frames:v", "8",
+            "-pix_fmt", "yuv420p", path], check=True)
+    return path
+
+
+@pytest.fixture
+def random_weights(tmp_path_factory, monkeypatch):
+    # Spawned workers read these from the environment
+    directory = ensure_random_weights(str(tmp_path_factory.getbasetemp() / "weights"))
+    monkeypatch.setenv("U2NETP_PATH", f"{directory}/u2netp.pth")
+    monkeypatch.setenv("BACKGROUNDREMOVER_JIT_CACHE_DIR", str(tmp_path_factory.getbasetemp() / "jit"))
+
+
+def _python_sink(code):
+    def open_sink(width, height, rate):
+        return sp.Popen([sys.executable, "-c", code.format(frame_bytes=width * height)], stdin=sp.PIPE)
+    return open_sink
+
+
+def test_failing_sink_raises(clip, random_weights):
+    from backgroundremover.utilities import run_matte_pipeline
+
+    with pytest.raises(sp.CalledProcessError) as error:
+        run_matte_pipeline(clip, 1, 1, "u2netp", _python_sink("import sys; sys.exit(3)"))
+    assert error.value.returncode == 3
+
+
+def test_sink_finishing_early_is_not_an_error(clip, random_weights):
+    from backgroundremover.utilities import run_matte_pipeline
+
+    # reads a single mask and exits cleanly, like ffmpeg with -shortest
+    sink = _python_sink("import sys; sys.stdin.buffer.read({frame_bytes}); sys.stdin.close()")
+    stats = run_matte_pipeline(clip, 1, 2, "u2netp", sink)
+    assert 1 <= stats["frames"] < 8
+    assert 0.0 <= stats["skipped_fraction"] <= 1.0
@@ -0,0 +1,63 @@
+import time
+
+import pytest
+
+from background_remover import BackgroundRemover
+from engines import FakeEngine
+from warmup import Warmup
+
+
+@pytest.fixture
+def remover(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return BackgroundRemover(engine=FakeEngine(latency=0))
+
+
+def _warmup(**kwargs):
+    return Warmup(resolutions="64x48", alpha_matting=False, retry_seconds=0.01, retry_max_seconds=0.05, **kwargs)
+
+
+def test_warmup_recovers_after_transient_failure(remover):
+    calls = []
+
+    def get_remover():
+        calls.append(1)
+        if len(calls) < 3:
+            raise RuntimeError("model download timed out")
+        return remover
+
+    warmup = _warmup()
+    warmup.start(get_remover)
+    assert warmup.wait(10)
+    stats = warmup.stats()
+    assert stats["state"] == "ready"
+    assert stats["attempts"] == 3
+    assert stats["error"] is None
+
+
+def test_successful_request_marks_ready_after_failed_warmup():
+    def get_remover():
+        raise RuntimeError("model download timed out")
+
+    warmup = _warmup(max_attempts=2)
+    warmup.start(get_remover)
+    warmup.wait(10)
+    assert warmup.state == "failed"
+
+    warmup.mark_request_succeeded()
+    assert warmup.ready
+
+
+def test_stop_ends_retries():
+    def get_remover():
+        raise RuntimeError("model download timed out")
+
+    warmup = Warmup(resolutions="64x48", alpha_matting=False, retry_seconds=60)
+    warmup.start(get_remover)
+    deadline = time.monotonic() + 5
+    while warmup.stats()["next_retry_in_seconds"] is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    warmup.stop()
+    warmup.wait(5)
+    assert not warmup._thread.is_alive()
+    assert warmup.state == "failed"
@@ -0,0 +1,38 @@
+import pytest
+import torch
+
+from backgroundremover import weights
+
+
+@pytest.fixture
+def checkpoint(tmp_path):
+    torch.manual_seed(0)
+    state_dict = torch.nn.Linear(4, 3).state_dict()
+    path = str(tmp_path / "linear.pth")
+    torch.save(state_dict, path)
+    return path, state_dict
+
+
+def _assert_loaded(net, state_dict):
+    for name, tensor in net.state_dict().items():
+        assert tensor.device.type == "cpu"
+        assert torch.equal(tensor, state_dict[name])
+
+
+def test_build_model_memory_maps_weights(checkpoint):
+    path, state_dict = checkpoint
+    _assert_loaded(weights.build_model(lambda: torch.nn.Linear(4, 3), path), state_dict)
+
+
+def test_build_model_falls_back_on_old_torch(checkpoint, monkeypatch):
+    # torch < 2.1: no meta-device construction, mmap or load_state_dict(assign=True)
+    path, state_dict = checkpoint
+    monkeypatch.setattr(weights, "SUPPORTS_MMAP", False)
+    real_load = torch.load
+
+    def load(*args, **kwargs):
+        assert "mmap" not in kwargs
+        return real_load(*args, **kwargs)
+
+    monkeypatch.setattr(torch, "load", load)
+    _assert_loaded(weights.build_model(lambda: torch.nn.Linear(4, 3), path), state_dict)
@@ -0,0 +1,196 @@
+"""
+Write-behind usage accounting for API keys
+
+Per-key request counts are accumulated in memory and applied to the
+api_keys table in one batched UPDATE, either every USAGE_FLUSH_INTERVAL
+seconds or as soon as USAGE_FLUSH_THRESHOLD requests are pending.
+Increments are applied relative to the stored value
+(usage_count = usage_count + n), so several worker processes can flush
+into the same database without overwriting each other.
+"""
+
+import os
+import atexit
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Any
+
+from sqlalchemy import bindparam, case, insert, or_, update
+
+from database import SessionLocal, APIKey, UsageEvent
+
+logger = logging.getLogger(__name__)
+
+USAGE_FLUSH_INTERVAL = float(os.getenv("USAGE_FLUSH_INTERVAL", "5"))
+USAGE_FLUSH_THRESHOLD = int(os.getenv("USAGE_FLUSH_THRESHOLD", "100"))
+USAGE_EVENTS_ENABLED = os.getenv("USAGE_EVENTS_ENABLED", "false").lower() == "true"
+
+
+class UsageRecorder:
+    """
+    Buffers usage increments per API key and flushes them in batches
+    """
+
+    def __init__(
+        self,
+        flush_interval: float = USAGE_FLUSH_INTERVAL,
+        flush_threshold: int = USAGE_FLUSH_THRESHOLD,
+        events_enabled: bool = USAGE_EVENTS_ENABLED
+    ):
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self.events_enabled = events_enabled
+
+        # api_key_id -> [pending increment, latest last_used]
+        self._pending: Dict[int, List[Any]] = {}
+        self._pending_requests = 0
+        self._events: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        # Serializes flushes so a timer flush and a shutdown flush never race
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def record(self, api_key_id: int, used_at: Optional[datetime] = None):
+        """Count one request against an API key"""
+        used_at = used_at or datetime.utcnow()
+        with self._lock:
+            entry = self._pending.get(api_key_id)
+            if entry is None:
+                self._pending[api_key_id] = [1, used_at]
+            else:
+                entry[0] += 1
+                if used_at > entry[1]:
+                    entry[1] = used_at
+            self._pending_requests += 1
+            should_flush = self._pending_requests >= self.flush_threshold
+        if should_flush:
+            self._wakeup.set()
+
+    def record_event(
+        self,
+        api_key_id: int,
+        endpoint: str,
+        model: Optional[str] = None,
+        processing_time: Optional[float] = None,
+        bytes_in: Optional[int] = None,
+        bytes_out: Optional[int] = None
+    ):
+        """Queue an append-only usage event (no-op unless events are enabled)"""
+        if not self.events_enabled:
+            return
+        with self._lock:
+            self._events.append({
+                "api_key_id": api_key_id,
+                "created_at": datetime.utcnow(),
+                "endpoint": endpoint,
+                "model": model,
+                "processing_time": processing_time,
+                "bytes_in": bytes_in,
+                "bytes_out": bytes_out
+            })
+
+    def flush(self) -> int:
+        """Write all pending increments and events; returns number of keys updated"""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                events, self._events = self._events, []
+                self._pending_requests = 0
+
+            if not pending and not events:
+                return 0
+
+            db = SessionLocal()
+            try:
+                if pending:
+                    table = APIKey.__table__
+                    # Only move last_used forward: another process may have
+                    # flushed a newer timestamp already
+                    stmt = (
+                        update(table)
+                        .where(table.c.id == bindparam("b_id"))
+                        .values(
+                            usage_count=table.c.usage_count + bindparam("b_increment"),
+                            last_used=case(
+                                (
+                                    or_(table.c.last_used.is_(None), table.c.last_used < bindparam("b_used_at")),
+                                    bindparam("b_used_at")
+                                ),
+                                else_=table.c.last_used
+                            )
+                        )
+                    )
+                    db.execute(stmt, [
+                        {"b_id": key_id, "b_increment": count, "b_used_at": used_at}
+                        for key_id, (count, used_at) in pending.items()
+                    ])
+                if events:
+                    db.execute(insert(UsageEvent.__table__), events)
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                logger.error(f"Failed to flush API key usage, will retry: {e}")
+                self._restore(pending, events)
+                return 0
+            finally:
+                db.close()
+
+            logger.debug(f"Flushed usage for {len(pending)} API keys and {len(events)} events")
+            return len(pending)
+
+    def _restore(self, pending: Dict[int, List[Any]], events: List[Dict[str, Any]]):
+        """Merge a failed batch back into the buffer so counts are not lost"""
+        with self._lock:
+            for key_id, (count, used_at) in pending.items():
+                entry = self._pending.get(key_id)
+                if entry is None:
+                    self._pending[key_id] = [count, used_at]
+                else:
+                    entry[0] += count
+                    entry[1] = max(entry[1], used_at)
+                self._pending_requests += count
+            self._events[:0] = events
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def start(self):
+        """Start the background flusher thread"""
+        if self._thread is not None:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="usage-flusher", daemon=True)
+        self._thread.start()
+        logger.info(
+            f"Usage recorder started (interval={self.flush_interval}s, "
+            f"threshold={self.flush_threshold}, events={self.events_enabled})"
+        )
+
+    def stop(self):
+        """Stop the flusher thread and write out everything still buffered"""
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval + 5)
+            self._thread = None
+        self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "pending_keys": len(self._pending),
+                "pending_requests": self._pending_requests,
+                "pending_events": len(self._events)
+            }
+
+
+usage_recorder = UsageRecorder()
+
+# Last-chance flush for interpreter exits that skip the ASGI shutdown event
+atexit.register(usage_recorder.flush)
@@ -0,0 +1,357 @@
+"""
+Asynchronous video background removal jobs
+
+Uploads are spooled to a per-job temp directory and processed by the
+library's video pipeline (utilities.transparentvideo, transparentgif,
+matte_key) in a child process per job. At most VIDEO_JOBS_MAX_CONCURRENT
+jobs run at once; each is pinned to its own set of VIDEO_JOB_CPUS cores and
+torch/OpenMP thread pools are sized to match, so a long video can't starve
+image requests or other jobs. Progress (frames written, frames/s) is shared
+back through a counter, and the output file is served from disk.
+"""
+
+import os
+import sys
+import time
+import uuid
+import queue
+import signal
+import shutil
+import logging
+import tempfile
+import threading
+import multiprocessing
+from typing import Any, Dict, List, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'backgroundremover-main'))
+
+logger = logging.getLogger(__name__)
+
+VIDEO_JOBS_MAX_CONCURRENT = int(os.getenv("VIDEO_JOBS_MAX_CONCURRENT", "1"))
+# Jobs waiting for a slot beyond this are rejected with 503
+VIDEO_JOBS_MAX_QUEUED = int(os.getenv("VIDEO_JOBS_MAX_QUEUED", "8"))
+# Cores per job; 0 splits the machine evenly between concurrent jobs
+VIDEO_JOB_CPUS = int(os.getenv("VIDEO_JOB_CPUS", "0"))
+VIDEO_JOB_WORKERS = int(os.getenv("VIDEO_JOB_WORKERS", "1"))
+VIDEO_JOB_BATCH_SIZE = int(os.getenv("VIDEO_JOB_BATCH_SIZE", "2"))
+VIDEO_MAX_UPLOAD_MB = float(os.getenv("VIDEO_MAX_UPLOAD_MB", "200"))
+# Longest video accepted, in frames (-1 for no limit); longer ones are truncated
+VIDEO_MAX_FRAMES = int(os.getenv("VIDEO_MAX_FRAMES", "-1"))
+# Finished jobs and their files are deleted after this long
+VIDEO_JOB_TTL_SECONDS = float(os.getenv("VIDEO_JOB_TTL_SECONDS", "3600"))
+VIDEO_JOB_DIR = os.getenv("VIDEO_JOB_DIR", os.path.join(tempfile.gettempdir(), "bg-video-jobs"))
+
+VIDEO_EXTENSIONS = (".mp4", ".mov", ".webm", ".ogg", ".gif")
+
+# output format -> (library function, output extension, media type)
+OUTPUT_FORMATS = {
+    "mov": ("transparentvideo", ".mov", "video/quicktime"),
+    "gif": ("transparentgif", ".gif", "image/gif"),
+    "matte": ("matte_key", ".mp4", "video/mp4"),
+}
+
+
+class VideoJobRejected(Exception):
+    """Raised when the job queue is full"""
+
+    def __init__(self, detail: str, retry_after: Optional[float] = None):
+        super().__init__(detail)
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+def _limit_cpus(cpus: List[int], threads: int):
+    """Pin this process (and the pipeline's children, which inherit it) to cpus"""
+    # Read by torch/OpenMP when the spawned children import them
+    for name in ("OMP_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ[name] = str(threads)
+    if hasattr(os, "sched_setaffinity"):
+        try:
+            os.sched_setaffinity(0, cpus)
+        except OSError as e:
+            logger.warning(f"Could not pin video job to CPUs {cpus}: {e}")
+
+
+def _run_job(function: str, input_path: str, output_path: str, model_name: str, frame_limit: int,
+             worker_nodes: int, batch_size: int, cpus: List[int], frames, total_frames, error_path: str):
+    """Child process entry point: run one library pipeline, reporting progress through shared counters"""
+    if hasattr(os, "setpgrp"):
+        # Own process group, so cancelling also stops the pipeline's workers and ffmpeg
+        os.setpgrp()
+    _limit_cpus(cpus, max(1, len(cpus) // worker_nodes))
+    try:
+        from backgroundremover import utilities
+
+        def progress(written, total):
+            frames.value = written
+            total_frames.value = total
+
+        getattr(utilities, function)(
+            output_path, input_path,
+            worker_nodes=worker_nodes,
+            gpu_batchsize=batch_size,
+            model_name=model_name,
+            frame_limit=frame_limit,
+            progress=progress
+        )
+        if not os.path.exists(output_path) or os.path.getsize(output_path) == 0:
+            raise RuntimeError("ffmpeg produced no output")
+    except BaseException as e:
+        with open(error_path, "w") as f:
+            f.write(f"{type(e).__name__}: {e}")
+        sys.exit(1)
+
+
+class VideoJob:
+    def __init__(self, api_key_id: int, output_format: str, model_name: str, frame_limit: int, job_dir: str,
+                 filename: str):
+        self.id = uuid.uuid4().hex
+        self.api_key_id = api_key_id
+        self.output_format = output_format
+        self.function, extension, self.media_type = OUTPUT_FORMATS[output_format]
+        self.model_name = model_name
+        self.frame_limit = frame_limit
+        self.filename = filename
+        self.dir = job_dir
+        self.input_path = os.path.join(job_dir, "input" + os.path.splitext(filename)[1].lower())
+        self.output_path = os.path.join(job_dir, "output" + extension)
+        self.result_filename = f"processed_{os.path.splitext(filename)[0]}{extension}"
+        self.state = "queued"
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.cpus: List[int] = []
+        self.process = None
+        self.frames = None
+        self.total_frames = None
+
+    @property
+    def finished(self) -> bool:
+        return self.state in ("done", "failed", "cancelled")
+
+    def progress(self) -> Dict[str, Any]:
+        frames = self.frames.value if self.frames is not None else 0
+        total = self.total_frames.value if self.total_frames is not None else 0
+        elapsed = None
+        if self.started_at is not None:
+            elapsed = (self.finished_at or time.time()) - self.started_at
+        return {
+            "frames_processed": frames,
+            "total_frames": total or None,
+            "percent": round(100.0 * frames / total, 1) if total else None,
+            "frames_per_second": round(frames / elapsed, 2) if elapsed and frames else 0.0,
+            "elapsed_seconds": round(elapsed, 2) if elapsed is not None else None
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "state": self.state,
+            "output_format": self.output_format,
+            "model": self.model_name,
+            "filename": self.filename,
+            "error": self.error,
+            "queued_seconds": round((self.started_at or time.time()) - self.created_at, 2),
+            "cpus": self.cpus,
+            "progress": self.progress()
+        }
+
+
+class VideoJobManager:
+    """
+    Bounded queue of video jobs run by VIDEO_JOBS_MAX_CONCURRENT runner
+    threads, each supervising one child process at a time on its own
+    CPU slice.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = VIDEO_JOBS_MAX_CONCURRENT,
+        max_queued: int = VIDEO_JOBS_MAX_QUEUED,
+        cpus_per_job: int = VIDEO_JOB_CPUS,
+        worker_nodes: int = VIDEO_JOB_WORKERS,
+        batch_size: int = VIDEO_JOB_BATCH_SIZE,
+        ttl_seconds: float = VIDEO_JOB_TTL_SECONDS,
+        job_dir: str = VIDEO_JOB_DIR
+    ):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queued = max_queued
+        self.worker_nodes = max(1, worker_nodes)
+        self.batch_size = max(1, batch_size)
+        self.ttl_seconds = ttl_seconds
+        self.job_dir = job_dir
+        available = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else \
+            list(range(os.cpu_count() or 1))
+        per_job = cpus_per_job or max(1, len(available) // self.max_concurrent)
+        # Runner i always uses slice i, so concurrent jobs never share cores (unless oversubscribed)
+        self.cpu_slices = [
+            [available[(i * per_job + j) % len(available)] for j in range(min(per_job, len(available)))]
+            for i in range(self.max_concurrent)
+        ]
+        self.jobs: Dict[str, VideoJob] = {}
+        self._queue: "queue.Queue[Optional[VideoJob]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._runners: List[threading.Thread] = []
+        self._context = multiprocessing.get_context("spawn")
+
+    def start(self):
+        if self._runners:
+            return
+        os.makedirs(self.job_dir, exist_ok=True)
+        for index in range(self.max_concurrent):
+            runner = threading.Thread(target=self._runner, args=(index,), name=f"video-job-{index}", daemon=True)
+            runner.start()
+            self._runners.append(runner)
+        logger.info(f"Video jobs: {self.max_concurrent} concurrent, CPU slices {self.cpu_slices}")
+
+    def stop(self, timeout: float = 5.0):
+        """Cancel queued and running jobs"""
+        with self._lock:
+            jobs = list(self.jobs.values())
+        for job in jobs:
+            if not job.finished:
+                self.cancel(job)
+        for _ in self._runners:
+            self._queue.put(None)
+        for runner in self._runners:
+            runner.join(timeout)
+        self._runners = []
+
+    def create(self, api_key_id: int, output_format: str, model_name: str, filename: str,
+               frame_limit: int = -1) -> VideoJob:
+        """Reserve a queue place and a temp directory; the caller writes the upload to job.input_path"""
+        self._expire()
+        with self._lock:
+            waiting = sum(1 for job in self.jobs.values() if job.state in ("uploading", "queued"))
+            if waiting >= self.max_queued:
+                raise VideoJobRejected("Video job queue is full, try again later", retry_after=30)
+            if VIDEO_MAX_FRAMES != -1:
+                frame_limit = VIDEO_MAX_FRAMES if frame_limit == -1 else min(frame_limit, VIDEO_MAX_FRAMES)
+            os.makedirs(self.job_dir, exist_ok=True)
+            job = VideoJob(api_key_id, output_format, model_name, frame_limit,
+                           tempfile.mkdtemp(prefix="job-", dir=self.job_dir), filename)
+            job.state = "uploading"
+            self.jobs[job.id] = job
+        return job
+
+    def submit(self, job: VideoJob):
+        with self._lock:
+            if job.state != "uploading":
+                return
+            job.state = "queued"
+            job.created_at = time.time()
+        self._queue.put(job)
+        logger.info(f"Video job {job.id} queued ({job.function}, {job.model_name})")
+
+    def discard(self, job: VideoJob):
+        """Drop a job whose upload failed"""
+        with self._lock:
+            self.jobs.pop(job.id, None)
+        shutil.rmtree(job.dir, ignore_errors=True)
+
+    def get(self, job_id: str) -> Optional[VideoJob]:
+        self._expire()
+        return self.jobs.get(job_id)
+
+    def cancel(self, job: VideoJob):
+        # Under the lock a job is either still queued (and _run will not start it)
+        # or already has its process, which is killed here
+        with self._lock:
+            if job.finished:
+                return
+            job.state = "cancelled"
+            job.finished_at = time.time()
+            process = job.process
+        if process is not None and process.is_alive():
+            if hasattr(os, "killpg"):
+                try:
+                    os.killpg(process.pid, signal.SIGKILL)
+                except OSError:
+                    pass
+            process.terminate()
+
+    def _runner(self, index: int):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            if job.state != "queued":
+                continue
+            try:
+                self._run(job, self.cpu_slices[index])
+            except Exception as e:
+                with self._lock:
+                    if job.finished:
+                        continue
+                    job.state, job.error, job.finished_at = "failed", str(e), time.time()
+                logger.error(f"Video job {job.id} failed: {e}")
+
+    def _run(self, job: VideoJob, cpus: List[int]):
+        job.cpus = cpus
+        job.frames = self._context.Value("q", 0, lock=False)
+        job.total_frames = self._context.Value("q", 0, lock=False)
+        error_path = os.path.join(job.dir, "error.txt")
+        process = self._context.Process(
+            target=_run_job,
+            args=(job.function, job.input_path, job.output_path, job.model_name, job.frame_limit,
+                  self.worker_nodes, self.batch_size, cpus, job.frames, job.total_frames, error_path),
+            name=f"video-job-{job.id[:8]}",
+            daemon=False
+        )
+        # A cancel either lands before this (and the child never starts) or sees job.process
+        with self._lock:
+            if job.state != "queued":
+                return
+            job.started_at = time.time()
+            job.state = "running"
+            job.process = process
+            process.start()
+        process.join()
+
+        error = None
+        if process.exitcode != 0:
+            try:
+                with open(error_path) as f:
+                    error = f.read()
+            except OSError:
+                error = f"video process exited with code {process.exitcode}"
+        with self._lock:
+            if job.state == "cancelled":
+                return
+            job.finished_at = time.time()
+            job.state, job.error = ("done", None) if process.exitcode == 0 else ("failed", error)
+        if job.state == "done":
+            progress = job.progress()
+            logger.info(f"Video job {job.id} done: {progress['frames_processed']} frames "
+                        f"in {progress['elapsed_seconds']}s ({progress['frames_per_second']} frames/s)")
+        else:
+            logger.error(f"Video job {job.id} failed: {job.error}")
+        # The upload is no longer needed once the job has run
+        if os.path.exists(job.input_path):
+            os.remove(job.input_path)
+
+    def _expire(self):
+        now = time.time()
+        with self._lock:
+            expired = [job for job in self.jobs.values()
+                       if job.finished and now - job.finished_at > self.ttl_seconds]
+            for job in expired:
+                del self.jobs[job.id]
+        for job in expired:
+            shutil.rmtree(job.dir, ignore_errors=True)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            states: Dict[str, int] = {}
+            for job in self.jobs.values():
+                states[job.state] = states.get(job.state, 0) + 1
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_queued": self.max_queued,
+            "cpu_slices": self.cpu_slices,
+            "jobs": states
+        }
+
+
+video_jobs = VideoJobManager()
@@ -0,0 +1,224 @@
+"""
+Model preload and warmup for a fast first request
+
+At startup a background thread builds the BackgroundRemover, loads the
+configured models, then runs throwaway passes so weight loading, oneDNN
+primitive creation and pymatting's numba JIT compilation happen before real
+traffic. /ready reports ready only once this has finished.
+
+A failed warmup (e.g. the model download timing out) is retried with
+exponential backoff, and a real request that succeeds in the meantime
+marks the service ready, so a transient failure never leaves /ready
+answering 503 until a restart.
+"""
+
+import os
+import time
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+logger = logging.getLogger(__name__)
+
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() == "true"
+# Models to preload; empty means the model the service resolves requests to
+WARMUP_MODELS = os.getenv("WARMUP_MODELS", "")
+# Synthetic image sizes pushed through the full pipeline
+WARMUP_RESOLUTIONS = os.getenv("WARMUP_RESOLUTIONS", "640x480,1920x1080")
+# Batch sizes for raw forward passes (primes oneDNN kernels for batched inference)
+WARMUP_BATCH_SIZES = os.getenv("WARMUP_BATCH_SIZES", "1")
+# Compile pymatting's numba kernels up front
+WARMUP_ALPHA_MATTING = os.getenv("WARMUP_ALPHA_MATTING", "true").lower() == "true"
+# Delay before retrying a failed warmup, doubled after each failure up to the max
+WARMUP_RETRY_SECONDS = float(os.getenv("WARMUP_RETRY_SECONDS", "5"))
+WARMUP_RETRY_MAX_SECONDS = float(os.getenv("WARMUP_RETRY_MAX_SECONDS", "300"))
+# Give up after this many attempts; 0 keeps retrying
+WARMUP_MAX_ATTEMPTS = int(os.getenv("WARMUP_MAX_ATTEMPTS", "0"))
+
+
+def _parse_sizes(spec: str) -> List[tuple]:
+    sizes = []
+    for item in spec.split(","):
+        if item.strip():
+            width, height = item.lower().strip().split("x")
+            sizes.append((int(width), int(height)))
+    return sizes
+
+
+def _synthetic_image(width: int, height: int) -> Image.Image:
+    """Gradient with a bright ellipse, so masks and trimaps have both classes"""
+    gradient = np.linspace(0, 255, width, dtype=np.uint8)
+    img = Image.fromarray(np.stack([np.tile(gradient, (height, 1))] * 3, axis=-1), "RGB")
+    ImageDraw.Draw(img).ellipse((width * 0.3, height * 0.2, width * 0.7, height * 0.8), fill=(230, 40, 40))
+    return img
+
+
+def _synthetic_mask(width: int, height: int) -> Image.Image:
+    mask = Image.new("L", (width, height), 0)
+    ImageDraw.Draw(mask).ellipse((width * 0.3, height * 0.2, width * 0.7, height * 0.8), fill=255)
+    return mask
+
+
+class Warmup:
+    """Runs preload + warmup in a daemon thread, retrying on failure, and tracks readiness"""
+
+    def __init__(
+        self,
+        models: str = WARMUP_MODELS,
+        resolutions: str = WARMUP_RESOLUTIONS,
+        batch_sizes: str = WARMUP_BATCH_SIZES,
+        alpha_matting: bool = WARMUP_ALPHA_MATTING,
+        retry_seconds: float = WARMUP_RETRY_SECONDS,
+        retry_max_seconds: float = WARMUP_RETRY_MAX_SECONDS,
+        max_attempts: int = WARMUP_MAX_ATTEMPTS
+    ):
+        self.models = [m.strip() for m in models.split(",") if m.strip()]
+        self.resolutions = _parse_sizes(resolutions)
+        self.batch_sizes = [int(b) for b in batch_sizes.split(",") if b.strip()]
+        self.alpha_matting = alpha_matting
+        self.retry_seconds = retry_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self.max_attempts = max_attempts
+        self.state = "pending"
+        self.error: Optional[str] = None
+        self.attempts = 0
+        self.next_retry_at: Optional[float] = None
+        self.steps: List[Dict[str, Any]] = []
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    def start(self, get_remover: Callable[[], Any]):
+        """Begin warming up in the background; returns immediately"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self.started_at = time.time()
+            self._thread = threading.Thread(target=self._run, args=(get_remover,), name="warmup", daemon=True)
+            self._thread.start()
+
+    def mark_ready(self):
+        """Skip warmup (WARMUP_ENABLED=false): ready immediately, models load lazily"""
+        self.state = "ready"
+        self.started_at = self.finished_at = time.time()
+
+    def mark_request_succeeded(self):
+        """A real request completed: the models work, so a failed warmup no longer blocks /ready"""
+        if self.state != "failed":
+            return
+        with self._lock:
+            if self.state == "failed":
+                self.state = "ready"
+                self.next_retry_at = None
+                self.finished_at = time.time()
+                logger.info("Request succeeded after a failed warmup - ready for traffic")
+
+    def stop(self):
+        """Stop retrying (shutdown)"""
+        self._stop.set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return self.ready
+
+    def _step(self, name: str, fn: Callable, *args, **kwargs):
+        started = time.perf_counter()
+        result = fn(*args, **kwargs)
+        seconds = time.perf_counter() - started
+        self.steps.append({"step": name, "seconds": round(seconds, 3)})
+        logger.info(f"Warmup {name}: {seconds:.2f}s")
+        return result
+
+    def _run(self, get_remover: Callable[[], Any]):
+        delay = self.retry_seconds
+        while True:
+            self.attempts += 1
+            if self._attempt(get_remover) or self.ready:
+                return
+            if self.max_attempts and self.attempts >= self.max_attempts:
+                logger.error(f"Warmup failed {self.attempts} times, giving up; a successful request marks ready")
+                return
+            logger.warning(f"Retrying warmup in {delay:.0f}s (attempt {self.attempts + 1})")
+            self.next_retry_at = time.time() + delay
+            if self._stop.wait(delay) or self.ready:
+                return
+            self.next_retry_at = None
+            delay = min(delay * 2, self.retry_max_seconds)
+
+    def _attempt(self, get_remover: Callable[[], Any]) -> bool:
+        """One preload + warmup pass; False (state "failed") if anything raised"""
+        self.steps = []
+        try:
+            self.state = "loading"
+            remover = self._step("init", get_remover)
+            models = self.models or [remover._resolve_model_name("general")]
+            for model_name in models:
+                self._step(f"load:{model_name}", remover.engine.load, model_name)
+
+            self.state = "warming"
+            for model_name in models:
+                for batch_size in self.batch_sizes:
+                    self._step(f"forward:{model_name}:batch={batch_size}", remover.engine.warmup, model_name, batch_size)
+                for width, height in self.resolutions:
+                    image = _synthetic_image(width, height)
+                    self._step(
+                        f"pipeline:{model_name}:{width}x{height}",
+                        self._pipeline_pass, remover, image, model_name
+                    )
+
+            if self.alpha_matting:
+                # A synthetic mask guarantees a valid trimap, so the JIT always compiles
+                from backgroundremover.bg import alpha_matting_cutout
+                self._step(
+                    "alpha_matting_jit", alpha_matting_cutout,
+                    _synthetic_image(320, 240), _synthetic_mask(320, 240), 240, 10, 10, 1000
+                )
+
+            self.finished_at = time.time()
+            self.error = None
+            self.state = "ready"
+            logger.info(f"Warmup finished in {self.finished_at - self.started_at:.2f}s - ready for traffic")
+            return True
+        except Exception as e:
+            self.finished_at = time.time()
+            self.error = str(e)
+            with self._lock:
+                # A request may have succeeded while this attempt was running
+                if self.state != "ready":
+                    self.state = "failed"
+            logger.error(f"Warmup failed: {e}")
+            return False
+
+    @staticmethod
+    def _pipeline_pass(remover, image: Image.Image, model_name: str):
+        from backgroundremover.bg import naive_cutout
+        mask = remover.engine.predict_mask(image, model_name)
+        naive_cutout(image, mask)
+
+    def stats(self) -> Dict[str, Any]:
+        elapsed = None
+        if self.started_at is not None:
+            elapsed = round((self.finished_at or time.time()) - self.started_at, 3)
+        return {
+            "state": self.state,
+            "ready": self.ready,
+            "elapsed_seconds": elapsed,
+            "error": self.error,
+            "attempts": self.attempts,
+            "next_retry_in_seconds": round(max(self.next_retry_at - time.time(), 0.0), 1)
+            if self.next_retry_at is not None and not self.ready else None,
+            "steps": list(self.steps)
+        }
+
+
+warmup = Warmup()